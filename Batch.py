@@ -0,0 +1,225 @@
+from Project import Project
+from Block import Script
+from Lists import SnapList
+from typing import Any, Iterator
+import multiprocessing
+import threading
+import argparse
+import signal
+import json
+import time
+import io
+import os
+
+'''
+Runs many projects at once, one per worker process. A Project is driven
+from a single Python thread, so a batch is the way to use more cores.
+'''
+
+class BudgetExceeded(BaseException):
+    '''
+    Raised inside a job when its wall-clock budget runs out. Like
+    KeyboardInterrupt, it is not caught by except Exception.
+    '''
+    pass
+
+class BatchJob:
+    '''
+    One project to run.
+        Source: a path to a project file, the bytes of one, a Script
+        or a list of Blocks. Projects start from their green flag
+        scripts; a bare script is run on its own, in the global scope
+        of an empty Project.
+        Name: how the job is reported, by default the path or its index.
+    '''
+
+    def __init__(self, source : Any, name : str = None):
+        self.source = source
+        self.name = name
+
+class JobResult:
+    '''
+    What a job did.
+        Status: 'done' if every thread finished, 'frames' if the step
+        budget ran out first, 'timeout' if the wall-clock budget did
+        and 'error' if the job raised, with the message in error.
+        Variables: the global variables once the job stopped. Values
+        other than numbers, strings, booleans and lists of them are
+        reported as their str.
+    '''
+
+    def __init__(self, index : int, name : str, status : str, frames : int,
+                 seconds : float, variables : {str : Any}, error : str = None):
+        self.index = index
+        self.name = name
+        self.status = status
+        self.frames = frames
+        self.seconds = seconds
+        self.variables = variables
+        self.error = error
+
+    def toJSON(self) -> {str : Any}:
+        return {
+            'index' : self.index,
+            'name' : self.name,
+            'status' : self.status,
+            'frames' : self.frames,
+            'seconds' : self.seconds,
+            'variables' : self.variables,
+            'error' : self.error
+        }
+
+def snapshot(value : Any):
+    '''
+    A copy of a variable's value that can be pickled back to the
+    parent process and written as JSON.
+    '''
+    if value == None or type(value) in (int, float, str, bool):
+        return value
+    if type(value) in (list, SnapList):
+        return [snapshot(item) for item in value]
+    return str(value)
+
+def loadJob(source : Any) -> Project:
+    if type(source) in (str, bytes) or isinstance(source, os.PathLike):
+        project = Project.load(io.BytesIO(source) if type(source) == bytes else os.fspath(source))
+        project.scheduler.greenFlag()
+        return project
+
+    project = Project()
+    blocks = source.blocks if type(source) == Script else list(source)
+    script = Script(blocks, project.globalVariables)
+    project.scripts.append(script)
+    project.scheduler.start(script)
+    return project
+
+def canInterrupt() -> bool:
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+def interrupt(signum, frame):
+    raise BudgetExceeded()
+
+def runJob(index : int, job : BatchJob, frames : int = None, seconds : float = None) -> JobResult:
+    '''
+    Loads and runs one job within its budgets. The clock is checked
+    between frames and, where the platform allows, a timer signal also
+    interrupts a frame that runs too long, such as a warped loop.
+    '''
+    name = job.name if job.name != None else (str(job.source) if type(job.source) == str else str(index))
+    start = time.perf_counter()
+    deadline = start + seconds if seconds != None else None
+    project = None
+    status, error = 'done', None
+    timed = seconds != None and canInterrupt()
+    if timed:
+        previousHandler = signal.signal(signal.SIGALRM, interrupt)
+    # The timer fires at most once, and wherever it does, the outer try turns it into a timeout.
+    try:
+        try:
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, seconds)
+            project = loadJob(job.source)
+            scheduler = project.scheduler
+            while scheduler.threads or scheduler.started:
+                if frames != None and scheduler.frames >= frames:
+                    status = 'frames'
+                    break
+                if deadline != None and time.perf_counter() >= deadline:
+                    raise BudgetExceeded()
+                scheduler.step()
+        finally:
+            if timed:
+                try:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                finally:
+                    signal.signal(signal.SIGALRM, previousHandler)
+    except BudgetExceeded:
+        status = 'timeout'
+    except Exception as exception:
+        status, error = 'error', f'{type(exception).__name__}: {exception}'
+
+    variables = {}
+    if project != None:
+        variables = {variable : snapshot(value) for variable, value in project.globalVariables.items()}
+    return JobResult(index, name, status, project.scheduler.frames if project != None else 0,
+                     time.perf_counter() - start, variables, error)
+
+def runIndexedJob(arguments : tuple) -> JobResult:
+    return runJob(*arguments)
+
+def initializeWorker():
+    '''
+    Runs once in every worker. The modules and primitive tables were
+    imported with this one, so all that is left is to warm the first
+    Project up and leave Ctrl-C to the parent.
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Project().scheduler.run()
+
+class BatchRunner:
+    '''
+    Runs jobs in a pool of worker processes that live as long as the
+    runner, so each worker pays for its imports once.
+        Workers: the number of processes, by default one per core.
+        0 runs every job in this process instead.
+        Frames: the step budget of each job, in scheduler frames.
+        Seconds: the wall-clock budget of each job, loading included.
+        Chunk size: how many jobs are sent to a worker at a time.
+
+    run streams results back in the order the jobs were given, as soon
+    as each one and all those before it are done.
+    '''
+
+    def __init__(self, workers : int = None, frames : int = None, seconds : float = None, chunkSize : int = 1):
+        self.workers = workers if workers != None else os.cpu_count()
+        self.frames = frames
+        self.seconds = seconds
+        self.chunkSize = chunkSize
+        self.pool = None
+        if self.workers > 0:
+            self.pool = multiprocessing.Pool(self.workers, initializer=initializeWorker)
+
+    def run(self, jobs) -> Iterator[JobResult]:
+        '''
+        Runs an iterable of BatchJobs, or of sources to wrap in them.
+        Jobs are read lazily, so the iterable may be a generator.
+        '''
+        arguments = ((index, job if type(job) == BatchJob else BatchJob(job), self.frames, self.seconds)
+                     for index, job in enumerate(jobs))
+        if self.pool == None:
+            return map(runIndexedJob, arguments)
+        return self.pool.imap(runIndexedJob, arguments, self.chunkSize)
+
+    def close(self):
+        if self.pool != None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        if self.pool != None and exception[0] != None:
+            self.pool.terminate()
+        self.close()
+
+def main(arguments : [str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Runs Snap projects from their green flag, one per worker process, '
+                                                 'and prints a JSON line per project in the order given.')
+    parser.add_argument('projects', nargs='+', help='project files to run')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes, by default one per core')
+    parser.add_argument('--frames', type=int, default=None, help='step budget of each project, in frames')
+    parser.add_argument('--seconds', type=float, default=None, help='wall-clock budget of each project')
+    parser.add_argument('--chunk-size', type=int, default=1, help='projects sent to a worker at a time')
+    options = parser.parse_args(arguments)
+
+    failed = 0
+    with BatchRunner(options.workers, options.frames, options.seconds, options.chunk_size) as runner:
+        for result in runner.run(options.projects):
+            print(json.dumps(result.toJSON()), flush=True)
+            failed += result.status == 'error'
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
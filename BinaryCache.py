@@ -0,0 +1,436 @@
+from Block import *
+from Lists import SnapList
+from Text import Text
+from Visuals import Stage, Sprite, Costume
+from Media import MediaHandle, MediaSource
+from typing import Any
+from array import array
+import hashlib
+import struct
+import mmap
+import sys
+import os
+
+'''
+A compact binary form of Block trees and loaded projects, and a disk
+cache of projects keyed by a hash of their XML, so that loading a
+project again skips the XML entirely.
+
+The format is a flat program for a stack machine. Every value is a
+32-bit code word whose low 4 bits are its tag and whose high 28 bits
+are its operand: an index into the string, int or float table, or a
+small int. Blocks, lists, scripts, dicts, tuples and records follow
+their children and carry their child count in the next word, so a
+decoder pops them off its stack without recursion. Strings are kept
+once each in a string table, so signatures and variable names cost a
+word per use, and a Block equal to one written before is written as
+a reference to it, so the decoded tree shares it the way a NodeTable
+would. Blocks holding lists or scripts, which can be changed, are
+never shared.
+
+    header      magic, version, byte order, table sizes
+    floats      float64 per float literal
+    ints        int64 per int too big for an operand
+    offsets     uint32 per string, the character where it ends
+    codes       uint32 per code word
+    strings     every string, joined and encoded as UTF-8
+
+The tables are in native byte order and aligned, so a memory mapped
+file is read in place through memoryview casts.
+'''
+
+MAGIC = b'SNPB'
+VERSION = 1
+HEADER = struct.Struct('=4sIIIIII4x')
+
+(CONSTANT, SMALL_INT, INT, BIG_INT, FLOAT, STRING, OPTION, VARIABLE,
+ BLOCK, SHARED, LIST, SCRIPT, DICT, TUPLE, RECORD) = range(15)
+
+# The operands of CONSTANT.
+CONSTANTS = (None, False, True)
+
+SMALL_INT_LIMIT = 1 << 26
+INT64_LIMIT = 1 << 63
+
+class BinaryEncoder:
+    '''
+    Encodes values into the binary format. Project objects are written
+    as records: a kind and a tuple of fields.
+    '''
+
+    def __init__(self):
+        self.strings = {}
+        self.ints = array('q')
+        self.floats = array('d')
+        self.codes = array('I')
+        # Shareable Blocks mapped to their place among all the Blocks written.
+        self.blocks = {}
+        # The Blocks written or referred to that are shareable, by id, so telling
+        # whether a parent is shareable never hashes its children again.
+        self.shareable = {}
+        self.blockCount = 0
+
+    def string(self, text : str) -> int:
+        index = self.strings.get(text)
+        if index == None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def encode(self, value : Any) -> bytes:
+        self.encodeValue(value)
+        return self.getvalue()
+
+    def encodeValue(self, value : Any):
+        '''
+        Writes value's code words, children before their parents,
+        from an explicit stack so any depth of nesting works. Each
+        Block is looked up in blocks once, when it is first reached.
+        '''
+        codes = self.codes
+        emit = codes.append
+        string = self.string
+        # Containers whose children are already written come back as (value, True).
+        stack = [(value, False)]
+        while stack:
+            value, childrenWritten = stack.pop()
+            valueType = type(value)
+            if value == None:
+                emit(CONSTANT)
+            elif valueType == bool:
+                emit(CONSTANT | (2 if value else 1) << 4)
+            elif valueType == int:
+                if -SMALL_INT_LIMIT <= value < SMALL_INT_LIMIT:
+                    emit(SMALL_INT | (value + SMALL_INT_LIMIT) << 4)
+                elif -INT64_LIMIT <= value < INT64_LIMIT:
+                    emit(INT | len(self.ints) << 4)
+                    self.ints.append(value)
+                else:
+                    emit(BIG_INT | string(str(value)) << 4)
+            elif valueType == float:
+                emit(FLOAT | len(self.floats) << 4)
+                self.floats.append(value)
+            elif valueType == str:
+                emit(STRING | string(value) << 4)
+            elif valueType == Text:
+                emit(STRING | string(str(value)) << 4)
+            elif valueType == Option:
+                emit(OPTION | string(value.text) << 4)
+            elif valueType == Variable:
+                emit(VARIABLE | string(value.name) << 4)
+            elif valueType == Block and not childrenWritten and value in self.blocks:
+                emit(SHARED | self.blocks[value] << 4)
+                self.shareable[id(value)] = value
+            else:
+                tag, operand, children = self.container(value)
+                if childrenWritten:
+                    emit(tag | operand << 4)
+                    emit(len(children))
+                    if tag == BLOCK:
+                        if all(type(child) not in (list, SnapList, Script) and (type(child) != Block or id(child) in self.shareable)
+                               for child in children):
+                            self.blocks[value] = self.blockCount
+                            self.shareable[id(value)] = value
+                        self.blockCount += 1
+                else:
+                    stack.append((value, True))
+                    stack.extend((child, False) for child in reversed(children))
+
+    def container(self, value : Any) -> (int, int, []):
+        '''
+        The tag, operand and children of a value made of other values.
+        '''
+        valueType = type(value)
+        if valueType == Block:
+            return BLOCK, self.string(value.signature), value.inputs
+        elif valueType == list:
+            return LIST, 0, value
+        elif valueType == SnapList:
+            # Decoded as a plain list, which the list blocks take as well.
+            return LIST, 0, list(value)
+        elif valueType == Script:
+            return SCRIPT, 0, value.blocks
+        elif valueType == dict:
+            return DICT, 0, [item for pair in value.items() for item in pair]
+        elif valueType == tuple:
+            return TUPLE, 0, value
+        kind, fields = recordFields(value)
+        return RECORD, self.string(kind), fields
+
+    def getvalue(self) -> bytes:
+        offsets = array('I')
+        end = 0
+        for text in self.strings:
+            end += len(text)
+            offsets.append(end)
+        header = HEADER.pack(MAGIC, VERSION, len(self.strings), len(self.ints), len(self.floats),
+                             len(self.codes), sys.byteorder == 'little')
+        return b''.join([header, self.floats.tobytes(), self.ints.tobytes(), offsets.tobytes(),
+                         self.codes.tobytes(), ''.join(self.strings).encode('utf-8', 'surrogatepass')])
+
+def recordFields(value : Any) -> (str, tuple):
+    '''
+    The kind and fields a project object is written as.
+    '''
+    valueType = type(value)
+    if valueType == Sprite:
+        return 'sprite', (value.name, value.index, value.coords[0], value.coords[1], value.heading,
+                          value.scale, value.volume, value.pan, value.rotation, value.draggable,
+                          value.hidden, value.costumes, value.color, value.pen, value.id,
+                          value.variables, value.scripts)
+    elif valueType == Stage:
+        return 'stage', (value.costumes, value.variables, value.scripts, value.pentrails, value.sprites)
+    elif valueType == Costume:
+        return 'costume', (value.name, value.center[0], value.center[1], value.image)
+    elif valueType == MediaHandle:
+        if type(value.source) == mmap.mmap:
+            # A handle on the project file itself, which is mapped again on load.
+            return 'media', (value.start, value.end)
+        return 'media-copy', (bytes(value.span()).decode('utf-8'),)
+    raise TypeError(f'{valueType.__name__} values cannot be written to the binary format.')
+
+class BinaryDecoder:
+    '''
+    Decodes values from a buffer in the binary format, usually a
+    memory map of a cache file.
+        Source: the buffer media handles point into, the project file.
+    '''
+
+    def __init__(self, buffer, source = None):
+        self.source = source
+        # The tables are read in place through casts of the buffer, released by decode so a map can be closed.
+        self.views = [memoryview(buffer)]
+        try:
+            view = self.views[0]
+            magic, version, stringCount, intCount, floatCount, codeCount, little = HEADER.unpack_from(view)
+            if magic != MAGIC or version != VERSION or little != (sys.byteorder == 'little'):
+                raise ValueError('Not a binary block file of this version and byte order.')
+            offset = HEADER.size
+            self.floats = self.table(offset, 8 * floatCount, 'd')
+            offset += 8 * floatCount
+            self.ints = self.table(offset, 8 * intCount, 'q')
+            offset += 8 * intCount
+            ends = self.table(offset, 4 * stringCount, 'I')
+            offset += 4 * stringCount
+            self.codes = self.table(offset, 4 * codeCount, 'I')
+            offset += 4 * codeCount
+            text = str(view[offset:], 'utf-8', 'surrogatepass')
+        except BaseException:
+            self.release()
+            raise
+        self.strings = []
+        start = 0
+        for end in ends:
+            self.strings.append(text[start:end])
+            start = end
+
+    def table(self, offset : int, size : int, format : str) -> memoryview:
+        part = self.views[0][offset:offset + size]
+        self.views.append(part)
+        if len(part) != size:
+            raise ValueError('The binary block file is cut short.')
+        table = part.cast(format)
+        self.views.append(table)
+        return table
+
+    def release(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+
+    def decode(self) -> Any:
+        '''
+        Runs the code words. Options and Variables are immutable, so
+        each distinct one is built once and shared.
+        '''
+        try:
+            return self.run()
+        finally:
+            self.release()
+
+    def run(self) -> Any:
+        strings, floats, ints, codes = self.strings, self.floats, self.ints, self.codes
+        leaves = {}
+        blocks = []
+        keep = blocks.append
+        stack = []
+        push = stack.append
+        index, length = 0, len(codes)
+        while index < length:
+            word = codes[index]
+            index += 1
+            tag = word & 15
+            operand = word >> 4
+            if tag == BLOCK:
+                count = codes[index]
+                index += 1
+                if count:
+                    block = Block(strings[operand], stack[-count:])
+                    del stack[-count:]
+                else:
+                    block = Block(strings[operand], ())
+                keep(block)
+                push(block)
+            elif tag == STRING:
+                push(strings[operand])
+            elif tag == SHARED:
+                push(blocks[operand])
+            elif tag == SMALL_INT:
+                push(operand - SMALL_INT_LIMIT)
+            elif tag == VARIABLE or tag == OPTION:
+                leaf = leaves.get(word)
+                if leaf is None:
+                    leaf = leaves[word] = Variable(strings[operand]) if tag == VARIABLE else Option(strings[operand])
+                push(leaf)
+            elif tag == FLOAT:
+                push(floats[operand])
+            elif tag == CONSTANT:
+                push(CONSTANTS[operand])
+            elif tag == INT:
+                push(ints[operand])
+            elif tag == BIG_INT:
+                push(int(strings[operand]))
+            else:
+                count = codes[index]
+                index += 1
+                children = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                if tag == LIST:
+                    push(children)
+                elif tag == SCRIPT:
+                    push(Script(children, {}))
+                elif tag == DICT:
+                    push(dict(zip(children[::2], children[1::2])))
+                elif tag == TUPLE:
+                    push(tuple(children))
+                else:
+                    push(self.record(strings[operand], children))
+        return stack[0]
+
+    def record(self, kind : str, fields : []) -> Any:
+        if kind == 'sprite':
+            return self.sprite(fields)
+        elif kind == 'stage':
+            return self.stage(fields)
+        elif kind == 'costume':
+            return Costume(*fields)
+        elif kind == 'media':
+            return MediaHandle(self.source, *fields)
+        elif kind == 'media-copy':
+            return MediaSource.copyOf(fields[0])
+        raise ValueError(f'Unknown record kind {kind}.')
+
+    def sprite(self, fields : []) -> Sprite:
+        *attributes, variables, scripts = fields
+        sprite = Sprite(*attributes)
+        sprite.variables = variables
+        sprite.scripts = [Script(script.blocks, variables, sprite) for script in scripts]
+        return sprite
+
+    def stage(self, fields : []) -> Stage:
+        costumes, variables, scripts, pentrails, sprites = fields
+        stage = Stage(costumes, [], variables, [], [], sprites)
+        stage.scripts = [Script(script.blocks, variables, stage) for script in scripts]
+        stage.pentrails = pentrails
+        return stage
+
+def encodeValue(value : Any) -> bytes:
+    '''
+    Encodes a Block tree, or any value a Block input can hold.
+    '''
+    return BinaryEncoder().encode(value)
+
+def decodeValue(buffer) -> Any:
+    return BinaryDecoder(buffer).decode()
+
+def encodeProject(project) -> bytes:
+    '''
+    Encodes the state Project.load gives a project: its settings,
+    global variables, stage, sprites, costumes and scripts. Costumes
+    that are handles on the project file are kept as offsets into it.
+    '''
+    owners = [project.stage] + project.stage.sprites if project.stage != None else []
+    # Scripts are written with their owners, and project.scripts as (owner, script) indices.
+    positions = {}
+    for ownerIndex, owner in enumerate(owners):
+        for scriptIndex, script in enumerate(owner.scripts):
+            positions[id(script)] = (ownerIndex, scriptIndex)
+    if any(id(script) not in positions for script in project.scripts):
+        raise ValueError('Only scripts that belong to the stage or a sprite can be encoded.')
+    order = [positions[id(script)] for script in project.scripts]
+    return encodeValue((project.name, project.notes, project.stageWidth, project.stageHeight,
+                        project.thumbnail, project.globalVariables, project.stage, order))
+
+def decodeProject(buffer, source = None, project = None):
+    '''
+    Fills a Project, by default a new one, from encodeProject's bytes.
+    Source is the buffer of the project file that media handles point
+    into.
+    '''
+    from Project import Project
+    project = project if project != None else Project()
+    name, notes, width, height, thumbnail, globalVariables, stage, order = BinaryDecoder(buffer, source).decode()
+    project.name, project.notes = name, notes
+    project.stageWidth, project.stageHeight = width, height
+    project.thumbnail = thumbnail
+    project.globalVariables.update(globalVariables)
+    project.stage = stage
+    if stage != None:
+        project.sprites = {sprite.name : sprite for sprite in stage.sprites}
+        owners = [stage] + stage.sprites
+        project.scripts = [owners[ownerIndex].scripts[scriptIndex] for ownerIndex, scriptIndex in order]
+    return project
+
+class ProjectCache:
+    '''
+    A directory of encoded projects, named by the BLAKE2 hash of the
+    project file's bytes and the format version. load decodes a cached
+    project if there is one, and otherwise loads the XML and stores it.
+    '''
+
+    def __init__(self, directory : str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def pathOf(self, source) -> str:
+        digest = hashlib.blake2b(source, digest_size=20).hexdigest()
+        return os.path.join(self.directory, f'{digest}-v{VERSION}.snpb')
+
+    def load(self, path : str, table : NodeTable = None):
+        '''
+        Loads the project file at path, like Project.load.
+        '''
+        from Project import Project
+        source = MediaSource.openBuffer(path)
+        cachePath = self.pathOf(source)
+        try:
+            with open(cachePath, 'rb') as cacheFile:
+                with mmap.mmap(cacheFile.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    project = decodeProject(buffer, source)
+            self.hits += 1
+        except Exception:
+            # Missing, damaged or written by another version; either way it is replaced.
+            project = Project.load(path)
+            self.store(cachePath, encodeProject(project))
+            self.misses += 1
+        if table != None:
+            self.intern(project, table)
+        return project
+
+    @staticmethod
+    def intern(project, table : NodeTable):
+        # Each owner's scripts by the id of the script they replace, to put project.scripts in order.
+        interned = {}
+        for owner in [project.stage] + list(project.sprites.values()):
+            scripts = owner.scripts
+            owner.scripts = [table.intern(script) for script in scripts]
+            interned.update((id(old), new) for old, new in zip(scripts, owner.scripts))
+        project.scripts = [interned[id(script)] for script in project.scripts]
+
+    def store(self, cachePath : str, data : bytes):
+        # Written to a temporary file first, so a reader never sees half a cache entry.
+        temporaryPath = f'{cachePath}.{os.getpid()}.tmp'
+        with open(temporaryPath, 'wb') as cacheFile:
+            cacheFile.write(data)
+        os.replace(temporaryPath, cachePath)
@@ -1,5 +1,101 @@
 import xml.etree.ElementTree as ET
+import xml.parsers.expat as expat
 from typing import Any
+import operator
+import sys
+import re
+
+# How deep evaluate and compile recurse before switching to an explicit stack.
+RECURSION_DEPTH = 200
+# Marks a value on an explicit stack whose parts have been pushed but not yet handled.
+PENDING = object()
+
+class BlockInputs(list):
+    '''
+    The inputs of a Block. A list that can't be changed once the Block
+    is built, so that Blocks can be hashed and safely shared.
+    '''
+
+    __slots__ = ()
+
+    def immutable(self, *args, **kwargs):
+        raise TypeError('Block inputs cannot be changed, build a new Block instead.')
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = immutable
+    append = extend = insert = pop = remove = clear = sort = reverse = immutable
+
+    def __reduce__(self):
+        return BlockInputs, (list(self),)
+
+def valuesEqual(x : Any, y : Any) -> bool:
+    '''
+    Structural equality of block inputs. Unlike ==, it tells
+    1, 1.0 and True apart, since they are different in XML.
+    Pairs still to compare wait on an explicit stack, so any
+    depth of nesting works.
+    '''
+    stack = [(x, y)]
+    while stack:
+        x, y = stack.pop()
+        if x is y:
+            continue
+        if type(x) != type(y):
+            return False
+        if type(x) == list or type(x) == BlockInputs:
+            if len(x) != len(y):
+                return False
+            stack.extend(zip(x, y))
+        elif type(x) == Block:
+            if x.signature != y.signature:
+                return False
+            stack.append((x.inputs, y.inputs))
+        elif x != y:
+            return False
+    return True
+
+def valueHash(value : Any) -> int:
+    '''
+    A hash that agrees with valuesEqual for everything but list
+    literals. Lists and Blocks are hashed bottom up from an explicit
+    stack, so any depth of nesting works, and every Block met on the
+    way keeps its hash. A list literal can be changed in place, so
+    like a Script it is hashed by identity, which a kept hash can't
+    go stale on. Equal Blocks holding different lists are still
+    equal, they just don't find each other in a dict.
+    '''
+    hashes = []
+    # Values whose parts are already hashed come back as (value, True).
+    stack = [(value, False)]
+    while stack:
+        value, partsHashed = stack.pop()
+        valueType = type(value)
+        if valueType == Block:
+            try:
+                hashes.append(hash((Block, value._hash)))
+            except AttributeError:
+                if partsHashed:
+                    blockHash = hash((value.signature, hashes.pop()))
+                    object.__setattr__(value, '_hash', blockHash)
+                    hashes.append(hash((Block, blockHash)))
+                else:
+                    stack.append((value, True))
+                    stack.append((value.inputs, False))
+        elif valueType == BlockInputs:
+            if partsHashed:
+                start = len(hashes) - len(value)
+                itemHashes = tuple(hashes[start:])
+                del hashes[start:]
+                hashes.append(hash(itemHashes))
+            else:
+                stack.append((value, True))
+                stack.extend((item, False) for item in reversed(value))
+        else:
+            try:
+                hashes.append(hash((valueType, value)))
+            except TypeError:
+                # Lists, Scripts and other mutable values are hashed by identity.
+                hashes.append(id(value))
+    return hashes[0]
 
 class Block:
 
@@ -14,13 +110,41 @@ class Block:
         Input Count: The amount of input slots that exist for the block.
         Used for throwing errors in the event of having too many inputs
         which could be a problem in Python but is not present in Snap! .
-    
+
+    Blocks are immutable values: two Blocks with the same signature
+    and inputs are equal and hash alike, and a NodeTable can make
+    them share a single object.
     '''
 
+    __slots__ = ('signature', 'inputs', '_hash')
+
     def __init__(self, signature : str, inputs : []):
 
-        self.signature = signature
-        self.inputs = inputs
+        object.__setattr__(self, 'signature', signature)
+        object.__setattr__(self, 'inputs', BlockInputs(inputs))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'Blocks are immutable, build a new Block instead of setting {name}.')
+
+    __delattr__ = __setattr__
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) != type(self):
+            return NotImplemented
+        return valuesEqual(self, other)
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            # Hashing a tree stores the hash of every Block in it.
+            valueHash(self)
+            return self._hash
+
+    def __reduce__(self):
+        return Block, (self.signature, list(self.inputs))
 
     def toXML(self):
         return blockToXML(self)
@@ -33,8 +157,21 @@ class Variable(Block):
         contain a var attribute and no 's' or signature attribute.
     '''
 
+    __slots__ = ('name',)
+
     def __init__(self, name : str):
-        self.name = name
+        object.__setattr__(self, 'name', name)
+
+    def __eq__(self, other):
+        if type(other) != Variable:
+            return NotImplemented
+        return self.name == other.name
+
+    def __hash__(self):
+        return hash((Variable, self.name))
+
+    def __reduce__(self):
+        return Variable, (self.name,)
 
 class Option:
     '''
@@ -45,9 +182,95 @@ class Option:
     like "set <variablename> to ___" for example.
     '''
 
+    __slots__ = ('text', 'tag')
+
     def __init__(self, text):
-        self.text = text
-        self.tag = None
+        object.__setattr__(self, 'text', text)
+        object.__setattr__(self, 'tag', None)
+
+    __setattr__ = __delattr__ = Block.__setattr__
+
+    def __eq__(self, other):
+        if type(other) != Option:
+            return NotImplemented
+        return self.text == other.text
+
+    def __hash__(self):
+        return hash((Option, self.text))
+
+    def __reduce__(self):
+        return Option, (self.text,)
+
+class NodeTable:
+    '''
+    An intern table for Block trees. Interning a tree returns an equal
+    tree in which every Block, Variable, Option, number and string that
+    has been seen before is replaced by the object already in the table,
+    so identical subtrees share memory and compare by identity.
+    Lists and Scripts are mutable, so they are rebuilt rather than
+    shared, and so are the Blocks holding lists.
+    '''
+
+    def __init__(self):
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def intern(self, value : Any) -> Any:
+        '''
+        Interns a tree bottom up from an explicit stack, so any depth
+        of nesting works. Each Block, list or Script whose parts are
+        still being interned is a frame: (value, parts, interned parts).
+        '''
+        frames = []
+        while True:
+            # Intern value, or push a frame to intern its parts first.
+            valueType = type(value)
+            if valueType == Block:
+                frames.append((value, value.inputs, []))
+                result = PENDING
+            elif valueType == list:
+                frames.append((value, value, []))
+                result = PENDING
+            elif valueType == Script:
+                frames.append((value, value.blocks, []))
+                result = PENDING
+            elif valueType in (Variable, Option):
+                result = self.nodes.setdefault(value, value)
+            elif valueType == str:
+                result = sys.intern(value)
+            elif valueType in (int, float):
+                # Keyed by type as well, since 1 == 1.0 == True.
+                result = self.nodes.setdefault((valueType, value), value)
+            else:
+                result = value
+
+            # Hand the result up, rebuilding every value whose parts are now all interned.
+            while frames:
+                frameValue, parts, results = frames[-1]
+                if result is not PENDING:
+                    results.append(result)
+                if len(results) < len(parts):
+                    value = parts[len(results)]
+                    break
+                frames.pop()
+                result = self.rebuild(frameValue, results)
+            else:
+                return result
+
+    def rebuild(self, value : Any, parts : []) -> Any:
+        valueType = type(value)
+        if valueType == list:
+            return parts
+        elif valueType == Script:
+            return Script(parts, value.scope, value.sprite)
+        if any(new is not old for new, old in zip(parts, value.inputs)):
+            value = Block(value.signature, parts)
+        # Blocks holding lists, here or further down, are never shared.
+        if any(type(inp) == list or (type(inp) == Block and self.nodes.get(inp) is not inp) for inp in parts):
+            return value
+        return self.nodes.setdefault(value, value)
 
 '''
 Block -> XML Methods.
@@ -59,52 +282,363 @@ def blockToXML(block : Block) -> str:
     '''
     Converts a Block Object into an XML String.
     '''
-    # Create a new block xml element
-    blockXML = ET.Element('block')
+    writer = XMLWriter()
+    writer.writeValue(block)
+    text = ''.join(writer.parts)
+    if text.isascii():
+        return text
+    # Like ElementTree, anything outside ASCII is written as a character reference.
+    return text.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+
+def writeXML(value : Any, stream, encoding : str = 'us-ascii'):
+    '''
+    Writes a Block, Script or input value as XML to a binary stream,
+    a chunk at a time, without building it in memory first.
+    '''
+    writer = XMLWriter(stream.write, encoding)
+    writer.writeValue(value)
+    writer.flush()
 
-    # Set the signature
-    if type(block) == Variable:
-        blockXML.attrib['var'] = block.name
-    else:
-        blockXML.attrib['s'] = block.signature
+def iterXML(value : Any, encoding : str = 'us-ascii'):
+    '''
+    Yields a Block, Script or input value as chunks of XML bytes.
+    A Script is handed on block by block, so only the block being
+    written is ever held in memory.
+    '''
+    chunks = []
+    writer = XMLWriter(chunks.append, encoding)
+    for step in writer.steps(value):
+        yield from chunks
+        chunks.clear()
+    writer.flush()
+    yield from chunks
+
+ATTRIBUTE_ESCAPES = {'"' : '&quot;', '\r' : '&#13;', '\n' : '&#10;', '\t' : '&#09;'}
+
+def escapeText(text : str) -> str:
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+def escapeAttribute(text : str) -> str:
+    text = escapeText(text)
+    for character, escaped in ATTRIBUTE_ESCAPES.items():
+        if character in text:
+            text = text.replace(character, escaped)
+    return text
+
+CLOSE_BLOCK = ('</block>',)
+CLOSE_SCRIPT = ('</script>',)
+CLOSE_LIST = ('</list></block>',)
+
+class XMLWriter:
+    '''
+    Writes Blocks, Scripts and input values as Snap XML text without
+    building ElementTree elements. The output is byte for byte what
+    blockToElement and ET.tostring give.
+        Write: called with each chunk of encoded bytes. Without one,
+        the text is only gathered in parts.
+
+    Parts are joined, encoded and written out once chunkParts of them
+    have gathered, so memory use does not grow with the output.
+    '''
 
-        # Add the arguments
-        for i in range(len(block.inputs)):
-            blockInput = block.inputs[i]
-            blockXML.append(formatBlockInput(blockInput))
+    def __init__(self, write = None, encoding : str = 'us-ascii', chunkParts : int = 8192):
+        self.write = write
+        self.encoding = encoding
+        self.chunkParts = chunkParts
+        self.parts = []
+
+    def flush(self):
+        if self.parts and self.write != None:
+            self.write(''.join(self.parts).encode(self.encoding, 'xmlcharrefreplace'))
+            self.parts.clear()
+
+    def steps(self, value : Any):
+        '''
+        Writes value, pausing after each block of a Script so the
+        caller can take what has been written so far.
+        '''
+        if type(value) == Script and value.blocks:
+            self.parts.append('<script>')
+            for block in value.blocks:
+                self.writeValue(block)
+                yield
+            self.parts.append('</script>')
+        else:
+            self.writeValue(value)
+        yield
+
+    def writeValue(self, value : Any):
+        '''
+        Writes value from an explicit stack of what is left to write,
+        so any depth of nesting works. Closing tags wait on the stack
+        as 1-tuples, which no input value can be.
+        '''
+        parts = self.parts
+        # Without a write there is nothing to flush to.
+        chunkParts = self.chunkParts if self.write != None else sys.maxsize
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            valueType = type(value)
+            if valueType == Block:
+                signature = escapeAttribute(value.signature)
+                if value.inputs:
+                    parts.append(f'<block s="{signature}">')
+                    stack.append(CLOSE_BLOCK)
+                    stack += value.inputs[::-1]
+                else:
+                    parts.append(f'<block s="{signature}" />')
+            elif valueType == tuple:
+                parts.append(value[0])
+            elif valueType == Variable:
+                parts.append(f'<block var="{escapeAttribute(value.name)}" />')
+            elif valueType == Option:
+                if value.text:
+                    parts.append(f'<l><option>{escapeText(value.text)}</option></l>')
+                else:
+                    parts.append('<l><option /></l>')
+            elif valueType == bool:
+                parts.append('<l><bool>true</bool></l>' if value else '<l><bool>false</bool></l>')
+            elif valueType == Script:
+                if value.blocks:
+                    parts.append('<script>')
+                    stack.append(CLOSE_SCRIPT)
+                    stack.extend(reversed(value.blocks))
+                else:
+                    parts.append('<script />')
+            elif valueType == list or valueType == BlockInputs:
+                if value:
+                    parts.append('<block s="reportNewList"><list>')
+                    stack.append(CLOSE_LIST)
+                    stack.extend(reversed(value))
+                else:
+                    parts.append('<block s="reportNewList"><list /></block>')
+            elif value == None or value == '':
+                parts.append('<l />')
+            else:
+                parts.append(f'<l>{escapeText(str(value))}</l>')
+
+            if len(parts) >= chunkParts:
+                self.flush()
+
+# The inputs that can never change, so a Block made only of them always writes the same XML.
+STATIC_TYPES = (str, int, float, bool, type(None), Option, Variable)
+
+def isStatic(block : Block) -> bool:
+    '''
+    Whether nothing in block can change: it holds no lists, Scripts
+    or other mutable values at any depth.
+    '''
+    stack = [block]
+    while stack:
+        for inp in stack.pop().inputs:
+            if type(inp) == Block:
+                stack.append(inp)
+            elif type(inp) not in STATIC_TYPES:
+                return False
+    return True
+
+class FragmentCache:
+    '''
+    Writes Blocks, Scripts and input values as blockToXML does, and
+    keeps the XML of what it writes to reuse the next time.
+        Entries: for each node, keyed by id, the node itself, so its
+        id is never reused, then (snapshot, static, text).
+
+    Blocks are immutable, so a Block without lists or Scripts inside
+    is written once and its text reused for as long as it lives. What
+    can change are the lists and Scripts that hold blocks: each of
+    them keeps the items it was written with, and its text is reused
+    when it still holds the very same items and all of them are
+    static. Otherwise only its items are written again, each through
+    the cache. An edit of one block therefore rewrites the lists and
+    Scripts above it, joining the cached text of everything else.
+
+    Every list and Script keeps the text of everything inside it, so
+    the cache holds about as many copies of the XML as lists and
+    Scripts are nested deep. Entries live as long as the cache; prune
+    drops those of nodes a project no longer has.
+    '''
 
-    return ET.tostring(blockXML).decode('utf-8')
+    def __init__(self):
+        self.entries = {}
+        self.writer = XMLWriter()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def toXML(self, value : Any) -> str:
+        text = self.fragment(value)
+        if text.isascii():
+            return text
+        return text.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+
+    def written(self, value : Any) -> str:
+        parts = self.writer.parts
+        self.writer.writeValue(value)
+        text = ''.join(parts)
+        parts.clear()
+        return text
+
+    def fragment(self, value : Any) -> str:
+        '''
+        The XML of value, before non-ASCII characters are escaped.
+        Nodes whose items still have to be written wait on an explicit
+        stack, as 2-tuples with those items, so any depth works.
+        '''
+        entries = self.entries
+        texts, statics = [], []
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            valueType = type(value)
+            if valueType == tuple:
+                node, items = value
+                count = len(items)
+                itemTexts = texts[len(texts) - count:]
+                itemsStatic = all(statics[len(statics) - count:])
+                del texts[len(texts) - count:], statics[len(statics) - count:]
+                if type(node) == Block:
+                    text = f'<block s="{escapeAttribute(node.signature)}">{"".join(itemTexts)}</block>'
+                    entries[id(node)] = (node, None, False, None)
+                elif type(node) == Script:
+                    text = f'<script>{"".join(itemTexts)}</script>'
+                    entries[id(node)] = (node, tuple(items), itemsStatic, text)
+                else:
+                    text = f'<block s="reportNewList"><list>{"".join(itemTexts)}</list></block>'
+                    entries[id(node)] = (node, tuple(items), itemsStatic, text)
+                texts.append(text)
+                statics.append(False)
+                continue
+
+            if valueType == Block:
+                entry = entries.get(id(value))
+                if entry != None and entry[0] is value and entry[2]:
+                    texts.append(entry[3])
+                    statics.append(True)
+                    continue
+                elif entry == None or entry[0] is not value:
+                    if isStatic(value):
+                        text = self.written(value)
+                        entries[id(value)] = (value, None, True, text)
+                        texts.append(text)
+                        statics.append(True)
+                        continue
+                items = value.inputs
+            elif valueType == Script and value.blocks:
+                items = value.blocks
+            elif (valueType == list or valueType == BlockInputs) and value:
+                items = value
+            else:
+                texts.append(self.written(value))
+                statics.append(valueType in STATIC_TYPES)
+                continue
+
+            if valueType != Block:
+                entry = entries.get(id(value))
+                if entry != None and entry[0] is value and entry[2] and \
+                   len(entry[1]) == len(items) and all(map(operator.is_, entry[1], items)):
+                    texts.append(entry[3])
+                    statics.append(False)
+                    continue
+            stack.append((value, items))
+            stack.extend(reversed(items))
+        return texts[0]
+
+    def prune(self, values : [Any]):
+        '''
+        Drops the entries of every node not reachable from values,
+        such as the scripts of a project after it has been edited.
+        '''
+        entries = self.entries
+        kept = {}
+        stack = list(values)
+        while stack:
+            value = stack.pop()
+            entry = entries.get(id(value))
+            if entry == None or entry[0] is not value:
+                continue
+            kept[id(value)] = entry
+            if type(value) == Block:
+                if not entry[2]:
+                    stack.extend(value.inputs)
+            elif type(value) == Script:
+                stack.extend(value.blocks)
+            else:
+                stack.extend(value)
+        self.entries = kept
+
+def blockToElement(block : Block) -> ET.Element:
+    '''
+    Converts a Block Object into a block XML element.
+    '''
+    return formatBlockInput(block)
 
 def formatBlockInput(inp : Any) -> ET.Element:
     '''
     Converts inputs into XML-ready formats.
     All types are implicitly converted into strings since
     every non-list datatype is effectively a string.
+    Nested values wait on an explicit stack with the element
+    they go in, so any depth of nesting works.
+    '''
+    root = ET.Element('root')
+    stack = [(inp, root)]
+    while stack:
+        inp, parent = stack.pop()
+        element, container, children = inputElement(inp)
+        parent.append(element)
+        for child in reversed(children):
+            stack.append((child, container))
+    return root[0]
+
+def inputElement(inp : Any) -> (ET.Element, ET.Element, []):
+    '''
+    The element for a single input, without its nested values.
+    Returns the element, the element its nested values go in
+    and the nested values themselves.
     '''
     if inp == None:
-        return ''
+        return ET.Element('l'), None, ()
 
     if type(inp) == Option:
         valueElement = ET.Element('l')
-        optionXML = ET.Element('option')
+        optionXML = ET.SubElement(valueElement, 'option')
         optionXML.text = inp.text
-        valueElement.append(optionXML)
-        return valueElement
-       
+        return valueElement, None, ()
+
+    elif type(inp) == bool:
+        valueElement = ET.Element('l')
+        boolXML = ET.SubElement(valueElement, 'bool')
+        boolXML.text = 'true' if inp else 'false'
+        return valueElement, None, ()
+
+    elif type(inp) == Variable:
+        return ET.Element('block', var=inp.name), None, ()
+
+    elif type(inp) == Block:
+        blockXML = ET.Element('block', s=inp.signature)
+        return blockXML, blockXML, inp.inputs
+
+    elif type(inp) == Script:
+        scriptElement = ET.Element('script')
+        return scriptElement, scriptElement, inp.blocks
+
     elif type(inp) == list:
-        listElement = ET.Element('list')
-        for elem in inp:
-            listElement.append(formatBlockInput(elem))
-        
-        listReporterElement = ET.Element('block')
-        listReporterElement.attrib['s'] = 'reportNewList'
-        listReporterElement.append(listElement)
-        return listReporterElement
+        listReporterElement = ET.Element('block', s='reportNewList')
+        listElement = ET.SubElement(listReporterElement, 'list')
+        return listReporterElement, listElement, inp
 
     else:
         valueElement = ET.Element('l')
         valueElement.text = str(inp)
-        return valueElement
+        return valueElement, None, ()
 
 
 '''
@@ -115,54 +649,165 @@ def xmlToBlock(xmlString : str) -> Block:
     '''
     Converts an XMLString into a Block object.
     '''
-    xml = ET.fromstring(xmlString)
-    if 'var' in xml.attrib:
-        return Variable(xml.attrib['var'])
-    else:   
-        signature = xml.attrib['s']
-        inputs = formatXMLInputs(xml)
-        return Block(signature, inputs)
+    return parseXML(xmlString)
 
-def formatXMLInputs(blockInput : ET.Element):
+def parseXML(xmlString : str) -> Any:
     '''
-    Given a particular blockInput, if it's not a list it'll try
-    to convert the input to a float value or int value, then string.
-    Otherwise, it returns a list value and recursively formats its elements.
+    Builds the value of an XML string straight from expat's parser
+    events, without an ElementTree in between. Gives the same values
+    as elementToBlock.
+
+    Each open element is a frame of its tag, attributes and the values
+    of its children. An element is turned into its value as soon as it
+    closes, and the value is added to its parent's frame, so nesting
+    never recurses. The handlers are closures over the stack, which
+    expat calls faster than methods.
     '''
-    value = None
-    if blockInput.text == None:
-        return None
+    results = []
+    stack = [(None, None, results)]
+    push = stack.append
+    pop = stack.pop
+    text = None
+
+    def start(tag : str, attrib : {str : str}):
+        nonlocal text
+        push((tag, attrib, []))
+        text = None
+
+    def characters(data : str):
+        nonlocal text
+        text = data if text == None else text + data
+
+    def end(tag : str):
+        tag, attrib, children = pop()
+        parent = stack[-1]
+        value = xmlValue(tag, attrib, text, children, parent[0])
+        if value is SPLICE:
+            parent[2].extend(children)
+        else:
+            parent[2].append(value)
 
-    elif type(blockInput) == Option or blockInput.tag == 'l':
-        if '.' in blockInput.text:
-            try:
-                value = float(blockInput.text)
-            except ValueError:
-                value = blockInput.text
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = characters
+    parser.Parse(xmlString, True)
+    return results[0]
+
+# Returned by xmlValue for a variadic <list>, whose items are spliced into the block around it.
+SPLICE = object()
+
+def xmlValue(tag : str, attrib : {str : str}, text : str, children : [], parentTag : str) -> Any:
+    '''
+    The value of an element, given its text, the values of its
+    children and its parent's tag. Both parsers build on this as
+    each element closes.
+        Text: only used by elements without children, so it can be
+        all the text of the element or just what comes before its
+        first child.
+
+        Parent Tag: None for the root of a block, 'script' in a script
+        and anything else inside an input.
+    '''
+    if tag == 'l':
+        if children:
+            # <l> only has children for dropdown options and booleans
+            return children[0]
+        return formatLiteral(text) if text != None else None
+    elif tag == 'block' or tag == 'custom-block':
+        if 'var' in attrib:
+            return Variable(attrib['var'])
+        signature = attrib['s']
+        if signature == 'reportNewList' and parentTag != None and parentTag != 'script':
+            # In an input, a reportNewList block is just its list.
+            return children
+        return Block(signature, children)
+    elif (tag == 'option' or tag == 'bool') and parentTag == 'l':
+        return Option(text) if tag == 'option' else text == 'true'
+    elif tag == 'list' and (parentTag == 'block' or parentTag == 'custom-block'):
+        return SPLICE
+    elif tag == 'script':
+        return Script(children, {})
+    elif tag == 'autolambda' or tag == 'item':
+        return children[0] if children else None
+    return children
+
+def elementValue(root : ET.Element, parentTag : str = None) -> Any:
+    '''
+    The value of an ElementTree element, walked with an explicit
+    stack rather than recursion so any depth of nesting works.
+    Each frame holds an element, an iterator over its children
+    and the values of the children seen so far.
+    '''
+    results = []
+    stack = [(root, parentTag, results, iter(root), [])]
+    while stack:
+        element, parentTag, siblings, elements, children = stack[-1]
+        child = next(elements, None)
+        if child != None:
+            stack.append((child, element.tag, children, iter(child), []))
+            continue
+        stack.pop()
+        value = xmlValue(element.tag, element.attrib, element.text, children, parentTag)
+        if value is SPLICE:
+            siblings.extend(children)
         else:
-            try:
-                value = int(blockInput.text)
-            except ValueError:
-                value = blockInput.text
+            siblings.append(value)
+    return results[0]
 
-    elif blockInput.attrib and blockInput.attrib['s'] == 'reportNewList':
-        return formatXMLInputs(blockInput[0])
+def elementToBlock(xml : ET.Element) -> Block:
+    '''
+    Converts a block or custom-block XML element into a Block object.
+    A bare <list> child holds the inputs of a variadic slot, like the
+    words of join, and is spliced in so the Block matches the one the
+    SnapBlocks helpers build.
+    '''
+    return elementValue(xml)
 
-    else:
-        value = []
-        for elem in blockInput:
-            value.append(formatXMLInputs(elem))
-    
-    return value
+def elementToScript(xml : ET.Element, scope : {str : Any} = None, sprite = None):
+    '''
+    Converts a script XML element into a Script object.
+    '''
+    script = elementValue(xml)
+    return Script(script.blocks, scope if scope != None else {}, sprite)
+
+# Integers, or decimals with a point and an optional exponent; the first group is set for integers.
+LITERAL = re.compile(r'\s*[+-]?(?:(\d+)|\d+\.\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)\s*')
+
+def formatLiteral(text : str) -> Any:
+    '''
+    Converts the text of an <l> element to an int or float value
+    if it is one, otherwise keeps the text itself. The text is
+    classified in one scan rather than by trying int and float.
+    '''
+    if text.isdecimal():
+        return int(text)
+    match = LITERAL.fullmatch(text)
+    if match == None:
+        return text
+    return int(text) if match.group(1) != None else float(text)
+
+def formatXMLInputs(blockInput : ET.Element):
+    '''
+    Given a particular blockInput, if it's not a list it'll try
+    to convert the input to a float value or int value, then string.
+    Otherwise, it returns a list value of its formatted elements.
+    Nested blocks and scripts become Block and Script objects.
+    '''
+    # Any parent but a script or a block; the input is not spliced anywhere.
+    return elementValue(blockInput, 'input')
 
 class Script:
     '''
-    An ordered collection of Blocks with a scope.
+    An ordered collection of Blocks with a scope, and
+    the sprite that runs it if it belongs to one.
     '''
 
-    def __init__(self, blocks : [Block], scope : {str : Any}):
+    def __init__(self, blocks : [Block], scope : {str : Any}, sprite = None):
         self.blocks = blocks
         self.scope = scope
+        self.sprite = sprite
 
     def __iter__(self):
         return ScriptIterator(self.blocks)
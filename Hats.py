@@ -0,0 +1,259 @@
+from Block import *
+from typing import Any
+
+'''
+Hat block dispatch. A project keeps its scripts in a ScriptList, which
+files every script it gains under its hat block in a HatIndex, so
+starting the scripts a broadcast, key press or green flag fires looks
+them up instead of scanning every script of every sprite.
+'''
+
+# The hats whose first input picks the event they answer, and the option that answers every event.
+KEYED_HATS = {'receiveMessage' : 'any message', 'receiveKey' : 'any key'}
+
+# The key of a hat whose input is not a literal, so it must be evaluated at every event.
+DYNAMIC = object()
+
+def hatKey(script : Script):
+    '''
+    The signature of a script's hat block and, for keyed hats, the
+    message or key it answers; None if the script has no hat.
+    '''
+    if not script.blocks or type(script.blocks[0]) != Block:
+        return None
+    hat = script.blocks[0]
+    if hat.signature not in KEYED_HATS:
+        return hat.signature, None
+    value = hat.inputs[0] if hat.inputs else ''
+    if type(value) == Option:
+        return hat.signature, value.text
+    elif type(value) in (str, int, float, bool):
+        return hat.signature, value
+    return hat.signature, DYNAMIC
+
+class HatIndex:
+    '''
+    Scripts by hat signature, then key, then sprite.
+        Entries: each script's place in the index, and the serials of
+        its copies, which order the scripts a lookup finds as they are
+        ordered in the project. A script added twice is found once, and
+        stays in the index until both copies are removed; removing one
+        drops the earliest, as removing from a list does.
+
+    A script's hat is read when it is added, so changing the hat of a
+    script already in a project takes removing and adding it again.
+    '''
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.hats = {}
+        self.entries = {}
+        self.serial = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, script : Script):
+        entry = self.entries.get(script)
+        if entry != None:
+            self.serial += 1
+            entry[3].append(self.serial)
+            return
+        key = hatKey(script)
+        if key == None:
+            return
+        signature, value = key
+        self.serial += 1
+        self.entries[script] = (signature, value, script.sprite, [self.serial])
+        self.hats.setdefault(signature, {}).setdefault(value, {}).setdefault(script.sprite, {})[script] = None
+
+    def remove(self, script : Script):
+        entry = self.entries.get(script)
+        if entry == None:
+            return
+        signature, value, sprite, serials = entry
+        del serials[0]
+        if serials:
+            return
+        del self.entries[script]
+        keys = self.hats[signature]
+        sprites = keys[value]
+        scripts = sprites[sprite]
+        del scripts[script]
+        if not scripts:
+            del sprites[sprite]
+            if not sprites:
+                del keys[value]
+                if not keys:
+                    del self.hats[signature]
+
+    def rebuild(self, scripts : [Script]):
+        self.hats = {}
+        self.entries = {}
+        self.serial = 0
+        for script in scripts:
+            self.add(script)
+
+    def ordered(self, scripts : [Script]) -> [Script]:
+        entries = self.entries
+        return sorted(scripts, key=lambda script: entries[script][3][0])
+
+    def scripts(self, signature : str) -> [Script]:
+        '''
+        Every script whose hat block has signature.
+        '''
+        return self.ordered([script for sprites in self.hats.get(signature, {}).values()
+                             for scripts in sprites.values() for script in scripts])
+
+    def receivers(self, signature : str, value : Any, sprite = None) -> [Script]:
+        '''
+        The scripts with a keyed hat that answer value, or only those
+        of sprite when one is given.
+        '''
+        keys = self.hats.get(signature)
+        if keys == None:
+            return []
+        anyValue = KEYED_HATS[signature]
+        found = []
+        for key in ((value, DYNAMIC) if value == anyValue else (value, anyValue, DYNAMIC)):
+            try:
+                sprites = keys.get(key)
+            except TypeError:
+                # Lists and other unhashable values only match dynamic hats.
+                continue
+            if sprites == None:
+                continue
+            for scripts in (sprites.values() if sprite == None else [sprites.get(sprite, ())]):
+                for script in scripts:
+                    if key is DYNAMIC and self.executor.evaluate(script.blocks[0].inputs[0]) not in (value, anyValue):
+                        continue
+                    found.append(script)
+        return self.ordered(found)
+
+class ScriptList(list):
+    '''
+    A project's scripts, as a list that keeps a HatIndex up to date.
+    Appending, extending and removing update the index one script at a
+    time; anything that moves scripts around rebuilds it.
+
+    Removing a script only marks it removed. The marked scripts are
+    taken out in one pass when the list is next read or rearranged, so
+    removing the scripts of many clones costs O(1) a script rather than
+    a scan of the list for each.
+        Counts: how many times each script is in the list, not
+        counting removed ones.
+
+        Removed: how many times each script has been removed but is
+        still in the underlying list. The earliest are the removed ones.
+    '''
+
+    def __init__(self, scripts : [Script], hats : HatIndex):
+        super().__init__(scripts)
+        self.hats = hats
+        self.removed = {}
+        self.recount()
+        hats.rebuild(self)
+
+    def recount(self):
+        counts = self.counts = {}
+        for script in list.__iter__(self):
+            counts[script] = counts.get(script, 0) + 1
+
+    def compact(self):
+        '''
+        Takes the scripts marked removed out of the underlying list.
+        '''
+        removed = self.removed
+        if not removed:
+            return
+        kept = []
+        for script in list.__iter__(self):
+            count = removed.get(script)
+            if count:
+                removed[script] = count - 1
+            else:
+                kept.append(script)
+        removed.clear()
+        list.__setitem__(self, slice(None), kept)
+
+    def append(self, script : Script):
+        # A removed copy still in the list is earlier than this one, so it is still the one compact drops.
+        super().append(script)
+        self.counts[script] = self.counts.get(script, 0) + 1
+        self.hats.add(script)
+
+    def extend(self, scripts : [Script]):
+        for script in list(scripts):
+            self.append(script)
+
+    def __iadd__(self, scripts : [Script]):
+        self.extend(scripts)
+        return self
+
+    def uncount(self, script : Script):
+        count = self.counts.get(script, 0)
+        if not count:
+            raise ValueError('ScriptList.remove(x): x not in list')
+        elif count == 1:
+            del self.counts[script]
+        else:
+            self.counts[script] = count - 1
+        self.hats.remove(script)
+
+    def remove(self, script : Script):
+        self.uncount(script)
+        self.removed[script] = self.removed.get(script, 0) + 1
+
+    def pop(self, index : int = -1) -> Script:
+        self.compact()
+        script = super().pop(index)
+        self.uncount(script)
+        return script
+
+    def __contains__(self, script : Any) -> bool:
+        return script in self.counts
+
+    def count(self, script : Any) -> int:
+        return self.counts.get(script, 0)
+
+    def reading(method):
+        def read(self, *arguments, **keywords):
+            self.compact()
+            return method(self, *arguments, **keywords)
+        return read
+
+    __iter__ = reading(list.__iter__)
+    __reversed__ = reading(list.__reversed__)
+    __len__ = reading(list.__len__)
+    __getitem__ = reading(list.__getitem__)
+    __eq__ = reading(list.__eq__)
+    __ne__ = reading(list.__ne__)
+    __lt__ = reading(list.__lt__)
+    __le__ = reading(list.__le__)
+    __gt__ = reading(list.__gt__)
+    __ge__ = reading(list.__ge__)
+    __add__ = reading(list.__add__)
+    __mul__ = reading(list.__mul__)
+    __rmul__ = reading(list.__rmul__)
+    __repr__ = reading(list.__repr__)
+    index = reading(list.index)
+    copy = reading(list.copy)
+    del reading
+
+    def rebuilding(method):
+        def rebuild(self, *arguments, **keywords):
+            self.compact()
+            result = method(self, *arguments, **keywords)
+            self.recount()
+            self.hats.rebuild(self)
+            return result
+        return rebuild
+
+    insert = rebuilding(list.insert)
+    clear = rebuilding(list.clear)
+    sort = rebuilding(list.sort)
+    reverse = rebuilding(list.reverse)
+    __setitem__ = rebuilding(list.__setitem__)
+    __delitem__ = rebuilding(list.__delitem__)
+    __imul__ = rebuilding(list.__imul__)
+    del rebuilding
@@ -0,0 +1,255 @@
+from typing import Any
+from itertools import islice
+
+'''
+Snap lists. Snap keeps a list in one of two forms and switches between
+them as it is used: a linked list of pairs, which "in front of" and
+"all but first of" build and take apart without copying, and an array,
+which indexes and grows in place. "numbers from" reports an array whose
+contents are a Python range, so even a list of a million numbers takes
+no memory until something changes it. Lists written out in a project or as
+Python literals stay plain Python lists; the list blocks take either
+and report SnapLists.
+'''
+
+class SnapList:
+    '''
+    A Snap list in one of two forms.
+        Linked: first is the first item and rest the SnapList holding
+        the others. contents is None.
+
+        Arrayed: the items are contents[start:end]. "all but first of"
+        an arrayed list is a view of the same contents one item further
+        on, so taking it costs nothing however long the list is.
+        contents is a Python list, or a range for a lazy list of numbers.
+
+    Views share their contents, so a list copies them before changing
+    them in place if any view might see the change. A range is copied
+    into a list the first time the list is changed. Appending writes
+    past the end of every other view and so never needs the copy,
+    unless another list has already appended there first.
+
+    Reading the first item, "in front of", "all but first of" and
+    "is empty" leave a linked list linked. Anything that indexes into
+    it or changes it turns it into an array first, as Snap does; the
+    pairs it was made from are left as they were.
+    '''
+
+    __slots__ = ('contents', 'start', 'end', 'first', 'rest', 'shared')
+
+    def __init__(self, items = ()):
+        self.contents = list(items)
+        self.start = 0
+        self.end = len(self.contents)
+        self.first = None
+        self.rest = None
+        self.shared = False
+
+    @classmethod
+    def cons(cls, item : Any, rest) -> 'SnapList':
+        '''
+        A linked list of item in front of rest. A plain Python list
+        is copied, since it can be changed behind the pair's back.
+        '''
+        lst = cls.__new__(cls)
+        lst.contents = None
+        lst.first = item
+        lst.rest = rest if type(rest) == SnapList else SnapList(rest)
+        lst.shared = False
+        return lst
+
+    @classmethod
+    def fromRange(cls, numbers : range) -> 'SnapList':
+        '''
+        A lazy list of the numbers in a range.
+        '''
+        lst = cls()
+        lst.contents = numbers
+        lst.end = len(numbers)
+        return lst
+
+    @classmethod
+    def fromLiteral(cls, items : list) -> 'SnapList':
+        '''
+        A new list of the items of a list literal in a Block input, with
+        the lists nested in it copied as well, so changing the list a
+        block reports never changes the block. Nested lists wait on an
+        explicit stack, so any depth of nesting works.
+        '''
+        lst = cls(items)
+        stack = [lst]
+        while stack:
+            contents = stack.pop().contents
+            for index, item in enumerate(contents):
+                if type(item) == list:
+                    contents[index] = copied = cls(item)
+                    stack.append(copied)
+        return lst
+
+    def asRange(self) -> range:
+        '''
+        The items as a range, without copying them, if the list is a
+        lazy list of numbers; otherwise None.
+        '''
+        if type(self.contents) == range:
+            return self.contents[self.start:self.end]
+        return None
+
+    @property
+    def isLinked(self) -> bool:
+        return self.contents == None
+
+    def cdr(self) -> 'SnapList':
+        '''
+        Every item but the first, without copying any of them.
+        '''
+        if self.contents == None:
+            return self.rest
+        if self.end - self.start < 2:
+            return SnapList()
+        view = SnapList.__new__(SnapList)
+        view.contents = self.contents
+        view.start = self.start + 1
+        view.end = self.end
+        view.first = None
+        view.rest = None
+        view.shared = self.shared = True
+        return view
+
+    def becomeArray(self):
+        '''
+        Turns a linked list into an array holding the same items.
+        '''
+        items = []
+        node = self
+        while node.contents == None:
+            items.append(node.first)
+            node = node.rest
+        items.extend(islice(node.contents, node.start, node.end))
+        self.contents = items
+        self.start = 0
+        self.end = len(items)
+        self.first = None
+        self.rest = None
+        self.shared = False
+
+    def own(self):
+        '''
+        Makes the list's contents its own before they are changed in place.
+        '''
+        if self.contents == None:
+            self.becomeArray()
+        elif self.shared or type(self.contents) == range:
+            contents = self.contents[self.start:self.end]
+            self.contents = contents if type(contents) == list else list(contents)
+            self.start = 0
+            self.end = len(self.contents)
+            self.shared = False
+
+    def position(self, index : int) -> int:
+        '''
+        Converts a Python index, which may be negative, into an index
+        into contents. The list must be arrayed.
+        '''
+        length = self.end - self.start
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError('list index out of range')
+        return self.start + index
+
+    def __len__(self) -> int:
+        length = 0
+        node = self
+        while node.contents == None:
+            length += 1
+            node = node.rest
+        return length + node.end - node.start
+
+    def __bool__(self) -> bool:
+        return self.contents == None or self.end > self.start
+
+    def __iter__(self):
+        node = self
+        while node.contents == None:
+            yield node.first
+            node = node.rest
+        yield from islice(node.contents, node.start, node.end)
+
+    def __contains__(self, item : Any) -> bool:
+        if type(self.contents) == range:
+            return item in self.contents[self.start:self.end]
+        elif self.contents != None and self.start == 0 and self.end == len(self.contents):
+            return item in self.contents
+        return any(value is item or value == item for value in self)
+
+    def __getitem__(self, index):
+        if type(index) == slice:
+            return SnapList(list(self)[index])
+        if self.contents == None:
+            if index == 0:
+                return self.first
+            self.becomeArray()
+        return self.contents[self.position(index)]
+
+    def __setitem__(self, index : int, item : Any):
+        self.own()
+        self.contents[self.position(index)] = item
+
+    def __delitem__(self, index : int):
+        self.own()
+        position = self.position(index)
+        if position == self.start:
+            # Dropping the first item moves the view rather than the items,
+            # which are moved down once half the contents are dropped ones.
+            self.contents[position] = None
+            self.start += 1
+            if 2 * self.start > len(self.contents):
+                del self.contents[:self.start]
+                self.end -= self.start
+                self.start = 0
+        else:
+            del self.contents[position]
+            self.end -= 1
+
+    def append(self, item : Any):
+        if self.contents == None:
+            self.becomeArray()
+        elif self.end != len(self.contents) or type(self.contents) == range:
+            self.shared = True
+            self.own()
+        self.contents.append(item)
+        self.end += 1
+
+    def insert(self, index : int, item : Any):
+        self.own()
+        length = self.end - self.start
+        index = min(max(index + length if index < 0 else index, 0), length)
+        self.contents.insert(self.start + index, item)
+        self.end += 1
+
+    def clear(self):
+        self.contents = []
+        self.start = self.end = 0
+        self.first = None
+        self.rest = None
+        self.shared = False
+
+    def __eq__(self, other : Any) -> bool:
+        if type(other) not in (SnapList, list):
+            return NotImplemented
+        if self is other:
+            return True
+        if len(self) != len(other):
+            return False
+        return all(x is y or x == y for x, y in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f'SnapList({list(self)!r})'
+
+    def __reduce__(self):
+        if type(self.contents) == range:
+            return SnapList.fromRange, (self.asRange(),)
+        return SnapList, (list(self),)
@@ -0,0 +1,128 @@
+import base64
+import mmap
+import urllib.parse
+from xml.sax.saxutils import unescape
+
+class MediaHandle:
+    '''
+    A data URI payload, such as a costume image or the project
+    thumbnail, left where it is in its source.
+        Source: a buffer holding the project file, usually a read-only
+        memory map of it.
+
+        Start / End: the byte offsets of the data URI in the source.
+
+    Nothing is copied or decoded until the bytes are asked for.
+    '''
+
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source, start : int, end : int):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def span(self) -> memoryview:
+        '''
+        The raw data URI as it appears in the source, without a copy.
+        '''
+        return memoryview(self.source)[self.start:self.end]
+
+    def header(self) -> str:
+        '''
+        The part of the data URI before the payload,
+        like 'data:image/png;base64'.
+        '''
+        comma = self.source.find(b',', self.start, self.end)
+        return bytes(self.source[self.start:comma]).decode('ascii')
+
+    def mimeType(self) -> str:
+        return self.header()[len('data:'):].split(';')[0]
+
+    def decode(self) -> bytes:
+        '''
+        Decodes the payload into the media's bytes.
+        '''
+        comma = self.source.find(b',', self.start, self.end)
+        payload = self.source[comma + 1:self.end]
+        if self.header().endswith(';base64'):
+            return base64.b64decode(payload)
+        return urllib.parse.unquote_to_bytes(unescape(bytes(payload).decode('utf-8')))
+
+    def writeTo(self, stream):
+        '''
+        Writes the data URI to a binary stream exactly as it
+        appears in the source, without decoding it.
+        '''
+        stream.write(self.span())
+
+class MediaSource:
+    '''
+    Finds the data URI payloads of a project file so they can be
+    handed out as MediaHandles. Elements are looked up in document
+    order, with a separate cursor for each kind of element.
+    '''
+
+    def __init__(self, source):
+        self.buffer = MediaSource.openBuffer(source)
+        self.cursors = {}
+
+    @staticmethod
+    def openBuffer(source):
+        '''
+        Memory maps source if it is a path or a real file.
+        Returns None for in-memory streams, which have no file to map.
+        '''
+        if isinstance(source, str):
+            with open(source, 'rb') as sourceFile:
+                return mmap.mmap(sourceFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def nextText(self, tag : str, text : str = None) -> MediaHandle:
+        '''
+        Returns a handle on the text of the next <tag> element,
+        or on a copy of text when the source cannot be mapped.
+        '''
+        if self.buffer == None:
+            return self.copyOf(text)
+        opening = f'<{tag}>'.encode('ascii')
+        start = self.buffer.find(opening, self.cursors.get(tag, 0))
+        if start < 0:
+            return None
+        start += len(opening)
+        end = self.buffer.find(b'<', start)
+        self.cursors[tag] = end
+        return MediaHandle(self.buffer, start, end) if end > start else None
+
+    def nextAttribute(self, tag : str, attribute : str, text : str = None) -> MediaHandle:
+        '''
+        Returns a handle on an attribute of the next <tag> element,
+        or on a copy of text when the source cannot be mapped.
+        '''
+        if self.buffer == None:
+            return self.copyOf(text)
+        start = self.buffer.find(f'<{tag} '.encode('ascii'), self.cursors.get(tag, 0))
+        if start < 0:
+            return None
+        tagEnd = self.buffer.find(b'>', start)
+        self.cursors[tag] = tagEnd
+        for quote in (b'"', b"'"):
+            name = f' {attribute}='.encode('ascii') + quote
+            valueStart = self.buffer.find(name, start, tagEnd)
+            if valueStart >= 0:
+                valueStart += len(name)
+                return MediaHandle(self.buffer, valueStart, self.buffer.find(quote, valueStart))
+        return None
+
+    @staticmethod
+    def copyOf(text : str) -> MediaHandle:
+        if not text:
+            return None
+        data = text.encode('utf-8')
+        return MediaHandle(data, 0, len(data))
@@ -0,0 +1,153 @@
+from Block import *
+from Lists import SnapList
+from typing import Any
+from collections import OrderedDict
+
+class ReporterCache:
+    '''
+    An LRU cache of the results of pure reporters, consulted by an
+    Executor for every block it evaluates once memoization is enabled.
+
+    A result is keyed on the reporter itself, which hashes structurally,
+    the scope it ran in and the version counters of the variables it
+    reads. Every block that writes a variable bumps that variable's
+    counter, so a cached result is never reused after one of its inputs
+    may have changed. Variables must therefore only be changed through
+    blocks or the Project's variable methods while the cache is on.
+
+    The variables each reporter reads are worked out once and kept in
+    a second LRU of at most maxSize reporters, so neither grows without
+    bound however many blocks a long run evaluates. It is keyed by id,
+    so telling a reporter can't be cached, as any holding a list can't,
+    never hashes or compares it.
+
+    Only trees made entirely of pure primitives, literals and variable
+    reads are cached. reportRandom, commands and anything containing
+    them are always run, and results that are lists, or that were
+    computed from lists, are never stored since lists can be changed in
+    place.
+    '''
+
+    def __init__(self, executor, maxSize : int = 4096):
+        self.executor = executor
+        self.maxSize = maxSize
+        self.results = OrderedDict()
+        self.versions = {}
+        # Reporter ids mapped to the reporter, so its id is never reused, and the
+        # variable names it reads, or None if uncacheable, least recently used first.
+        self.reads = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def invalidate(self, variableName : str):
+        self.versions[variableName] = self.versions.get(variableName, 0) + 1
+
+    def clear(self):
+        self.results.clear()
+
+    def statistics(self) -> {str : int}:
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'evictions' : self.evictions,
+            'size' : len(self.results)
+        }
+
+    def keyOf(self, block : Block, scope : {}):
+        '''
+        The key block's result in scope is cached under,
+        or None if the block is not cacheable.
+        '''
+        try:
+            reads = self.reads[id(block)][1]
+            self.reads.move_to_end(id(block))
+        except KeyError:
+            reads = self.variablesRead(block)
+        if reads == None:
+            return None
+        versions = self.versions
+        return (block, id(scope), tuple([versions.get(name, 0) for name in reads]))
+
+    def lookup(self, key : tuple):
+        '''
+        Returns the (result, scope) entry cached under key, or None.
+        '''
+        entry = self.results.get(key)
+        if entry == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return entry
+
+    def store(self, key : tuple, block : Block, scope : {}, result : Any):
+        # Evaluating the block's inputs may have pushed it out of reads since keyOf.
+        entry = self.reads.get(id(block))
+        reads = entry[1] if entry != None else self.variablesRead(block)
+        if type(result) in (list, SnapList) or any(type(self.read(name, scope)) in (list, SnapList) for name in reads):
+            return
+        # The scope is kept alive with the result so its id cannot be reused.
+        self.results[key] = (result, scope)
+        if len(self.results) > self.maxSize:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+    def read(self, variableName : str, scope : {}):
+        if variableName in scope:
+            return scope[variableName]
+        return self.executor.project.globalVariables.get(variableName)
+
+    def variablesRead(self, block : Block):
+        '''
+        Returns the sorted names of the variables a reporter reads,
+        or None if any part of it is impure or a list literal. The
+        tree is walked bottom up from an explicit stack and the answer
+        for every block in it is kept, so each block is visited once.
+        '''
+        primitives = self.executor.primitives
+        known = self.reads
+        # Answers found by this walk, by id, which are only added to the LRU once it is done.
+        reads = {}
+        # Blocks whose inputs are already answered come back as (block, True).
+        stack = [(block, False)]
+        while stack:
+            node, inputsRead = stack.pop()
+            if id(node) in reads:
+                continue
+            elif id(node) in known:
+                reads[id(node)] = known[id(node)]
+                continue
+            if not inputsRead:
+                stack.append((node, True))
+                stack.extend((inp, False) for inp in node.inputs if type(inp) == Block)
+                continue
+
+            names = set()
+            if node.signature not in primitives or not primitives.lookup(node.signature).pure:
+                names = None
+            for inp in node.inputs:
+                if names == None:
+                    break
+                inputType = type(inp)
+                if inputType == Block:
+                    if reads[id(inp)][1] == None:
+                        names = None
+                    else:
+                        names.update(reads[id(inp)][1])
+                elif inputType == Variable:
+                    names.add(inp.name)
+                elif inputType not in (int, float, str, bool, Option) and inp != None:
+                    names = None
+            reads[id(node)] = (node, tuple(sorted(names)) if names != None else None)
+
+        # The block itself goes in last, so it is the last to be pushed out.
+        answer = reads.pop(id(block))
+        for key, entry in reads.items():
+            known[key] = entry
+            known.move_to_end(key)
+        known[id(block)] = answer
+        known.move_to_end(id(block))
+        while len(known) > self.maxSize:
+            known.popitem(last=False)
+        return answer[1]
@@ -0,0 +1,155 @@
+from Block import *
+from Project import Executor
+from Text import Text
+from typing import Any
+
+def optimize(value : Block, executor : Executor = None) -> Block:
+    '''
+    Returns an optimized copy of a Block tree; the original is not changed.
+    See BlockOptimizer for what the pass does.
+    '''
+    return BlockOptimizer(executor).optimize(value)
+
+def roundTrips(value : Any) -> bool:
+    '''
+    Whether a folded value comes back unchanged from blockToXML and
+    xmlToBlock, so it can stand in for the block that produced it.
+    '''
+    if type(value) == bool:
+        return True
+    elif type(value) in (int, float, str):
+        text = str(value)
+        parsed = formatLiteral(text)
+        return text != '' and type(parsed) == type(value) and parsed == value
+    return False
+
+class BlockOptimizer:
+    '''
+    An optimizer pass over Block trees.
+        Constant folding: a pure operator whose inputs are all literals
+        is replaced by its result, when that result is a single value
+        that survives a round trip through XML. Operators that raise,
+        like a division by zero, are left for the executor to report.
+
+        Interning: structurally identical subtrees built only from pure
+        operators and literals, which are the ones folding had to leave,
+        are replaced by a single object, so they take the memory of one
+        and compare by identity. Each copy is still evaluated on its own;
+        interning saves memory, not work. reportRandom, variable reads
+        and every command or special block are never interned.
+
+    The pure operators are those of the executor's registry, by default
+    the built in ones. The optimized tree only contains literals, Blocks
+    and Scripts, so it still round-trips through blockToXML and can be
+    saved back to a project.
+    '''
+
+    def __init__(self, executor : Executor = None):
+        # Folding runs pure blocks with literal inputs, so no project is needed.
+        self.executor = executor if executor != None else Executor(None)
+        self.primitives = self.executor.primitives
+        # Structural keys of interned subtrees mapped to the interned object,
+        # and the ids of those objects.
+        self.interned = {}
+        self.canonical = set()
+
+    def optimize(self, value : Any) -> Any:
+        '''
+        Optimizes a tree. The root itself is never folded away, so a
+        Block stays a Block and can still be written out as XML.
+        '''
+        return self.optimizeNode(value, True)
+
+    def optimizeNode(self, value : Any, root : bool = False) -> Any:
+        '''
+        Optimizes a tree bottom up from an explicit stack, so any depth
+        of nesting works. Each value whose parts are still being
+        optimized is a frame on the stack:
+            (value, whether it is a root, parts, optimized parts so far)
+        The blocks of a Script or a C-slot are roots, like the tree's.
+        '''
+        frames = []
+        while True:
+            # Optimize value, or push a frame to optimize its parts first.
+            valueType = type(value)
+            if valueType == Block:
+                frames.append((value, root, value.inputs, []))
+                result = PENDING
+            elif valueType == Script:
+                frames.append((value, root, value.blocks, []))
+                result = PENDING
+            elif valueType == list and any(type(item) == Block for item in value):
+                # A list of Blocks is a script in a C-slot.
+                frames.append((value, root, value, []))
+                result = PENDING
+            else:
+                result = value
+
+            # Hand the result up, rebuilding every value whose parts are now all optimized.
+            while frames:
+                frameValue, frameRoot, parts, results = frames[-1]
+                if result is not PENDING:
+                    results.append(result)
+                if len(results) < len(parts):
+                    value, root = parts[len(results)], type(frameValue) != Block
+                    break
+                frames.pop()
+                result = self.rebuild(frameValue, frameRoot, results)
+            else:
+                return result
+
+    def rebuild(self, value : Any, root : bool, parts : []) -> Any:
+        '''
+        value with its parts replaced by their optimized versions,
+        folded or interned if it is a Block that can be.
+        '''
+        if type(value) == Script:
+            return Script(parts, value.scope, value.sprite)
+        elif type(value) != Block:
+            return parts
+
+        block = Block(value.signature, parts)
+        if root or not self.isPure(block):
+            return block
+
+        if all(self.isLiteral(inp) for inp in parts):
+            try:
+                result = self.executor.evaluate(block, {})
+            except Exception:
+                result = None
+            if type(result) == Text:
+                # A literal is written as a string, so a folded join is one too.
+                result = str(result)
+            if roundTrips(result):
+                return result
+
+        key = (block.signature, tuple(self.key(inp) for inp in parts))
+        return self.intern(key, block) if None not in key[1] else block
+
+    def isPure(self, block : Block) -> bool:
+        return block.signature in self.primitives and self.primitives.lookup(block.signature).pure
+
+    @staticmethod
+    def isLiteral(value : Any) -> bool:
+        return type(value) in (int, float, str, bool, Option) or value == None
+
+    def key(self, value : Any):
+        '''
+        A hashable key for an interned subtree or a literal,
+        or None for values that are never interned.
+        '''
+        valueType = type(value)
+        if valueType == Block:
+            # Interned children are canonical, so their identity is their structure.
+            return ('node', id(value)) if id(value) in self.canonical else None
+        elif valueType == Option:
+            return ('option', value.text)
+        elif valueType in (int, float, str, bool) or value == None:
+            # The type keeps 1, 1.0 and True apart.
+            return (valueType.__name__, value)
+        return None
+
+    def intern(self, key, node):
+        node = self.interned.setdefault(key, node)
+        self.canonical.add(id(node))
+        return node
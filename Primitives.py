@@ -0,0 +1,880 @@
+from Block import *
+from Lists import SnapList
+from Text import Text, textOf, joinWords
+from SpatialIndex import spriteRadius
+from typing import Any
+import functools
+import random
+import math
+import time
+
+class Primitive:
+    '''
+    A block the Executor knows how to run.
+        Signature: the signature of the block in XML format.
+
+        Handler: the Python callable that runs the block. Plain handlers
+        are called with the block's evaluated inputs. Special handlers
+        are called with (executor, block, scope) and decide for themselves
+        which inputs to evaluate and when, which is what control blocks
+        and variable setters need.
+
+        Kind: 'reporter', 'predicate', 'command' or 'hat'.
+
+        Pure: whether the block's result depends only on its inputs and
+        running it has no side effects, so it can be folded or cached.
+
+        Threaded: for blocks that let other scripts run, a generator
+        function called like a special handler whenever the block runs
+        in a Scheduler thread. It yields wherever Snap would yield.
+    '''
+
+    def __init__(self, signature : str, handler, kind : str = 'reporter',
+                 special : bool = False, pure : bool = False, threaded = None):
+        self.signature = signature
+        self.handler = handler
+        self.kind = kind
+        self.special = special
+        self.pure = pure
+        self.threaded = threaded
+
+class PrimitiveRegistry:
+    '''
+    Maps block signatures, and the options of reportMonadic,
+    to the code that runs them in a single dictionary lookup.
+    '''
+
+    def __init__(self):
+        self.primitives = {}
+        self.monadic = {}
+
+    def register(self, signature : str, handler = None, kind : str = 'reporter',
+                 special : bool = False, pure : bool = False):
+        '''
+        Registers handler as the implementation of signature, replacing
+        any earlier registration. Without a handler, returns a decorator
+        so the function below it becomes the handler.
+        '''
+        if handler == None:
+            def decorator(function):
+                self.register(signature, function, kind, special, pure)
+                return function
+            return decorator
+
+        self.primitives[signature] = Primitive(signature, handler, kind, special, pure)
+        return handler
+
+    def registerThreaded(self, signature : str, handler = None):
+        '''
+        Registers a generator function as the way an already registered
+        block runs in a Scheduler thread. Registering the block again
+        drops it. Works as a decorator like register.
+        '''
+        if handler == None:
+            def decorator(function):
+                self.registerThreaded(signature, function)
+                return function
+            return decorator
+
+        primitive = self.lookup(signature)
+        # A new Primitive, so that copies of this registry are not changed.
+        self.primitives[signature] = Primitive(signature, primitive.handler, primitive.kind,
+                                               primitive.special, primitive.pure, handler)
+        return handler
+
+    def registerMonadic(self, option : str, function):
+        self.monadic[option] = function
+        return function
+
+    def lookup(self, signature : str) -> Primitive:
+        if signature not in self.primitives:
+            raise ValueError(f'{signature} is not a primitive!')
+        return self.primitives[signature]
+
+    def lookupMonadic(self, option : str):
+        if option not in self.monadic:
+            raise ValueError(f'Error! {option} is not a monadic function.')
+        return self.monadic[option]
+
+    def copy(self):
+        '''
+        Returns an independent registry with the same primitives, so a
+        project can add or override blocks without affecting others.
+        '''
+        registry = PrimitiveRegistry()
+        registry.primitives = dict(self.primitives)
+        registry.monadic = dict(self.monadic)
+        return registry
+
+    def __contains__(self, signature : str):
+        return signature in self.primitives
+
+# The registry every Executor uses unless it is given its own.
+PRIMITIVES = PrimitiveRegistry()
+
+def registerPrimitive(signature : str, handler = None, kind : str = 'reporter',
+                      special : bool = False, pure : bool = False):
+    return PRIMITIVES.register(signature, handler, kind, special, pure)
+
+def registerThreaded(signature : str, handler = None):
+    return PRIMITIVES.registerThreaded(signature, handler)
+
+def registerMonadic(option : str, function):
+    return PRIMITIVES.registerMonadic(option, function)
+
+class StopScript(Exception):
+    '''
+    Raised by doReport and doStopThis to end the running script or ring.
+    The reported value, if any, is carried in value.
+    '''
+
+    def __init__(self, value : Any = None):
+        super().__init__(value)
+        self.value = value
+
+class StopAll(Exception):
+    '''
+    Raised by "stop all" to end every script in the project.
+    '''
+
+class Ring:
+    '''
+    The value of a reifyScript, reifyReporter or reifyPredicate block:
+    a body together with its parameter names and the scope it was made in.
+    '''
+
+    def __init__(self, kind : str, body : Any, parameters : [str], scope : {str : Any}):
+        self.kind = kind
+        self.body = body
+        self.parameters = parameters
+        self.scope = scope
+
+def scriptBlocks(script : Any) -> [Block]:
+    '''
+    Returns the blocks of a C-slot input, which can be a Script,
+    a list of Blocks, a single Block or empty.
+    '''
+    if script == None:
+        return []
+    elif type(script) == Script:
+        return script.blocks
+    elif type(script) == list:
+        return script
+    else:
+        return [script]
+
+def listArguments(inputs : []) -> []:
+    '''
+    Flattens the argument list that follows a ring in doRun, fork and
+    evaluate. Snap gives it as one list input; Python callers may pass
+    the arguments directly.
+    '''
+    if len(inputs) == 1 and type(inputs[0]) in (list, SnapList):
+        return inputs[0]
+    return [inp for inp in inputs if inp != None]
+
+'''
+Operator Blocks
+'''
+
+registerPrimitive('reportSum', lambda x, y: x + y, pure=True)
+registerPrimitive('reportDiff', lambda x, y: x - y, pure=True)
+registerPrimitive('reportProduct', lambda x, y: x * y, pure=True)
+registerPrimitive('reportQuotient', lambda x, y: x / y, pure=True)
+registerPrimitive('reportPower', lambda x, y: x ** y, pure=True)
+registerPrimitive('reportModulus', lambda x, y: x % y, pure=True)
+registerPrimitive('reportRound', round, pure=True)
+registerPrimitive('reportLessThan', lambda x, y: x < y, 'predicate', pure=True)
+registerPrimitive('reportEquals', lambda x, y: x == y, 'predicate', pure=True)
+registerPrimitive('reportGreaterThan', lambda x, y: x > y, 'predicate', pure=True)
+registerPrimitive('reportAnd', lambda x, y: x and y, 'predicate', pure=True)
+registerPrimitive('reportOr', lambda x, y: x or y, 'predicate', pure=True)
+registerPrimitive('reportNot', lambda x: not x, 'predicate', pure=True)
+registerPrimitive('reportBoolean', bool, 'predicate', pure=True)
+registerPrimitive('reportJoinWords', joinWords, pure=True)
+registerPrimitive('reportStringSize', lambda text: len(text) if type(text) == Text else len(textOf(text)), pure=True)
+
+@registerPrimitive('reportTextSplit', pure=True)
+def reportTextSplit(text, separator):
+    # An empty separator slot splits at whitespace.
+    try:
+        return SnapList(text.split(separator))
+    except (AttributeError, TypeError):
+        return SnapList(textOf(text).split(separator if separator == None else textOf(separator)))
+
+@registerPrimitive('reportRandom')
+def reportRandom(start, stop):
+    if type(start) == int and type(stop) == int:
+        return random.randint(start, stop)
+    else:
+        return random.uniform(start, stop)
+
+@registerPrimitive('reportMonadic', special=True, pure=True)
+def reportMonadic(executor, block : Block, scope : {}):
+    operatorType = executor.evaluate(block.inputs[0], scope)
+    operand = executor.evaluate(block.inputs[1], scope)
+    return executor.primitives.lookupMonadic(operatorType)(operand)
+
+registerMonadic('abs', abs)
+registerMonadic('neg', lambda x: -1 * x)
+registerMonadic('ceiling', math.ceil)
+registerMonadic('floor', math.floor)
+registerMonadic('sqrt', math.sqrt)
+registerMonadic('sin', math.sin)
+registerMonadic('cos', math.cos)
+registerMonadic('tan', math.tan)
+registerMonadic('asin', math.asin)
+registerMonadic('acos', math.acos)
+registerMonadic('atan', math.atan)
+registerMonadic('ln', math.log)
+registerMonadic('log', math.log10)
+registerMonadic('lg', lambda x: math.log(x, 2))
+registerMonadic('e^', lambda x: math.e ** x)
+registerMonadic('10^', lambda x: 10 ** x)
+registerMonadic('2^', lambda x: 2 ** x)
+registerMonadic('id', lambda x: x)
+
+def reifyRing(kind : str):
+    def handler(executor, block : Block, scope : {}):
+        body = block.inputs[0] if block.inputs else None
+        return Ring(kind, body, [executor.evaluate(name) for name in block.inputs[1:]], scope)
+    return handler
+
+registerPrimitive('reifyScript', reifyRing('command'), special=True)
+registerPrimitive('reifyReporter', reifyRing('reporter'), special=True)
+registerPrimitive('reifyPredicate', reifyRing('predicate'), special=True)
+
+'''
+Variables Blocks
+'''
+
+@registerPrimitive('doSetVar', kind='command', special=True)
+def doSetVar(executor, block : Block, scope : {}):
+    variableName = executor.evaluate(block.inputs[0], scope)
+    value = executor.evaluate(block.inputs[1], scope)
+    if executor.varExistsLocally(variableName, scope):
+        scope[variableName] = value
+        executor.variableChanged(variableName)
+    else:
+        executor.project.setGlobalVariable(variableName, value)
+
+@registerPrimitive('doChangeVar', kind='command', special=True)
+def doChangeVar(executor, block : Block, scope : {}):
+    variableName = executor.evaluate(block.inputs[0], scope)
+    increment = executor.evaluate(block.inputs[1], scope)
+    if type(increment) in (float, int):
+        if not executor.varExistsLocally(variableName, scope):
+            scope = executor.project.globalVariables
+        # Snap has a quirk where if the variable isn't a number, change var does nothing
+        if type(scope[variableName]) in (float, int):
+            try:
+                scope[variableName] += increment
+            except TypeError:
+                scope[variableName] = 'NaN'
+            executor.variableChanged(variableName)
+
+@registerPrimitive('doDeclareVariables', kind='command', special=True)
+def doDeclareVariables(executor, block : Block, scope : {}):
+    for name in block.inputs:
+        variableName = executor.evaluate(name)
+        scope[variableName] = None
+        executor.variableChanged(variableName)
+
+# Watchers are not modelled, so showing and hiding variables does nothing.
+registerPrimitive('doShowVar', lambda name: None, 'command')
+registerPrimitive('doHideVar', lambda name: None, 'command')
+
+'''
+List Blocks
+'''
+
+def listIndex(index : Any, lst : [], end : int = 0) -> int:
+    '''
+    Converts a Snap list index (1-based, or the options 'last' and
+    'random') into a Python list index, or None if it is outside the
+    list. End widens the range past the last item, for inserting.
+    '''
+    length = len(lst)
+    if index == 'last':
+        position = length
+    elif index == 'random' or index == 'any':
+        position = random.randrange(length) + 1 if length else 0
+    else:
+        position = int(index)
+    # Python's negative indices count from the end, which Snap's don't.
+    if 1 <= position <= length + end:
+        return position - 1
+    return None
+
+def reportNumbers(start, stop) -> range:
+    step = 1 if stop >= start else -1
+    return range(start, stop + step, step)
+
+def reportListIndex(item, lst):
+    numbers = lst.asRange() if type(lst) == SnapList else None
+    if numbers != None:
+        return numbers.index(item) + 1 if item in numbers else 0
+    for i, value in enumerate(lst):
+        if value == item:
+            return i + 1
+    return 0
+
+def reportCDR(lst):
+    if type(lst) == SnapList:
+        return lst.cdr()
+    return SnapList(lst[1:])
+
+def reportListItem(index, lst):
+    position = listIndex(index, lst)
+    return lst[position] if position != None else ''
+
+def doDeleteFromList(index, lst):
+    if index == 'all':
+        lst.clear()
+        return
+    position = listIndex(index, lst)
+    if position != None:
+        del lst[position]
+
+def doInsertInList(item, index, lst):
+    if index == 'last':
+        lst.append(item)
+        return
+    position = listIndex(index, lst, 1)
+    if position != None:
+        lst.insert(position, item)
+
+def doReplaceInList(index, lst, item):
+    position = listIndex(index, lst)
+    if position != None:
+        lst[position] = item
+
+# Lists made by blocks are SnapLists; the others take Python lists as well.
+registerPrimitive('reportNewList', lambda *items: SnapList(items))
+registerPrimitive('reportNumbers', lambda start, stop: SnapList.fromRange(reportNumbers(start, stop)))
+registerPrimitive('reportCONS', SnapList.cons)
+registerPrimitive('reportListItem', reportListItem)
+registerPrimitive('reportCDR', reportCDR)
+registerPrimitive('reportListLength', len)
+registerPrimitive('reportListIndex', reportListIndex)
+registerPrimitive('reportListContainsItem', lambda lst, item: item in lst, 'predicate')
+registerPrimitive('reportListIsEmpty', lambda lst: not lst, 'predicate')
+registerPrimitive('reportConcatenatedLists', lambda *lists: SnapList([item for lst in lists for item in lst]))
+registerPrimitive('doAddToList', lambda item, lst: lst.append(item), 'command')
+registerPrimitive('doDeleteFromList', doDeleteFromList, 'command')
+registerPrimitive('doInsertInList', doInsertInList, 'command')
+registerPrimitive('doReplaceInList', doReplaceInList, 'command')
+
+@registerPrimitive('doForEach', kind='command', special=True)
+def doForEach(executor, block : Block, scope : {}):
+    variableName = executor.evaluate(block.inputs[0], scope)
+    for item in executor.evaluate(block.inputs[1], scope):
+        scope[variableName] = item
+        executor.variableChanged(variableName)
+        executor.executeScript(block.inputs[2], scope)
+
+'''
+Higher Order List Blocks
+    map, keep, find first and combine compile their ring once per call
+    instead of dispatching its body for every item. A map or keep whose
+    list comes straight from another map or keep runs as one pipeline
+    with it, so the list between them is never built, and the map and
+    keep stages at the start of a pipeline run as a single NumPy pass
+    when their rings are arithmetic or predicates over their item.
+'''
+
+# Lists shorter than this are not worth a NumPy pass.
+VECTOR_MINIMUM = 64
+
+@functools.lru_cache(maxsize=1024)
+def implicitParameters(body : Any, count : int) -> (Any, [str]):
+    '''
+    Snap's implicit parameters: a ring without formal parameters gets
+    its arguments in its empty input slots. One argument fills every
+    empty slot and as many arguments as there are empty slots fill them
+    in order; otherwise the arguments are dropped. Returns the body with
+    the slots filled by parameters #1, #2, ... and their names.
+    Empty slots in nested rings belong to those rings.
+    '''
+    slots = []
+
+    def fill(value):
+        if value == None or value == '':
+            slots.append(None)
+            return Variable(f'#{len(slots) if count > 1 else 1}')
+        elif type(value) == Block and not value.signature.startswith('reify'):
+            return Block(value.signature, [fill(inp) for inp in value.inputs])
+        elif type(value) == list:
+            return [fill(item) for item in value]
+        return value
+
+    filled = fill(body)
+    if slots and (count == 1 or len(slots) == count):
+        return filled, [f'#{i + 1}' for i in range(count)]
+    return body, []
+
+def ringBody(ring : Ring, count : int) -> (Any, [str]):
+    '''
+    The reporter a ring runs and the names its first count arguments
+    are bound to.
+    '''
+    if type(ring) != Ring or ring.kind == 'command':
+        raise ValueError(f'{ring} is not a reporter ring!')
+    blocks = scriptBlocks(ring.body)
+    body = blocks[0] if blocks else None
+    if ring.parameters:
+        return body, ring.parameters[:count]
+    return implicitParameters(body, count)
+
+def ringFunction(executor, ring : Ring, count : int):
+    '''
+    Compiles a reporter or predicate ring into a Python function of
+    count arguments. A body that is one plain primitive applied to the
+    parameters in order, like ( ) + ( ), is just the primitive's handler.
+    '''
+    body, parameters = ringBody(ring, count)
+    if type(body) == Block and body.signature in executor.primitives and len(parameters) == count:
+        primitive = executor.primitives.lookup(body.signature)
+        if not primitive.special and body.inputs == [Variable(name) for name in parameters]:
+            return primitive.handler
+
+    compiled = executor.compile(body)
+    scope = dict(ring.scope)
+    # Rings made by the body keep the scope they were made in, and a ReporterCache keys
+    # results on the scope they ran in, so then each call needs its own scope.
+    fresh = any(type(node) == Block and node.signature.startswith('reify') for node in blockNodes(body))
+
+    def call(*arguments):
+        callScope = dict(scope) if fresh or executor.memo != None else scope
+        for name, argument in zip(parameters, arguments):
+            callScope[name] = argument
+        try:
+            return compiled(callScope)
+        except StopScript as stop:
+            return stop.value
+
+    return call
+
+def blockNodes(value : Any):
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        yield value
+        if type(value) == Block:
+            stack.extend(value.inputs)
+        elif type(value) == list:
+            stack.extend(value)
+
+def ringArity(ring : Ring) -> int:
+    '''
+    How many of item, index and list a map or keep passes its ring:
+    Snap passes the index and the list only to rings asking for them.
+    '''
+    return min(max(len(ring.parameters), 1), 3) if type(ring) == Ring else 1
+
+def runStages(executor, stages : [(str, Ring)], items : Any):
+    '''
+    Runs map and keep stages over items, first to last, and returns
+    the result as an iterable. The stages at the start run as NumPy
+    passes for as long as they can; the rest are chained iterators,
+    so no list is built between them. A stage whose ring takes the
+    index or the list gets everything before it built into a list.
+    '''
+    mapRing = None
+    if stages and len(items) >= VECTOR_MINIMUM:
+        try:
+            # NumPy is only needed for the vectorized pass.
+            from Vectorized import mapRing, ringArray
+        except ImportError:
+            pass
+
+    array = ringArray(items) if mapRing != None else None
+    # NumPy arrays compare elementwise, so they are checked against None by identity.
+    for signature, ring in stages:
+        count = ringArity(ring)
+        if array is not None and count == 1:
+            body, parameters = ringBody(ring, 1)
+            result = mapRing(executor, body, parameters[0], array, ring.scope) if parameters else None
+            if result is not None:
+                array = result if signature == 'reportMap' else array[result.astype(bool)]
+                if array.dtype.kind not in 'if':
+                    items, array = array.tolist(), None
+                continue
+        if array is not None:
+            items, array = array.tolist(), None
+
+        function = ringFunction(executor, ring, count)
+        if count > 1:
+            items = items if type(items) in (list, SnapList) else SnapList(items)
+            arguments = [(item, index) for index, item in enumerate(items, 1)]
+            if count == 3:
+                arguments = [(item, index, items) for item, index in arguments]
+            if signature == 'reportMap':
+                items = [function(*argument) for argument in arguments]
+            else:
+                items = [argument[0] for argument in arguments if function(*argument)]
+        elif signature == 'reportMap':
+            items = map(function, items)
+        else:
+            items = filter(function, items)
+    return array.tolist() if array is not None else items
+
+def listPipeline(executor, block : Block, scope : {}, listInput : int):
+    '''
+    Evaluates the ring of a higher order block and the list it works
+    on. While that list is itself a map or keep block, its ring is
+    evaluated too and the block becomes a stage of the pipeline.
+    Returns (ring, stages, items) with the stages innermost first.
+    '''
+    ring = executor.evaluate(block.inputs[1 - listInput], scope)
+    stages = []
+    node = block.inputs[listInput]
+    lookup = executor.primitives.lookup
+    while type(node) == Block and node.signature in ('reportMap', 'reportKeep') and \
+          lookup(node.signature) is PRIMITIVES.lookup(node.signature):
+        stages.append((node.signature, executor.evaluate(node.inputs[0], scope)))
+        node = node.inputs[1]
+    stages.reverse()
+    return ring, stages, executor.evaluate(node, scope)
+
+@registerPrimitive('reportMap', special=True)
+@registerPrimitive('reportKeep', special=True)
+def reportMapOrKeep(executor, block : Block, scope : {}):
+    ring, stages, items = listPipeline(executor, block, scope, 1)
+    return SnapList(runStages(executor, stages + [(block.signature, ring)], items))
+
+@registerPrimitive('reportFindFirst', special=True)
+def reportFindFirst(executor, block : Block, scope : {}):
+    ring, stages, items = listPipeline(executor, block, scope, 1)
+    count = ringArity(ring)
+    if count > 1:
+        items = runStages(executor, stages, items)
+        items = items if type(items) in (list, SnapList) else SnapList(items)
+        function = ringFunction(executor, ring, count)
+        for index, item in enumerate(items, 1):
+            if function(*(item, index, items)[:count]):
+                return item
+        return ''
+    return next(filter(ringFunction(executor, ring, 1), runStages(executor, stages, items)), '')
+
+@registerPrimitive('reportCombine', special=True)
+def reportCombine(executor, block : Block, scope : {}):
+    ring, stages, items = listPipeline(executor, block, scope, 0)
+    items = iter(runStages(executor, stages, items))
+    for first in items:
+        return functools.reduce(ringFunction(executor, ring, 2), items, first)
+    return ''
+
+'''
+Control Blocks
+'''
+
+# Hat blocks only mark where a script starts, so running one does nothing.
+for signature in ['receiveGo', 'receiveKey', 'receiveInteraction',
+                  'receiveCondition', 'receiveMessage', 'receiveOnClone']:
+    registerPrimitive(signature, lambda *inputs: None, 'hat')
+
+@registerPrimitive('doIf', kind='command', special=True)
+def doIf(executor, block : Block, scope : {}):
+    if executor.evaluate(block.inputs[0], scope):
+        executor.executeScript(block.inputs[1], scope)
+
+@registerPrimitive('doIfElse', kind='command', special=True)
+def doIfElse(executor, block : Block, scope : {}):
+    if executor.evaluate(block.inputs[0], scope):
+        executor.executeScript(block.inputs[1], scope)
+    else:
+        executor.executeScript(block.inputs[2], scope)
+
+@registerPrimitive('reportIfElse', special=True)
+def reportIfElse(executor, block : Block, scope : {}):
+    if executor.evaluate(block.inputs[0], scope):
+        return executor.evaluate(block.inputs[1], scope)
+    return executor.evaluate(block.inputs[2], scope)
+
+@registerPrimitive('doRepeat', kind='command', special=True)
+def doRepeat(executor, block : Block, scope : {}):
+    for i in range(int(executor.evaluate(block.inputs[0], scope))):
+        executor.executeScript(block.inputs[1], scope)
+
+@registerPrimitive('doFor', kind='command', special=True)
+def doFor(executor, block : Block, scope : {}):
+    variableName = executor.evaluate(block.inputs[0], scope)
+    start = executor.evaluate(block.inputs[1], scope)
+    stop = executor.evaluate(block.inputs[2], scope)
+    for i in reportNumbers(start, stop):
+        scope[variableName] = i
+        executor.variableChanged(variableName)
+        executor.executeScript(block.inputs[3], scope)
+
+@registerPrimitive('doForever', kind='command', special=True)
+def doForever(executor, block : Block, scope : {}):
+    while True:
+        executor.executeScript(block.inputs[0], scope)
+
+@registerPrimitive('doWarp', kind='command', special=True)
+def doWarp(executor, block : Block, scope : {}):
+    executor.executeScript(block.inputs[0], scope)
+
+registerPrimitive('doWait', time.sleep, 'command')
+
+@registerPrimitive('doWaitUntil', kind='command', special=True)
+def doWaitUntil(executor, block : Block, scope : {}):
+    while not executor.evaluate(block.inputs[0], scope):
+        pass
+
+@registerPrimitive('doReport', kind='command', special=True)
+def doReport(executor, block : Block, scope : {}):
+    raise StopScript(executor.evaluate(block.inputs[0], scope))
+
+@registerPrimitive('doStopThis', kind='command')
+def doStopThis(option):
+    if option == 'all':
+        raise StopAll()
+    raise StopScript()
+
+def callRing(executor, block : Block, scope : {}):
+    ring = executor.evaluate(block.inputs[0], scope)
+    arguments = listArguments([executor.evaluate(inp, scope) for inp in block.inputs[1:]])
+    return executor.callRing(ring, arguments)
+
+registerPrimitive('doRun', callRing, 'command', special=True)
+registerPrimitive('evaluate', callRing, special=True)
+
+@registerPrimitive('fork', kind='command', special=True)
+def fork(executor, block : Block, scope : {}):
+    if executor.thread == None:
+        # Outside the Scheduler a launched script runs to completion straight away.
+        callRing(executor, block, scope)
+        return
+    ring = executor.evaluate(block.inputs[0], scope)
+    arguments = listArguments([executor.evaluate(inp, scope) for inp in block.inputs[1:]])
+    executor.project.scheduler.startRing(ring, arguments, executor.sprite)
+
+def askSprite(executor, block : Block, scope : {}):
+    sprite = executor.project.getSprite(executor.evaluate(block.inputs[0], scope))
+    ring = executor.evaluate(block.inputs[1], scope)
+    arguments = listArguments([executor.evaluate(inp, scope) for inp in block.inputs[2:]])
+    return executor.callRing(ring, arguments, sprite)
+
+registerPrimitive('doTellTo', askSprite, 'command', special=True)
+registerPrimitive('reportAskFor', askSprite, special=True)
+
+@registerPrimitive('doBroadcast', kind='command', special=True)
+def doBroadcast(executor, block : Block, scope : {}):
+    executor.project.broadcast(executor.evaluate(block.inputs[0], scope))
+
+registerPrimitive('doBroadcastAndWait', doBroadcast, 'command', special=True)
+
+@registerThreaded('doBroadcastAndWait')
+def doBroadcastAndWaitThreaded(executor, block : Block, scope : {}):
+    threads = executor.project.scheduler.broadcast(executor.evaluate(block.inputs[0], scope))
+    while not all(thread.done for thread in threads):
+        yield
+
+@registerPrimitive('doSend', kind='command', special=True)
+def doSend(executor, block : Block, scope : {}):
+    message = executor.evaluate(block.inputs[0], scope)
+    sprite = executor.project.getSprite(executor.evaluate(block.inputs[1], scope))
+    executor.project.broadcast(message, sprite)
+
+@registerPrimitive('getLastMessage', special=True)
+def getLastMessage(executor, block : Block, scope : {}):
+    return executor.project.lastMessage
+
+def cloneTarget(executor, name : str):
+    if name == 'myself':
+        return executor.currentSprite()
+    return executor.project.getSprite(name)
+
+@registerPrimitive('createClone', kind='command', special=True)
+def createClone(executor, block : Block, scope : {}):
+    executor.project.createClone(cloneTarget(executor, executor.evaluate(block.inputs[0], scope)))
+
+@registerPrimitive('newClone', special=True)
+def newClone(executor, block : Block, scope : {}):
+    return executor.project.createClone(cloneTarget(executor, executor.evaluate(block.inputs[0], scope)))
+
+@registerPrimitive('removeClone', kind='command', special=True)
+def removeClone(executor, block : Block, scope : {}):
+    sprite = executor.currentSprite()
+    if sprite.exemplar != None:
+        executor.project.removeClone(sprite)
+        raise StopScript()
+
+'''
+Threaded Control Blocks
+    What the control blocks do in a Scheduler thread. Loops yield at
+    the end of every iteration and waits yield until they are over,
+    so other threads get to run. doWarp has no threaded version, so
+    everything inside it runs without yielding.
+'''
+
+@registerThreaded('doIf')
+def doIfThreaded(executor, block : Block, scope : {}):
+    if executor.evaluate(block.inputs[0], scope):
+        yield from executor.threadScript(block.inputs[1], scope)
+
+@registerThreaded('doIfElse')
+def doIfElseThreaded(executor, block : Block, scope : {}):
+    if executor.evaluate(block.inputs[0], scope):
+        yield from executor.threadScript(block.inputs[1], scope)
+    else:
+        yield from executor.threadScript(block.inputs[2], scope)
+
+@registerThreaded('doRepeat')
+def doRepeatThreaded(executor, block : Block, scope : {}):
+    for i in range(int(executor.evaluate(block.inputs[0], scope))):
+        yield from executor.threadScript(block.inputs[1], scope)
+        yield
+
+@registerThreaded('doFor')
+def doForThreaded(executor, block : Block, scope : {}):
+    variableName = executor.evaluate(block.inputs[0], scope)
+    start = executor.evaluate(block.inputs[1], scope)
+    stop = executor.evaluate(block.inputs[2], scope)
+    for i in reportNumbers(start, stop):
+        scope[variableName] = i
+        executor.variableChanged(variableName)
+        yield from executor.threadScript(block.inputs[3], scope)
+        yield
+
+@registerThreaded('doForever')
+def doForeverThreaded(executor, block : Block, scope : {}):
+    while True:
+        yield from executor.threadScript(block.inputs[0], scope)
+        yield
+
+@registerThreaded('doWait')
+def doWaitThreaded(executor, block : Block, scope : {}):
+    clock = executor.project.scheduler.clock
+    end = clock() + executor.evaluate(block.inputs[0], scope)
+    # Even a wait of 0 seconds lets the other threads run once.
+    yield
+    while clock() < end:
+        yield
+
+@registerThreaded('doWaitUntil')
+def doWaitUntilThreaded(executor, block : Block, scope : {}):
+    while not executor.evaluate(block.inputs[0], scope):
+        yield
+
+'''
+Motion Blocks
+'''
+
+def normalizeHeading(degrees):
+    return ((degrees % 360) + 360) % 360
+
+def setPosition(sprite, x, y):
+    sprite.coords = x, y
+    if sprite.spatialIndex != None:
+        sprite.spatialIndex.update(sprite, (x, y))
+
+def forward(sprite, steps):
+    x, y = sprite.coords
+    radians = math.radians(sprite.heading)
+    setPosition(sprite, x + steps * math.sin(radians), y + steps * math.cos(radians))
+
+def pointTowards(sprite, x, y):
+    spriteX, spriteY = sprite.coords
+    if (x, y) != (spriteX, spriteY):
+        sprite.heading = normalizeHeading(math.degrees(math.atan2(x - spriteX, y - spriteY)))
+
+def bounceOffEdge(sprite, width, height):
+    '''
+    Treats the sprite as a point and reflects its heading off
+    any edge of the stage it has crossed.
+    '''
+    x, y = sprite.coords
+    right, top = width / 2, height / 2
+    if x > right or x < -right:
+        x = max(-right, min(right, x))
+        sprite.heading = normalizeHeading(-sprite.heading)
+    if y > top or y < -top:
+        y = max(-top, min(top, y))
+        sprite.heading = normalizeHeading(180 - sprite.heading)
+    setPosition(sprite, x, y)
+
+def objectPosition(executor, option : str):
+    '''
+    Resolves the option of goto and point towards into coordinates.
+    '''
+    project = executor.project
+    if option == 'center':
+        return 0, 0
+    elif option == 'mouse-pointer':
+        return project.mousePosition
+    elif option == 'random position':
+        return (random.uniform(-project.stageWidth / 2, project.stageWidth / 2),
+                random.uniform(-project.stageHeight / 2, project.stageHeight / 2))
+    return project.getSprite(option).coords
+
+def motionPrimitive(signature : str, move, kind : str = 'command'):
+    '''
+    Registers a motion or sensing block, which acts on the sprite running it.
+    '''
+    def handler(executor, block : Block, scope : {}):
+        inputs = [executor.evaluate(inp, scope) for inp in block.inputs]
+        return move(executor, executor.currentSprite(), *inputs)
+    registerPrimitive(signature, handler, kind, special=True)
+
+motionPrimitive('forward', lambda executor, sprite, steps: forward(sprite, steps))
+motionPrimitive('turn', lambda executor, sprite, degrees:
+    setattr(sprite, 'heading', normalizeHeading(sprite.heading + degrees)))
+motionPrimitive('turnLeft', lambda executor, sprite, degrees:
+    setattr(sprite, 'heading', normalizeHeading(sprite.heading - degrees)))
+motionPrimitive('setHeading', lambda executor, sprite, degrees:
+    setattr(sprite, 'heading', normalizeHeading(degrees)))
+motionPrimitive('doFaceTowards', lambda executor, sprite, option:
+    pointTowards(sprite, *objectPosition(executor, option)))
+motionPrimitive('gotoXY', lambda executor, sprite, x, y: setPosition(sprite, x, y))
+motionPrimitive('doGotoObject', lambda executor, sprite, option:
+    setPosition(sprite, *objectPosition(executor, option)))
+motionPrimitive('changeXPosition', lambda executor, sprite, steps:
+    setPosition(sprite, sprite.coords[0] + steps, sprite.coords[1]))
+motionPrimitive('setXPosition', lambda executor, sprite, x: setPosition(sprite, x, sprite.coords[1]))
+motionPrimitive('changeYPosition', lambda executor, sprite, steps:
+    setPosition(sprite, sprite.coords[0], sprite.coords[1] + steps))
+motionPrimitive('setYPosition', lambda executor, sprite, y: setPosition(sprite, sprite.coords[0], y))
+motionPrimitive('bounceOffEdge', lambda executor, sprite:
+    bounceOffEdge(sprite, executor.project.stageWidth, executor.project.stageHeight))
+motionPrimitive('xPosition', lambda executor, sprite: sprite.coords[0], 'reporter')
+motionPrimitive('yPosition', lambda executor, sprite: sprite.coords[1], 'reporter')
+motionPrimitive('direction', lambda executor, sprite: sprite.heading, 'reporter')
+
+def doGlide(executor, sprite, seconds, x, y):
+    time.sleep(seconds)
+    setPosition(sprite, x, y)
+
+motionPrimitive('doGlide', doGlide)
+
+'''
+Sensing Blocks
+    Touching another sprite goes through the project's SpatialIndex,
+    which the first such query creates.
+'''
+
+def spriteBounds(sprite):
+    (x, y), radius = sprite.coords, spriteRadius(sprite)
+    return x - radius, y - radius, x + radius, y + radius
+
+def touchingObject(executor, sprite, option : str) -> bool:
+    project = executor.project
+    if option == 'edge':
+        left, bottom, right, top = spriteBounds(sprite)
+        return left < -project.stageWidth / 2 or right > project.stageWidth / 2 or \
+            bottom < -project.stageHeight / 2 or top > project.stageHeight / 2
+    elif option == 'mouse-pointer':
+        left, bottom, right, top = spriteBounds(sprite)
+        x, y = project.mousePosition
+        return not sprite.hidden and left <= x <= right and bottom <= y <= top
+    return project.enableSpatialIndex().touching(sprite, option)
+
+def distanceTo(executor, sprite, option : str) -> float:
+    x, y = sprite.coords
+    otherX, otherY = objectPosition(executor, option)
+    return math.hypot(otherX - x, otherY - y)
+
+motionPrimitive('reportTouchingObject', touchingObject, 'predicate')
+motionPrimitive('reportDistanceTo', distanceTo, 'reporter')
@@ -0,0 +1,177 @@
+from Block import *
+from typing import Any
+import time
+
+class BlockProfiler:
+    '''
+    Records how long an Executor spends in each kind of block.
+        Calls, cumulative time and self time are kept per block
+        signature, with reportMonadic split by its option, and per
+        sprite and script that ran the block. Cumulative time counts a
+        block once even if it nests inside itself; self time leaves out
+        the blocks evaluated for it.
+
+    Installing the profiler shadows evaluate and runScript on the one
+    Executor it watches, so when it is not installed the Executor runs
+    its ordinary methods, with no hooks left to check. Compiled closures
+    and the memo cache are not profiled; while the profiler is installed
+    every block is run, even if its result was cached.
+    '''
+
+    def __init__(self, executor, clock = time.perf_counter_ns):
+        self.executor = executor
+        self.clock = clock
+        # (sprite, script, block) mapped to [calls, cumulative ns, self ns].
+        self.blocks = {}
+        # Folded stacks, sprite and script first, mapped to self ns.
+        self.stacks = {}
+        self.stack = []
+        # The time spent in the blocks evaluated by each block on the stack.
+        self.childTimes = []
+        self.active = {}
+        self.script = None
+        self.scriptLabels = {}
+
+    def install(self):
+        self.executor.evaluate = self.evaluate
+        self.executor.runScript = self.runScript
+
+    def uninstall(self):
+        del self.executor.evaluate
+        del self.executor.runScript
+
+    def clear(self):
+        self.blocks.clear()
+        self.stacks.clear()
+
+    def runScript(self, script : Script):
+        previousScript = self.script
+        self.script = script
+        try:
+            return type(self.executor).runScript(self.executor, script)
+        finally:
+            self.script = previousScript
+
+    def evaluate(self, value : Any, scope : {} = None):
+        executor = self.executor
+        if type(value) != Block:
+            return type(executor).evaluate(executor, value, scope)
+        if scope == None:
+            scope = executor.project.globalVariables
+
+        block = value
+        if block.signature == 'reportMonadic':
+            option = self.evaluate(block.inputs[0], scope)
+            name = f'reportMonadic:{option}'
+        else:
+            primitive = executor.primitives.lookup(block.signature)
+            name = block.signature
+
+        if not self.stack:
+            self.stack.extend(self.owner())
+        self.stack.append(name)
+        key = (self.stack[0], self.stack[1], name)
+        self.active[key] = self.active.get(key, 0) + 1
+        self.childTimes.append(0)
+        start = self.clock()
+        try:
+            if block.signature == 'reportMonadic':
+                return executor.applyMonadic(option, self.evaluate(block.inputs[1], scope))
+            elif primitive.special:
+                return primitive.handler(executor, block, scope)
+            return primitive.handler(*[self.evaluate(inp, scope) for inp in block.inputs])
+        finally:
+            elapsed = self.clock() - start
+            selfTime = elapsed - self.childTimes.pop()
+            if self.childTimes:
+                self.childTimes[-1] += elapsed
+            self.active[key] -= 1
+
+            record = self.blocks.get(key)
+            if record == None:
+                record = self.blocks[key] = [0, 0, 0]
+            record[0] += 1
+            if self.active[key] == 0:
+                record[1] += elapsed
+            record[2] += selfTime
+            path = tuple(self.stack)
+            self.stacks[path] = self.stacks.get(path, 0) + selfTime
+
+            self.stack.pop()
+            if len(self.stack) == 2:
+                self.stack.clear()
+
+    def owner(self) -> (str, str):
+        '''
+        The sprite and script the blocks being run belong to.
+        '''
+        executor = self.executor
+        sprite = executor.sprite
+        script = executor.thread.script if executor.thread != None else self.script
+        spriteName = getattr(sprite, 'name', 'stage') if sprite != None else 'project'
+        return (spriteName, self.scriptLabel(script))
+
+    def scriptLabel(self, script : Script) -> str:
+        '''
+        Names a script by its hat block and its place in the project,
+        like receiveGo#3.
+        '''
+        if script == None:
+            return 'no script'
+        if script not in self.scriptLabels:
+            blocks = script.blocks
+            label = blocks[0].signature if blocks and type(blocks[0]) == Block else 'script'
+            for index, projectScript in enumerate(self.executor.project.scripts):
+                if projectScript is script:
+                    label += f'#{index}'
+                    break
+            self.scriptLabels[script] = label
+        return self.scriptLabels[script]
+
+    def totals(self, group : str = 'block') -> {tuple : [int]}:
+        '''
+        Calls, cumulative and self ns, summed by block, by script as
+        (sprite, script), or by all three as (sprite, script, block).
+        '''
+        if group == 'all':
+            return {key : list(record) for key, record in self.blocks.items()}
+        totals = {}
+        for (sprite, script, name), record in self.blocks.items():
+            key = (name,) if group == 'block' else (sprite, script)
+            total = totals.setdefault(key, [0, 0, 0])
+            total[0] += record[0]
+            # Cumulative time of blocks does not add up across nesting, so scripts only sum self time.
+            total[1] += record[1] if group == 'block' else record[2]
+            total[2] += record[2]
+        return totals
+
+    def top(self, count : int = 20, group : str = 'block', sort : str = 'self') -> [(tuple, [int])]:
+        column = {'calls' : 0, 'cumulative' : 1, 'self' : 2}[sort]
+        return sorted(self.totals(group).items(), key=lambda item: item[1][column], reverse=True)[:count]
+
+    def table(self, count : int = 20, group : str = 'block', sort : str = 'self') -> str:
+        '''
+        The top count rows as a text table, with times in ms.
+        '''
+        rows = [(' '.join(key), *record) for key, record in self.top(count, group, sort)]
+        width = max([len(row[0]) for row in rows] + [len(group)])
+        lines = [f'{group:<{width}}{"calls":>10}{"cumulative (ms)":>17}{"self (ms)":>12}']
+        for name, calls, cumulative, selfTime in rows:
+            lines.append(f'{name:<{width}}{calls:>10}{cumulative / 1e6:>17.3f}{selfTime / 1e6:>12.3f}')
+        return '\n'.join(lines)
+
+    def foldedStacks(self) -> [str]:
+        '''
+        Self time in microseconds per stack, one "frame;frame;... count"
+        line each, as flamegraph.pl and speedscope read them.
+        '''
+        lines = []
+        for path, nanoseconds in self.stacks.items():
+            microseconds = nanoseconds // 1000
+            if microseconds > 0:
+                lines.append(';'.join(frame.replace(';', ',') for frame in path) + f' {microseconds}')
+        return lines
+
+    def writeFolded(self, stream):
+        for line in self.foldedStacks():
+            stream.write(line + '\n')
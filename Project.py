@@ -1,19 +1,67 @@
 from SnapBlocks import *
-from Block import Script
+from Block import Script, NodeTable, elementToScript, formatXMLInputs, formatLiteral, RECURSION_DEPTH, PENDING
+from Visuals import Stage, Sprite, Costume
+from Media import MediaSource
+from Primitives import PRIMITIVES, PrimitiveRegistry, Ring, StopScript, StopAll, scriptBlocks, ringBody, reportIfElse
+from Memoization import ReporterCache
+from Scopes import SlotCompiler
+from Profiling import BlockProfiler
+from Hats import HatIndex, ScriptList
+from Lists import SnapList
 from typing import Any
-import random
-import math
+import xml.etree.ElementTree as ET
+import copy
+import time
 
 class Project:
 
-    def __init__(self):
+    def __init__(self, primitives : PrimitiveRegistry = None):
         self.globalVariables = {}
-        self.executor = Executor(self)
+        self.executor = Executor(self, primitives)
+        self.scheduler = Scheduler(self)
+        self.hats = HatIndex(self.executor)
         self.scripts = []
+        self.sprites = {}
+        self.stageWidth = 480
+        self.stageHeight = 360
+        self.mousePosition = 0, 0
+        self.lastMessage = ''
+        self.name = ''
+        self.notes = ''
+        self.stage = None
+        self.thumbnail = None
+        # Set by enableSpriteStore and enableSpatialIndex.
+        self.spriteStore = None
+        self.spatialIndex = None
+
+    @classmethod
+    def load(cls, source, table : NodeTable = None) -> 'Project':
+        '''
+        Loads a Snap project file, given as a path or a binary
+        file object, into a new Project. Given a NodeTable, identical
+        blocks across all scripts share one object.
+        '''
+        project = cls()
+        ProjectLoader(project, table).load(source)
+        return project
+
+    @property
+    def scripts(self) -> ScriptList:
+        '''
+        Every script in the project, as a ScriptList that keeps
+        self.hats up to date. Assigning a list replaces them all.
+        '''
+        return self.scriptList
+
+    @scripts.setter
+    def scripts(self, scripts : [Script]):
+        if scripts is not getattr(self, 'scriptList', None):
+            self.scriptList = ScriptList(scripts, self.hats)
 
     def addGlobalVariable(self, variableName):
         if variableName not in self.globalVariables:
             self.globalVariables[variableName] = None
+            self.executor.variableChanged(variableName)
         else:
             raise ValueError(f'{variableName} already exists as a global variable!')
 
@@ -22,6 +70,7 @@ class Project:
             raise ValueError(f'{variableName} is not a global variable')
         else:
             self.globalVariables[variableName] = value
+            self.executor.variableChanged(variableName)
     
     def getGlobalVariable(self, variableName : str):
         if variableName not in self.globalVariables:
@@ -29,20 +78,393 @@ class Project:
         else:
             return self.globalVariables[variableName]
 
+    def getSprite(self, name : str):
+        if name not in self.sprites:
+            raise ValueError(f'{name} is not a sprite!')
+        return self.sprites[name]
+
     def evaluate(self, block : Block):
         return self.executor.evaluate(block)
 
+    def broadcast(self, message : str, sprite = None):
+        '''
+        Runs every script whose hat block receives message,
+        or only the scripts of sprite when one is given.
+        Inside a Scheduler thread the scripts are started as
+        threads of their own, which this returns.
+        '''
+        if self.executor.thread != None:
+            return self.scheduler.broadcast(message, sprite)
+        self.lastMessage = message
+        for script in self.hats.receivers('receiveMessage', message, sprite):
+            self.executor.runScript(script)
+
+    def enableSpriteStore(self, capacity : int = 1024):
+        '''
+        Keeps the clones made from now on in a SpriteStore, so that
+        thousands of them can run their motion scripts as vectorized
+        updates. Needs NumPy.
+        '''
+        from SpriteStore import SpriteStore
+        if self.spriteStore == None:
+            self.spriteStore = SpriteStore(self, capacity)
+        return self.spriteStore
+
+    def enableSpatialIndex(self, cellSize : float = 64):
+        '''
+        Puts every sprite and clone in a SpatialIndex for the sensing
+        blocks, and every clone made from now on.
+        '''
+        from SpatialIndex import SpatialIndex
+        if self.spatialIndex == None:
+            self.spatialIndex = SpatialIndex(cellSize)
+            for sprite in self.sprites.values():
+                self.spatialIndex.add(sprite)
+            for script in self.scripts:
+                if getattr(script.sprite, 'exemplar', None) != None and script.sprite not in self.spatialIndex:
+                    self.spatialIndex.add(script.sprite)
+        return self.spatialIndex
+
+    def createClone(self, sprite):
+        '''
+        Creates a clone of sprite sharing its scripts, then runs the
+        clone's "when I start as a clone" scripts. With a SpriteStore
+        the clone is a StoredSprite.
+        '''
+        clone = self.spriteStore.clone(sprite) if self.spriteStore != None else copy.copy(sprite)
+        clone.exemplar = sprite
+        # Clones get their own copy of the sprite's variables.
+        clone.variables = dict(getattr(sprite, 'variables', {}))
+        # A loaded sprite and every clone list their own scripts, which saves scanning them all.
+        scripts = getattr(sprite, 'scripts', None)
+        if not scripts:
+            scripts = [script for script in self.scripts if script.sprite is sprite]
+        cloneScripts = [
+            Script(
+                script.blocks,
+                clone.variables if script.scope is getattr(sprite, 'variables', None) else dict(script.scope),
+                clone
+            )
+            for script in scripts
+        ]
+        clone.scripts = cloneScripts
+        self.scripts.extend(cloneScripts)
+        if self.spatialIndex != None:
+            self.spatialIndex.add(clone)
+        for script in cloneScripts:
+            if script.blocks and type(script.blocks[0]) == Block and \
+               script.blocks[0].signature == 'receiveOnClone':
+                if self.executor.thread != None:
+                    self.scheduler.start(script)
+                else:
+                    self.executor.runScript(script)
+        return clone
+
+    def removeClone(self, clone):
+        '''
+        Removes a clone's scripts and stops their threads.
+        '''
+        threads = self.scheduler.scriptThreads
+        for script in getattr(clone, 'scripts', ()):
+            if script in threads:
+                self.scheduler.finish(threads[script])
+            try:
+                self.scripts.remove(script)
+            except ValueError:
+                # Already removed from the project by hand.
+                continue
+        if getattr(clone, 'store', None) != None:
+            clone.store.remove(clone)
+        if getattr(clone, 'spatialIndex', None) != None:
+            clone.spatialIndex.remove(clone)
+
+class ScriptThread:
+    '''
+    A script running in a Scheduler.
+        Steps: the generator that runs the script, from Executor.threadScript.
+
+        Done: set once the script has ended or been stopped.
+    '''
+
+    __slots__ = ('script', 'sprite', 'steps', 'done')
+
+    def __init__(self, script, sprite, steps):
+        self.script = script
+        self.sprite = sprite
+        self.steps = steps
+        self.done = False
+
+class Scheduler:
+    '''
+    Runs scripts as cooperative green threads, the way Snap does.
+    Every frame, step resumes each thread once and the thread runs
+    until it yields: loops yield at the end of every iteration and
+    waits yield until they are over. Threads started during a frame
+    first run in the next one.
+        Clock: the time source of doWait, in seconds.
+
+    A thread is a generator, so a yield costs a generator resume
+    rather than a context switch, and thousands of threads can be
+    stepped every frame.
+    '''
+
+    def __init__(self, project, clock = time.monotonic):
+        self.project = project
+        self.clock = clock
+        self.threads = []
+        self.started = []
+        # The thread of each script, so that firing its hat again restarts it.
+        self.scriptThreads = {}
+        self.frames = 0
+
+    def start(self, script : Script, scope : {} = None, sprite = None) -> ScriptThread:
+        '''
+        Starts a thread running script, as its own sprite and in its
+        own scope unless others are given. A script that is already
+        running is restarted, as in Snap.
+        '''
+        running = self.scriptThreads.get(script)
+        if running != None:
+            running.done = True
+        scope = scope if scope != None else script.scope
+        sprite = sprite if sprite != None else script.sprite
+        store = getattr(sprite, 'store', None)
+        body = store.swarmBody(script) if store != None else None
+        if body != None:
+            steps = store.swarmSteps(body, sprite)
+        else:
+            steps = self.project.executor.threadScript(script, scope)
+        thread = ScriptThread(script, sprite, steps)
+        self.scriptThreads[script] = thread
+        self.started.append(thread)
+        return thread
+
+    def startRing(self, ring : Ring, arguments : [] = [], sprite = None) -> ScriptThread:
+        '''
+        Starts a thread running a command ring, as fork does.
+        '''
+        scope = dict(ring.scope)
+        for name, argument in zip(ring.parameters, arguments):
+            scope[name] = argument
+        thread = ScriptThread(None, sprite, self.project.executor.threadScript(ring.body, scope))
+        self.started.append(thread)
+        return thread
+
+    def startHats(self, signature : str, matches = None) -> [ScriptThread]:
+        '''
+        Starts every script whose hat block has signature and,
+        given matches, for which matches(hat, script) is true.
+        '''
+        threads = []
+        for script in self.project.hats.scripts(signature):
+            if matches == None or matches(script.blocks[0], script):
+                threads.append(self.start(script))
+        return threads
+
+    def greenFlag(self) -> [ScriptThread]:
+        return self.startHats('receiveGo')
+
+    def keyPressed(self, key : str) -> [ScriptThread]:
+        return [self.start(script) for script in self.project.hats.receivers('receiveKey', key)]
+
+    def broadcast(self, message : str, sprite = None) -> [ScriptThread]:
+        '''
+        Starts every script whose hat block receives message,
+        or only the scripts of sprite when one is given.
+        '''
+        self.project.lastMessage = message
+        return [self.start(script) for script in self.project.hats.receivers('receiveMessage', message, sprite)]
+
+    def step(self) -> int:
+        '''
+        Runs one frame and returns how many threads are left.
+        '''
+        executor = self.project.executor
+        previousSprite = executor.sprite
+        self.threads.extend(self.started)
+        self.started = []
+        running = []
+        try:
+            for thread in self.threads:
+                if thread.done:
+                    continue
+                executor.sprite = thread.sprite
+                executor.thread = thread
+                try:
+                    next(thread.steps)
+                    running.append(thread)
+                except (StopIteration, StopScript):
+                    self.finish(thread)
+        except StopAll:
+            self.stopAll()
+            running = []
+        finally:
+            executor.thread = None
+            executor.sprite = previousSprite
+            if self.project.spriteStore != None and self.project.spriteStore.rounds:
+                self.project.spriteStore.flush()
+        self.threads = running
+        self.frames += 1
+        return len(self.threads) + len(self.started)
+
+    def run(self, frames : int = None) -> int:
+        '''
+        Steps until every thread is done, or for at most frames
+        frames. Returns the number of frames run.
+        '''
+        count = 0
+        while (self.threads or self.started) and (frames == None or count < frames):
+            self.step()
+            count += 1
+        return count
+
+    def finish(self, thread : ScriptThread):
+        thread.done = True
+        if self.scriptThreads.get(thread.script) is thread:
+            del self.scriptThreads[thread.script]
+
+    def stopAll(self):
+        for thread in self.threads + self.started:
+            thread.done = True
+        self.threads = []
+        self.started = []
+        self.scriptThreads = {}
+
+class ProjectLoader:
+    '''
+    Streams a Snap project file into a Project. The file is read with
+    iterparse and every element is dropped from the tree as soon as it
+    has been converted, so memory use is bounded by the largest script
+    rather than by the size of the file. The thumbnail, pen trails and
+    costume images become MediaHandles on the source file; sounds are
+    skipped.
+    '''
+
+    def __init__(self, project : Project, table : NodeTable = None):
+        self.project = project
+        self.table = table
+        # The open elements, outermost first, and the sprite or stage being filled.
+        self.elements = []
+        self.owner = None
+        self.media = None
+
+    def load(self, source):
+        self.media = MediaSource(source)
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                self.elements.append(element)
+                self.start(element)
+                continue
+
+            self.elements.pop()
+            parent = self.elements[-1] if self.elements else None
+            if self.end(element, parent) or (parent != None and parent.tag in ('project', 'stage', 'sprite')):
+                # The element has been consumed; it is always the last child of its parent.
+                element.clear()
+                if parent != None:
+                    del parent[-1]
+
+    def start(self, element : ET.Element):
+        attributes = element.attrib
+        if element.tag == 'project':
+            self.project.name = attributes.get('name', '')
+
+        elif element.tag == 'stage':
+            self.project.stageWidth = formatLiteral(attributes.get('width', '480'))
+            self.project.stageHeight = formatLiteral(attributes.get('height', '360'))
+            self.owner = self.project.stage = Stage([], [], {}, [], [], [])
+
+        elif element.tag == 'sprite':
+            color = tuple(formatLiteral(value) for value in attributes.get('color', '0,0,0').split(','))
+            self.owner = Sprite(
+                attributes.get('name', ''), attributes.get('idx', ''),
+                formatLiteral(attributes.get('x', '0')), formatLiteral(attributes.get('y', '0')),
+                formatLiteral(attributes.get('heading', '90')), formatLiteral(attributes.get('scale', '1')),
+                formatLiteral(attributes.get('volume', '100')), formatLiteral(attributes.get('pan', '0')),
+                formatLiteral(attributes.get('rotation', '1')), attributes.get('draggable') == 'true',
+                attributes.get('hidden') == 'true', [], color[:3], attributes.get('pen', 'tip'),
+                formatLiteral(attributes.get('id', '0'))
+            )
+            self.project.sprites[self.owner.name] = self.owner
+            self.project.stage.sprites.append(self.owner)
+
+    def end(self, element : ET.Element, parent : ET.Element) -> bool:
+        '''
+        Converts a finished element, returning True if
+        it has been consumed and can be dropped.
+        '''
+        tag = element.tag
+        parentTag = parent.tag if parent != None else None
+        if tag == 'thumbnail':
+            self.project.thumbnail = self.media.nextText(tag, element.text)
+            return True
+
+        elif tag == 'pentrails':
+            self.project.stage.pentrails = self.media.nextText(tag, element.text)
+            return True
+
+        elif tag == 'sound':
+            return True
+
+        elif tag == 'notes' and parentTag == 'project':
+            self.project.notes = element.text or ''
+
+        elif tag == 'costume':
+            self.owner.costumes.append(Costume(
+                element.attrib.get('name', ''),
+                formatLiteral(element.attrib.get('center-x', '0')),
+                formatLiteral(element.attrib.get('center-y', '0')),
+                self.media.nextAttribute(tag, 'image', element.attrib.get('image'))
+            ))
+            return True
+
+        elif tag == 'script' and parentTag == 'scripts':
+            script = elementToScript(element, self.owner.variables, self.owner)
+            if self.table != None:
+                script = self.table.intern(script)
+            self.owner.scripts.append(script)
+            self.project.scripts.append(script)
+            return True
+
+        elif tag == 'variable' and parentTag == 'variables':
+            value = formatXMLInputs(element[0]) if len(element) else None
+            if self.elements[-2].tag == 'project':
+                self.project.globalVariables[element.attrib['name']] = value
+            else:
+                self.owner.variables[element.attrib['name']] = value
+            return True
+
+        elif tag == 'sprite':
+            self.owner = self.project.stage
+            return True
+
+        elif tag == 'block-definition':
+            # Custom block definitions are not modelled yet.
+            return True
+
+        return False
+
 class Executor:
     '''
     Class that handles the execution of scripts
-    in Snap. The 'how' so to speak.
+    in Snap. The 'how' so to speak. Every block is looked
+    up by its signature in a PrimitiveRegistry.
     '''
 
-    def __init__(self, project):
+    def __init__(self, project, primitives : PrimitiveRegistry = None):
         self.project = project
+        self.primitives = primitives if primitives != None else PRIMITIVES
+        # The sprite whose script is running, used by motion blocks.
+        self.sprite = None
+        # A ReporterCache once memoization is enabled.
+        self.memo = None
+        # The ScriptThread being stepped by the Scheduler, if any.
+        self.thread = None
+        # A BlockProfiler while profiling is enabled.
+        self.profiler = None
 
     def execute(self, block : Block, scope : {} = None):
-        self.handleVariables(block, scope)
+        self.evaluate(block, scope)
 
     def evaluate(self, value : Block, scope : {} = None):
         if scope == None:
@@ -57,139 +479,361 @@ class Executor:
             else:
                 return self.project.getGlobalVariable(variableName)
         elif type(value) == Block:
-            # and this one too.
-            if isOperator(value):
-                return self.handleOperator(value)
+            if self.memo != None:
+                return self.evaluateTree(value, scope)
+            return self.evaluateNested(value, scope, 0)
+        elif type(value) == list:
+            # List literals are copied, so the list reported can be changed without changing the block.
+            return SnapList.fromLiteral(value)
         else:
             return value
 
-    def handleOperator(self, block : Block):
-        signature = block.signature
-        inputs = [self.evaluate(inp) for inp in block.inputs]
-
-        if signature == 'reportSum':
-            return inputs[0] + inputs[1]
-        elif signature == 'reportDiff':
-            return inputs[0] - inputs[1]
-        elif signature == 'reportProduct':
-            return inputs[0] * inputs[1]
-        elif signature == 'reportQuotient':
-            return inputs[0] / inputs[1]
-        elif signature == 'reportPower':
-            return inputs[0] ** inputs[1]
-        elif signature == 'reportModulus':
-            return inputs[0] % inputs[1]
-        elif signature == 'reportRound':
-            return round(inputs[0])
-        elif signature == 'reportMonadic':
-            return self.handleMonadic(block)
-        elif signature == 'reportRandom':
-            start = inputs[0]
-            stop = inputs[1]
-            if type(start) == int and type(stop) == int:
-                return random.randint(start, stop)
-            else:
-                return random.uniform(start, stop)
-        elif signature == 'reportLessThan':
-            return inputs[0] < inputs[1]
-        elif signature == 'reportEquals':
-            return inputs[0] == inputs[1]
-        elif signature == 'reportGreaterThan':
-            return inputs[0] > inputs[1]
-        elif signature == 'reportAnd':
-            return inputs[0] and inputs[1]
-        elif signature == 'reportOr':
-            return inputs[0] or inputs[1]
-        elif signature == 'reportNot':
-            return not inputs[0]
-        elif signature == 'reportBoolean':
-            return bool(inputs[0])
-        elif signature == 'reportJoinWords':
-            return ''.join(inputs)
-        elif signature == 'reportTextSplit':
-            return inputs[0].split(inputs[1])
+    def evaluateNested(self, block : Block, scope : {}, depth : int):
+        '''
+        The fast path for ordinary trees: recurses into the inputs that
+        are blocks and reads the rest in place. Past RECURSION_DEPTH
+        levels it hands the rest of the tree to evaluateTree, so deep
+        trees never reach Python's recursion limit.
+        '''
+        if depth == RECURSION_DEPTH:
+            return self.evaluateTree(block, scope)
+        if block.signature == 'reportMonadic':
+            handler = self.applyMonadic
         else:
-            raise ValueError(f'{signature} is not an operator!')
-
-    def handleMonadic(self, block : Block):
-        operatorType = block.inputs[0].text
-        operand = block.inputs[1]
-        if operatorType == 'abs':
-            return abs(operand)
-        elif operatorType == 'neg':
-            return -1 * operand
-        elif operatorType == 'ceiling':
-            return math.ceil(operand)
-        elif operatorType == 'floor':
-            return math.floor(operand)
-        elif operatorType == 'sqrt':
-            return math.sqrt(operand)
-        elif operatorType == 'sin':
-            return math.sin(operand)
-        elif operatorType == 'cos':
-            return math.cos(operand)
-        elif operatorType == 'tan':
-            return math.tan(operand)
-        elif operatorType == 'asin':
-            return math.asin(operand)
-        elif operatorType == 'acos':
-            return math.acos(operand)
-        elif operatorType == 'atan':
-            return math.atan(operand)
-        elif operatorType == 'ln':
-            return math.log(operand)
-        elif operatorType == 'log':
-            return math.log10(operand)
-        elif operatorType == 'lg':
-            return math.log(operand, 2)
-        elif operatorType == 'e^':
-            return math.e ** operand
-        elif operatorType == '10^':
-            return 10 ** operand
-        elif operatorType == '2^':
-            return 2 ** operand
-        elif operatorType == 'id':
-            return operand
-        else:
-            raise ValueError(f'Error! {operatorType} is not a monadic function.')
-
-    def handleVariables(self, block : Block, scope : {}):
-        if block.signature == 'doSetVar':
-            # get the var name and value; evaluate both
-            variableName = self.evaluate(block.inputs[0])
-            value = self.evaluate(block.inputs[1], scope)
-            if self.varExistsLocally(variableName, scope):
-                scope[variableName] = value
+            primitive = self.primitives.lookup(block.signature)
+            if primitive.handler is reportIfElse:
+                # Run here rather than by the handler, so chains of conditionals count towards depth.
+                condition, onTrue, onFalse = block.inputs
+                condition = self.evaluateNested(condition, scope, depth + 1) if type(condition) == Block else self.evaluate(condition, scope)
+                branch = onTrue if condition else onFalse
+                return self.evaluateNested(branch, scope, depth + 1) if type(branch) == Block else self.evaluate(branch, scope)
+            elif primitive.special:
+                return primitive.handler(self, block, scope)
+            handler = primitive.handler
+        arguments = []
+        for inp in block.inputs:
+            inputType = type(inp)
+            if inputType == Block:
+                arguments.append(self.evaluateNested(inp, scope, depth + 1))
+            elif inputType == Variable:
+                arguments.append(scope[inp.name] if inp.name in scope else self.project.getGlobalVariable(inp.name))
+            elif inputType == Option:
+                arguments.append(inp.text)
+            elif inputType == list:
+                arguments.append(SnapList.fromLiteral(inp))
             else:
-                self.project.setGlobalVariable(variableName, value)
-
-        if block.signature == 'doDeclareVariables':
-            variableNames = [self.evaluate(name) for name in block.inputs]
-            for name in variableNames:
-                scope[name] = None
-
-        if block.signature == 'doChangeVar':
-            variableName = self.evaluate(block.inputs[0])
-            increment = self.evaluate(block.inputs[1])
-            if type(increment) in [float, int]:
-                if self.varExistsLocally(variableName, scope):
-                    # Snap has a quirk where if the variable isn't a number, change var does nothing
-                    if type(scope[variableName]) in [float, int]:
-                        try:
-                            scope[variableName] += increment
-                        except TypeError:
-                            scope[variableName] = 'NaN'
+                arguments.append(inp)
+        return handler(*arguments)
+
+    def evaluateTree(self, block : Block, scope : {}):
+        '''
+        Evaluates a reporter tree without recursion, so nesting is only
+        limited by memory. It runs trees too deep for evaluateNested,
+        and every tree while memoization is on. Each block whose inputs
+        are still being evaluated is a frame on an explicit stack:
+            (block, handler, inputs, arguments so far, memo key)
+
+        Special blocks evaluate their own inputs and so still take a
+        Python frame each. reportMonadic and reportIfElse are run here
+        instead, so chains of them do not: a conditional's frame waits
+        for its condition, then gives its place to the branch it picks.
+        Command blocks still run the scripts in their C-slots with a
+        few Python frames per level, so scripts can nest about a
+        hundred levels deep, far less than expressions can.
+        '''
+        lookup = self.primitives.lookup
+        memo = self.memo
+        getGlobalVariable = self.project.getGlobalVariable
+        frames = []
+        node = block
+        while True:
+            # Find the value of node, or push a frame to evaluate its inputs first.
+            nodeType = type(node)
+            if nodeType == Block:
+                key = memo.keyOf(node, scope) if memo != None else None
+                entry = memo.lookup(key) if key != None else None
+                if entry != None:
+                    result = entry[0]
                 else:
-                    scope = self.project.globalVariables
-                    if type(scope[variableName]) in [float, int]:
-                        try:
-                            scope[variableName] += increment
-                        except TypeError:
-                            scope[variableName] = 'NaN'
-
-        
-    def varExistsLocally(self, name : str, scope : {}):
-        return scope != None and name in scope
+                    if node.signature == 'reportMonadic':
+                        handler, special = self.applyMonadic, False
+                    else:
+                        primitive = lookup(node.signature)
+                        handler, special = primitive.handler, primitive.special
+                    if handler is reportIfElse:
+                        frames.append((node, handler, node.inputs, [], key))
+                        result = PENDING
+                    elif special:
+                        result = handler(self, node, scope)
+                    elif node.inputs:
+                        frames.append((node, handler, node.inputs, [], key))
+                        result = PENDING
+                    else:
+                        result = handler()
+                    if key != None and result is not PENDING:
+                        memo.store(key, node, scope, result)
+            elif nodeType == Variable:
+                result = scope[node.name] if node.name in scope else getGlobalVariable(node.name)
+            elif nodeType == Option:
+                result = node.text
+            elif nodeType == list:
+                result = SnapList.fromLiteral(node)
+            else:
+                result = node
+
+            # Hand the value up, applying every block whose inputs are now all known.
+            while frames:
+                frameBlock, handler, inputs, arguments, key = frames[-1]
+                if result is not PENDING:
+                    arguments.append(result)
+                if handler is reportIfElse:
+                    if arguments:
+                        frames.pop()
+                        node = inputs[1] if arguments[0] else inputs[2]
+                    else:
+                        node = inputs[0]
+                    break
+                # Literals and variables are read in place rather than on another trip round the loop.
+                index = len(arguments)
+                while index < len(inputs):
+                    node = inputs[index]
+                    nodeType = type(node)
+                    if nodeType == Block:
+                        break
+                    elif nodeType == Variable:
+                        arguments.append(scope[node.name] if node.name in scope else getGlobalVariable(node.name))
+                    elif nodeType == Option:
+                        arguments.append(node.text)
+                    elif nodeType == list:
+                        arguments.append(SnapList.fromLiteral(node))
+                    else:
+                        arguments.append(node)
+                    index += 1
+                if index < len(inputs):
+                    break
+                frames.pop()
+                result = handler(*arguments)
+                if key != None:
+                    memo.store(key, frameBlock, scope, result)
+            else:
+                return result
+
+    def applyMonadic(self, option : str, operand : Any):
+        return self.primitives.lookupMonadic(option)(operand)
+
+    def enableMemoization(self, maxSize : int = 4096) -> ReporterCache:
+        '''
+        Caches the results of pure reporters run through evaluate,
+        keeping at most maxSize of them. Returns the cache, whose
+        statistics method reports its hits and misses.
+        '''
+        self.memo = ReporterCache(self, maxSize)
+        return self.memo
+
+    def disableMemoization(self):
+        self.memo = None
+
+    def enableProfiling(self) -> BlockProfiler:
+        '''
+        Starts recording calls and time per block signature, sprite and
+        script, and returns the BlockProfiler that holds them. Profiling
+        shadows evaluate on this Executor alone, so it costs nothing once
+        disabled.
+        '''
+        self.disableProfiling()
+        self.profiler = BlockProfiler(self)
+        self.profiler.install()
+        return self.profiler
+
+    def disableProfiling(self):
+        if self.profiler != None:
+            self.profiler.uninstall()
+            self.profiler = None
+
+    def variableChanged(self, variableName : str):
+        '''
+        Called whenever a variable is written, so that cached
+        results which read it are no longer used.
+        '''
+        if self.memo != None:
+            self.memo.invalidate(variableName)
+
+    def evaluateBatch(self, value : Block, columns : {str : Any}, scope : {} = None):
+        '''
+        Evaluates a reporter once for every row of columns, a dict of
+        equally long NumPy arrays keyed by variable name, and returns an
+        array of the results. Operators run as vectorized ufuncs; any
+        subtree that cannot be vectorized is evaluated row by row.
+        '''
+        # NumPy is only needed for batch evaluation.
+        from Vectorized import BatchEvaluator
+        return BatchEvaluator(self, columns, scope).evaluate(value)
+
+    def executeScript(self, script : Any, scope : {} = None):
+        '''
+        Runs the blocks of a C-slot input in order, in the given scope.
+        '''
+        for block in scriptBlocks(script):
+            self.evaluate(block, scope)
+
+    def threadScript(self, script : Any, scope : {} = None):
+        '''
+        Runs the blocks of a script, or of a C-slot input, as a
+        generator for a Scheduler thread. Blocks with a threaded
+        version run as that, so the thread yields where they do;
+        every other block runs straight through with evaluate.
+        '''
+        lookup = self.primitives.lookup
+        for block in scriptBlocks(script):
+            if type(block) == Block:
+                threaded = lookup(block.signature).threaded
+                if threaded != None:
+                    yield from threaded(self, block, scope)
+                    continue
+            self.evaluate(block, scope)
+
+    def runScript(self, script : Script):
+        '''
+        Runs a whole script as its sprite, returning the value
+        it reports if it ends in a doReport block.
+        '''
+        previousSprite = self.sprite
+        self.sprite = script.sprite
+        try:
+            self.executeScript(script, script.scope)
+        except StopScript as stop:
+            return stop.value
+        finally:
+            self.sprite = previousSprite
 
+    def callRing(self, ring : Ring, arguments : [] = [], sprite = None):
+        '''
+        Calls a ring with arguments bound to its parameters, or put in
+        its empty slots if it has none, optionally running it as
+        another sprite.
+        '''
+        scope = dict(ring.scope)
+        body, parameters = ring.body, ring.parameters
+        if ring.kind != 'command':
+            body, parameters = ringBody(ring, len(arguments))
+        for name, argument in zip(parameters, arguments):
+            scope[name] = argument
 
-            
\ No newline at end of file
+        previousSprite = self.sprite
+        if sprite != None:
+            self.sprite = sprite
+        try:
+            if ring.kind == 'command':
+                self.executeScript(body, scope)
+            else:
+                return self.evaluate(body, scope)
+        except StopScript as stop:
+            return stop.value
+        finally:
+            self.sprite = previousSprite
+
+    def currentSprite(self):
+        if self.sprite == None:
+            raise ValueError('This block needs a sprite to run!')
+        return self.sprite
+
+    def compile(self, value : Block):
+        '''
+        Compiles a Block tree into a single Python callable that takes
+        an optional scope and returns the same result as evaluate.
+        The handler and the child closures of every node are resolved
+        once here, so calling the result does no further dispatch.
+        Subtrees more than RECURSION_DEPTH levels down are left to
+        evaluateTree, so compiling and calling never recurse deeper.
+        '''
+        compiled = self.compileNode(value, 0)
+        globalVariables = self.project.globalVariables
+
+        def run(scope : {} = None):
+            if scope == None:
+                scope = globalVariables
+            return compiled(scope)
+
+        return run
+
+    def compileScript(self, script : Any):
+        '''
+        Compiles a script, or a C-slot input, into a callable that runs
+        it like runScript and takes an optional scope. Variable names are
+        resolved to slots once, here, so reads index a list rather than
+        searching the scope and then the globals. See SlotCompiler.
+        '''
+        return SlotCompiler(self).compileScript(script)
+
+    def compileNode(self, value : Any, depth : int):
+        if type(value) == Option:
+            text = value.text
+            return lambda scope: text
+        elif type(value) == Variable:
+            return self.compileVariable(value.name)
+        elif type(value) == Block:
+            if depth == RECURSION_DEPTH:
+                return lambda scope: self.evaluateTree(value, scope)
+            primitive = self.primitives.lookup(value.signature)
+            if value.signature == 'reportMonadic':
+                return self.compileMonadic(value, depth)
+            elif primitive.handler is reportIfElse:
+                return self.compileIfElse(value, depth)
+            elif primitive.special:
+                return self.compileSpecial(primitive.handler, value)
+            return self.compileCall(primitive.handler, [self.compileNode(inp, depth + 1) for inp in value.inputs])
+        elif type(value) == list:
+            return lambda scope: SnapList.fromLiteral(value)
+        else:
+            return lambda scope: value
+
+    def compileVariable(self, variableName : str):
+        getGlobalVariable = self.project.getGlobalVariable
+
+        def readVariable(scope):
+            if variableName in scope:
+                return scope[variableName]
+            return getGlobalVariable(variableName)
+
+        return readVariable
+
+    def compileMonadic(self, block : Block, depth : int):
+        option, operand = block.inputs
+        operand = self.compileNode(operand, depth + 1)
+        if type(option) == Option:
+            return self.compileCall(self.primitives.lookupMonadic(option.text), [operand])
+
+        # The option is only known at run time, so look it up on every call.
+        option = self.compileNode(option, depth + 1)
+        lookupMonadic = self.primitives.lookupMonadic
+        return lambda scope: lookupMonadic(option(scope))(operand(scope))
+
+    def compileIfElse(self, block : Block, depth : int):
+        condition, onTrue, onFalse = [self.compileNode(inp, depth + 1) for inp in block.inputs]
+        return lambda scope: onTrue(scope) if condition(scope) else onFalse(scope)
+
+    def compileSpecial(self, handler, block : Block):
+        '''
+        Special handlers evaluate their own inputs, so the compiled
+        closure just hands them the block.
+        '''
+        return lambda scope: handler(self, block, scope)
+
+    @staticmethod
+    def compileCall(function, children : []):
+        '''
+        Builds the closure that applies function to the results of
+        the child closures. The common arities get their own closure
+        so no argument list has to be built on every call.
+        '''
+        if len(children) == 1:
+            (x,) = children
+            return lambda scope: function(x(scope))
+        elif len(children) == 2:
+            x, y = children
+            return lambda scope: function(x(scope), y(scope))
+        else:
+            return lambda scope: function(*[child(scope) for child in children])
+
+    def varExistsLocally(self, name : str, scope : {}):
+        return scope != None and name in scope
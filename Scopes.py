@@ -0,0 +1,374 @@
+from Block import *
+from Primitives import PRIMITIVES, StopScript, reportNumbers, scriptBlocks
+from Lists import SnapList
+from typing import Any
+
+'''
+Slot-resolved scripts. compileScript numbers every variable a script
+names once, when it is compiled; running it then reads variables from
+a list by index instead of searching the script's scope and then the
+globals on every access.
+'''
+
+# The value of a slot whose variable is defined nowhere.
+UNDEFINED = object()
+
+class Frame:
+    '''
+    The state of one run of a slot-resolved script.
+        Values: the current value of every slot, by index.
+        Owners: the dict each slot's variable lives in, the script's
+        scope or the globals, or None if it is not defined yet.
+
+    The dicts stay the truth: every write goes through to the owner,
+    so rings, clones and handlers that are handed the scope still see
+    plain dicts. The slots are bound again after any block that might
+    have changed those dicts behind the script's back.
+    '''
+
+    __slots__ = ('names', 'scope', 'globalVariables', 'owners', 'values')
+
+    def __init__(self, names : [str], scope : {}, globalVariables : {}):
+        self.names = names
+        self.scope = scope
+        self.globalVariables = globalVariables
+        self.owners = [None] * len(names)
+        self.values = [UNDEFINED] * len(names)
+        self.bind()
+
+    def bind(self):
+        '''
+        Resolves each slot as Snap does: the script's own variables
+        shadow the globals.
+        '''
+        scope, globalVariables, owners, values = self.scope, self.globalVariables, self.owners, self.values
+        for index, name in enumerate(self.names):
+            if name in scope:
+                owners[index], values[index] = scope, scope[name]
+            elif name in globalVariables:
+                owners[index], values[index] = globalVariables, globalVariables[name]
+            else:
+                owners[index], values[index] = None, UNDEFINED
+
+class SlotCompiler:
+    '''
+    Compiles a script into closures called with (values, frame).
+    Variable reads and the variable and control blocks of PRIMITIVES
+    are compiled to work on slots. Any other special block is opaque:
+    its handler is called with the scope dict, as evaluate would, and
+    the frame is bound again afterwards. Blocks a project overrides
+    in its registry are always opaque, and so are blocks nested more
+    than RECURSION_DEPTH levels deep, which are left to evaluate.
+    '''
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.primitives = executor.primitives
+        # Variable names mapped to their slot index.
+        self.slots = {}
+        # How deep in the script the block being compiled is.
+        self.depth = 0
+        self.compilers = {
+            'doSetVar' : self.compileSetVar,
+            'doChangeVar' : self.compileChangeVar,
+            'doDeclareVariables' : self.compileDeclareVariables,
+            'doFor' : self.compileFor,
+            'doForEach' : self.compileForEach,
+            'doRepeat' : self.compileRepeat,
+            'doForever' : self.compileForever,
+            'doWarp' : self.compileWarp,
+            'doIf' : self.compileIf,
+            'doIfElse' : self.compileIfElse,
+            'reportIfElse' : self.compileIfElse,
+            'doWaitUntil' : self.compileWaitUntil,
+            'doReport' : self.compileReport
+        }
+
+    def compileScript(self, script : Any):
+        '''
+        Returns run(scope = None), which runs script like runScript:
+        as its sprite, in its scope unless another is given, returning
+        the value of a doReport block.
+        '''
+        body = self.compileBody(script)
+        names = list(self.slots)
+        executor = self.executor
+        globalVariables = executor.project.globalVariables
+        defaultScope = script.scope if type(script) == Script else globalVariables
+        sprite = script.sprite if type(script) == Script else None
+
+        def run(scope : {} = None):
+            frame = Frame(names, scope if scope != None else defaultScope, globalVariables)
+            previousSprite = executor.sprite
+            if sprite != None:
+                executor.sprite = sprite
+            try:
+                body(frame.values, frame)
+            except StopScript as stop:
+                return stop.value
+            finally:
+                executor.sprite = previousSprite
+
+        return run
+
+    def slot(self, name : str) -> int:
+        if name not in self.slots:
+            self.slots[name] = len(self.slots)
+        return self.slots[name]
+
+    def compileBody(self, script : Any):
+        commands = [self.compileNode(block) for block in scriptBlocks(script)]
+        if len(commands) == 1:
+            return commands[0]
+
+        def body(values, frame):
+            for command in commands:
+                command(values, frame)
+
+        return body
+
+    def compileNode(self, value : Any):
+        if self.depth == RECURSION_DEPTH and type(value) == Block:
+            return self.compileOpaque(lambda executor, block, scope: executor.evaluate(block, scope), value)
+        self.depth += 1
+        try:
+            return self.compileShallow(value)
+        finally:
+            self.depth -= 1
+
+    def compileShallow(self, value : Any):
+        valueType = type(value)
+        if valueType == Option:
+            text = value.text
+            return lambda values, frame: text
+        elif valueType == Variable:
+            return self.compileRead(value.name)
+        elif valueType == list:
+            return lambda values, frame: SnapList.fromLiteral(value)
+        elif valueType != Block:
+            return lambda values, frame: value
+
+        signature = value.signature
+        primitive = self.primitives.lookup(signature)
+        if signature == 'reportMonadic':
+            return self.compileMonadic(value)
+        elif signature in self.compilers and primitive is PRIMITIVES.lookup(signature):
+            compiled = self.compilers[signature](value)
+            if compiled != None:
+                return compiled
+        elif not primitive.special:
+            return self.compileCall(primitive.handler, [self.compileNode(inp) for inp in value.inputs])
+        return self.compileOpaque(primitive.handler, value)
+
+    def compileRead(self, name : str):
+        index = self.slot(name)
+
+        def readVariable(values, frame):
+            value = values[index]
+            if value is UNDEFINED:
+                raise ValueError(f'{name} is not defined!')
+            return value
+
+        return readVariable
+
+    def compileWrite(self, name : str):
+        '''
+        Returns write(values, frame, value), which stores value in
+        the slot and in the dict the variable lives in.
+        '''
+        index = self.slot(name)
+        executor = self.executor
+
+        def writeVariable(values, frame, value):
+            frame.owners[index][name] = value
+            values[index] = value
+            if executor.memo != None:
+                executor.memo.invalidate(name)
+
+        return writeVariable
+
+    def compileDeclare(self, name : str):
+        '''
+        Returns declare(values, frame, value), which makes the
+        variable the script's own before writing it.
+        '''
+        index = self.slot(name)
+        write = self.compileWrite(name)
+
+        def declareVariable(values, frame, value):
+            frame.owners[index] = frame.scope
+            write(values, frame, value)
+
+        return declareVariable
+
+    def compileOpaque(self, handler, block : Block):
+        executor = self.executor
+
+        def runOpaque(values, frame):
+            result = handler(executor, block, frame.scope)
+            frame.bind()
+            return result
+
+        return runOpaque
+
+    def compileMonadic(self, block : Block):
+        option, operand = block.inputs
+        operand = self.compileNode(operand)
+        if type(option) == Option:
+            return self.compileCall(self.primitives.lookupMonadic(option.text), [operand])
+        option = self.compileNode(option)
+        lookupMonadic = self.primitives.lookupMonadic
+        return lambda values, frame: lookupMonadic(option(values, frame))(operand(values, frame))
+
+    @staticmethod
+    def compileCall(function, children : []):
+        if len(children) == 0:
+            return lambda values, frame: function()
+        elif len(children) == 1:
+            (x,) = children
+            return lambda values, frame: function(x(values, frame))
+        elif len(children) == 2:
+            x, y = children
+            return lambda values, frame: function(x(values, frame), y(values, frame))
+        else:
+            return lambda values, frame: function(*[child(values, frame) for child in children])
+
+    # Variable blocks need their variable names as literal options;
+    # a name computed at run time leaves the block opaque.
+
+    def compileSetVar(self, block : Block):
+        name, value = block.inputs
+        if type(name) != Option:
+            return None
+        name, index = name.text, self.slot(name.text)
+        value, write = self.compileNode(value), self.compileWrite(name)
+
+        def setVariable(values, frame):
+            result = value(values, frame)
+            if frame.owners[index] == None:
+                raise ValueError(f'{name} is not a global variable')
+            write(values, frame, result)
+
+        return setVariable
+
+    def compileChangeVar(self, block : Block):
+        name, increment = block.inputs
+        if type(name) != Option:
+            return None
+        name, index = name.text, self.slot(name.text)
+        increment, write = self.compileNode(increment), self.compileWrite(name)
+
+        def changeVariable(values, frame):
+            delta = increment(values, frame)
+            if type(delta) in (float, int):
+                if frame.owners[index] == None:
+                    raise KeyError(name)
+                # Snap has a quirk where if the variable isn't a number, change var does nothing
+                current = values[index]
+                if type(current) in (float, int):
+                    write(values, frame, current + delta)
+
+        return changeVariable
+
+    def compileDeclareVariables(self, block : Block):
+        if any(type(name) != Option for name in block.inputs):
+            return None
+        declares = [self.compileDeclare(name.text) for name in block.inputs]
+
+        def declareVariables(values, frame):
+            for declare in declares:
+                declare(values, frame, None)
+
+        return declareVariables
+
+    def compileFor(self, block : Block):
+        name, start, stop, script = block.inputs
+        if type(name) != Option:
+            return None
+        declare, start, stop = self.compileDeclare(name.text), self.compileNode(start), self.compileNode(stop)
+        body = self.compileBody(script)
+
+        def forLoop(values, frame):
+            for i in reportNumbers(start(values, frame), stop(values, frame)):
+                declare(values, frame, i)
+                body(values, frame)
+
+        return forLoop
+
+    def compileForEach(self, block : Block):
+        name, items, script = block.inputs
+        if type(name) != Option:
+            return None
+        declare, items, body = self.compileDeclare(name.text), self.compileNode(items), self.compileBody(script)
+
+        def forEach(values, frame):
+            for item in items(values, frame):
+                declare(values, frame, item)
+                body(values, frame)
+
+        return forEach
+
+    # Control blocks.
+
+    def compileRepeat(self, block : Block):
+        count, body = self.compileNode(block.inputs[0]), self.compileBody(block.inputs[1])
+
+        def repeat(values, frame):
+            for i in range(int(count(values, frame))):
+                body(values, frame)
+
+        return repeat
+
+    def compileForever(self, block : Block):
+        body = self.compileBody(block.inputs[0])
+
+        def forever(values, frame):
+            while True:
+                body(values, frame)
+
+        return forever
+
+    def compileWarp(self, block : Block):
+        return self.compileBody(block.inputs[0])
+
+    def compileIf(self, block : Block):
+        condition, body = self.compileNode(block.inputs[0]), self.compileBody(block.inputs[1])
+
+        def doIf(values, frame):
+            if condition(values, frame):
+                body(values, frame)
+
+        return doIf
+
+    def compileIfElse(self, block : Block):
+        '''
+        Both doIfElse and reportIfElse; the branches of the reporter
+        are single reporters rather than scripts.
+        '''
+        compileBranch = self.compileNode if block.signature == 'reportIfElse' else self.compileBody
+        condition = self.compileNode(block.inputs[0])
+        yes, no = compileBranch(block.inputs[1]), compileBranch(block.inputs[2])
+
+        def ifElse(values, frame):
+            if condition(values, frame):
+                return yes(values, frame)
+            return no(values, frame)
+
+        return ifElse
+
+    def compileWaitUntil(self, block : Block):
+        condition = self.compileNode(block.inputs[0])
+
+        def waitUntil(values, frame):
+            while not condition(values, frame):
+                pass
+
+        return waitUntil
+
+    def compileReport(self, block : Block):
+        value = self.compileNode(block.inputs[0])
+
+        def report(values, frame):
+            raise StopScript(value(values, frame))
+
+        return report
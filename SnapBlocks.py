@@ -5,8 +5,8 @@ Variables Blocks
 '''
 def setVariableTo(variableName, value) : return Block('doSetVar', [Option(variableName), value])
 def changeVariableBy(variableName, value) : return Block('doChangeVar', [Option(variableName), value])
-def showVariable(variableName) : return Block(Option('doShowVar'), [variableName])
-def hideVariable(variableName) : return Block(Option('doHideVar'), [variableName])
+def showVariable(variableName) : return Block('doShowVar', [Option(variableName)])
+def hideVariable(variableName) : return Block('doHideVar', [Option(variableName)])
 def scriptVariables(variableNames : [str]) : return Block('doDeclareVariables', variableNames)
 def inherit(parent) : return Block('doDeleteAttr', [Option(parent)])
 def newList(values) : return Block('reportNewList', values)
@@ -18,16 +18,16 @@ def lengthOf(lst) : return Block('reportListLength', [lst])
 def indexOf(item, lst) : return Block('reportListIndex', [item, lst])
 def contains(lst, item) : return Block('reportListContainsItem', [lst, item])
 def isEmpty(lst) : return Block('reportListIsEmpty', [lst])
-def mapOver(ring, lst) : Block('reportMap', [ring, lst])
-def keep(ring, lst) : Block('reportKeep', [ring, lst])
-def combine(lst, ring) : Block('reportCombine', [lst, ring])
-def findFirst(ring, lst) : Block('reportFindFirst', [ring, lst])
-def forEach(varName, lst, script) : Block('doForEach', [varName, lst, script])
-def append(lists : []) : Block('reportConcatenatedLists', lists)
-def addTo(value, lst) : Block('doAddToList', [value, lst])
-def deleteIndex(index, lst) : Block('doDeleteFromList', [index, lst])
-def insertAt(item, index, lst) : Block('doInsertInList', [item, index, lst])
-def replaceItem(index, lst, item) : Block('doReplaceItemInList', [index, lst, item])
+def mapOver(ring, lst) : return Block('reportMap', [ring, lst])
+def keep(ring, lst) : return Block('reportKeep', [ring, lst])
+def combine(lst, ring) : return Block('reportCombine', [lst, ring])
+def findFirst(ring, lst) : return Block('reportFindFirst', [ring, lst])
+def forEach(varName, lst, script) : return Block('doForEach', [varName, lst, script])
+def append(lists : []) : return Block('reportConcatenatedLists', lists)
+def addTo(value, lst) : return Block('doAddToList', [value, lst])
+def deleteIndex(index, lst) : return Block('doDeleteFromList', [index, lst])
+def insertAt(item, index, lst) : return Block('doInsertInList', [item, index, lst])
+def replaceItem(index, lst, item) : return Block('doReplaceInList', [index, lst, item])
 
 # # Operations that aren't real blocks
 # def makeGlobalVariable(variableName) : return Block('makeGlobal', [variableName])
@@ -76,6 +76,7 @@ def notOp(x) : return Block('reportNot', [x])
 def boolean(value) : return Block('reportBoolean', [value])
 def join(words) : return Block('reportJoinWords', words)
 def textSplit(text, splitString) : return Block('reportTextSplit', [text, splitString])
+def lengthOfText(text) : return Block('reportStringSize', [text])
 
 
 '''
@@ -88,7 +89,7 @@ def turnCounterClockwise(degrees) : return Block('turnLeft', [degrees])
 def pointInDirection(degree) : return Block('setHeading', [degree])
 def pointTowards(option) : return Block('doFaceTowards', [Option(option)])
 def gotoXY(x, y) : return Block('gotoXY', [x, y])
-def goto(option) : return Block('goto', [Option(option)])
+def goto(option) : return Block('doGotoObject', [Option(option)])
 def glide(seconds, x, y) : return Block('doGlide', [seconds, x, y])
 def changeXBy(steps) : return Block('changeXPosition', [steps])
 def setXto(location) : return Block('setXPosition', [location])
@@ -99,6 +100,13 @@ def xPosition() : return Block('xPosition', [])
 def yPosition() : return Block('yPosition', [])
 def direction() : return Block('direction', [])
 
+'''
+Sensing Blocks
+'''
+
+def touching(option) : return Block('reportTouchingObject', [Option(option)])
+def distanceTo(option) : return Block('reportDistanceTo', [Option(option)])
+
 '''
 Control Blocks
 '''
@@ -161,7 +169,8 @@ OPERATOR_BLOCKS = {
     'reportNot' : 'predicate',
     'reportBoolean' : 'predicate',
     'reportJoinWords' : 'reporter',
-    'reportTextSplit' : 'reporter'
+    'reportTextSplit' : 'reporter',
+    'reportStringSize' : 'reporter'
 }
 
 def isOperator(block : Block):
@@ -0,0 +1,225 @@
+import math
+
+'''
+A uniform grid over the stage for the sensing blocks. Every sprite in
+the index is entered in the grid cells its bounding box covers, so
+"touching" only compares a sprite with the sprites sharing its cells,
+and a nearest-sprite search only looks at the cells around it, however
+many clones the project has.
+'''
+
+# Half the size of Snap's turtle costume, which every sprite is boxed as.
+TURTLE_RADIUS = 10
+
+def spriteRadius(sprite) -> float:
+    '''
+    Half the side of the square that holds the sprite at any heading.
+    The costume a sprite is wearing is not tracked, so every sprite is
+    the turtle at its scale.
+    '''
+    return TURTLE_RADIUS * abs(sprite.scale)
+
+def distance(sprite, other) -> float:
+    (x, y), (otherX, otherY) = sprite.coords, other.coords
+    return math.hypot(otherX - x, otherY - y)
+
+class SpatialIndex:
+    '''
+    Sprites in a uniform grid of square cells, keyed by cell coordinates.
+        Cells: each cell's sprites, as a dict used as an ordered set so
+        queries visit sprites in a fixed order.
+
+        Entries: each sprite's position, radius and range of cells.
+
+        Named: the sprites with each name, for nearest-sprite searches
+        whose name is too rare to be worth searching the grid for.
+
+        Columns and rows: how many occupied cells each column and row
+        of the grid has, from which the box around every occupied cell,
+        which bounds the nearest-sprite search, is worked out again
+        whenever a column or row on its edge empties.
+
+    Sprites are moved in the grid by update, which setPosition calls
+    for a sprite in an index. A move within the same cells only
+    replaces the sprite's entry.
+    '''
+
+    def __init__(self, cellSize : float = 64):
+        self.cellSize = cellSize
+        self.cells = {}
+        self.entries = {}
+        self.named = {}
+        self.columns = {}
+        self.rows = {}
+        # (left, bottom, right, top) of the occupied cells, or None until it is next needed.
+        self.bounds = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, sprite) -> bool:
+        return sprite in self.entries
+
+    def add(self, sprite):
+        sprite.spatialIndex = self
+        self.update(sprite)
+
+    def remove(self, sprite):
+        entry = self.entries.pop(sprite, None)
+        if entry != None:
+            named = self.named[sprite.name]
+            del named[sprite]
+            if not named:
+                del self.named[sprite.name]
+            for key in self.cellKeys(entry):
+                self.vacate(key, sprite)
+        sprite.spatialIndex = None
+
+    def cellKeys(self, entry):
+        x, y, radius, left, bottom, right, top = entry
+        return [(i, j) for i in range(left, right + 1) for j in range(bottom, top + 1)]
+
+    def occupy(self, key, sprite):
+        cell = self.cells.get(key)
+        if cell == None:
+            cell = self.cells[key] = {}
+            i, j = key
+            self.columns[i] = self.columns.get(i, 0) + 1
+            self.rows[j] = self.rows.get(j, 0) + 1
+            if self.bounds != None:
+                left, bottom, right, top = self.bounds
+                self.bounds = (min(left, i), min(bottom, j), max(right, i), max(top, j))
+        cell[sprite] = None
+
+    def vacate(self, key, sprite):
+        cell = self.cells[key]
+        del cell[sprite]
+        if cell:
+            return
+        del self.cells[key]
+        i, j = key
+        for counts, index in ((self.columns, i), (self.rows, j)):
+            counts[index] -= 1
+            if not counts[index]:
+                del counts[index]
+                # The box only shrinks when a column or row on its edge empties.
+                if self.bounds != None and index in (self.bounds[0::2] if counts is self.columns else self.bounds[1::2]):
+                    self.bounds = None
+
+    def occupiedBounds(self):
+        '''
+        (left, bottom, right, top) of the occupied cells, or None if
+        the index is empty.
+        '''
+        if self.bounds == None and self.cells:
+            self.bounds = (min(self.columns), min(self.rows), max(self.columns), max(self.rows))
+        return self.bounds
+
+    def update(self, sprite, coords : (float, float) = None):
+        '''
+        Moves sprite to its current position, or to coords if the
+        caller already has them.
+        '''
+        x, y = coords if coords != None else sprite.coords
+        radius = spriteRadius(sprite)
+        size = self.cellSize
+        left, bottom = math.floor((x - radius) / size), math.floor((y - radius) / size)
+        right, top = math.floor((x + radius) / size), math.floor((y + radius) / size)
+        entry = (x, y, radius, left, bottom, right, top)
+        old = self.entries.get(sprite)
+        self.entries[sprite] = entry
+        if old != None and old[3:] == entry[3:]:
+            return
+
+        if old == None:
+            self.named.setdefault(sprite.name, {})[sprite] = None
+        else:
+            for key in self.cellKeys(old):
+                self.vacate(key, sprite)
+        for key in self.cellKeys(entry):
+            self.occupy(key, sprite)
+
+    def touching(self, sprite, name : str = None) -> bool:
+        '''
+        Whether any other shown sprite, or only those named name, which
+        includes the clones of that sprite, overlaps sprite.
+        '''
+        if sprite.hidden:
+            return False
+        if sprite not in self.entries:
+            self.update(sprite)
+        x, y, radius, left, bottom, right, top = self.entries[sprite]
+        entries, cells = self.entries, self.cells
+        for i in range(left, right + 1):
+            for j in range(bottom, top + 1):
+                for other in cells.get((i, j), ()):
+                    if other is sprite or (name != None and other.name != name) or other.hidden:
+                        continue
+                    otherX, otherY, otherRadius = entries[other][:3]
+                    if abs(otherX - x) <= radius + otherRadius and abs(otherY - y) <= radius + otherRadius:
+                        return True
+        return False
+
+    def nearest(self, sprite, name : str = None):
+        '''
+        The other sprite, or the other sprite named name, whose position
+        is closest to sprite's, or None if there is none. Searches rings
+        of cells outward and stops once no unvisited cell can hold
+        anything closer, or once the rings reach past every occupied
+        cell. A search for a name so rare that the rings would mostly be
+        empty, or that reaches rings with more cells than the index has
+        sprites, compares sprite with each sprite instead.
+        '''
+        x, y = sprite.coords
+        entries, cells = self.entries, self.cells
+        best, bestDistance = None, math.inf
+        if name != None:
+            named = self.named.get(name, {})
+            if len(named) ** 2 <= len(cells):
+                return self.nearestOf(sprite, named)
+
+        bounds = self.occupiedBounds()
+        if bounds == None:
+            return None
+        size = self.cellSize
+        column, row = math.floor(x / size), math.floor(y / size)
+        # Rings past the one reaching the farthest occupied cell are empty.
+        left, bottom, right, top = bounds
+        limit = max(column - left, right - column, row - bottom, top - row)
+        for ring in range(limit + 1):
+            # Everything outside the rings searched so far is at least this far away.
+            if bestDistance <= ring * size - size:
+                break
+            if 8 * ring > len(entries):
+                # A ring this wide has more cells than the index has sprites, so comparing with each is quicker.
+                return self.nearestOf(sprite, entries, name)
+            if ring == 0:
+                keys = [(column, row)]
+            else:
+                keys = [(column + i, row + j) for i in range(-ring, ring + 1) for j in (-ring, ring)]
+                keys += [(column + i, row + j) for i in (-ring, ring) for j in range(1 - ring, ring)]
+            for key in keys:
+                for other in cells.get(key, ()):
+                    if other is sprite or (name != None and other.name != name):
+                        continue
+                    otherX, otherY = entries[other][:2]
+                    otherDistance = math.hypot(otherX - x, otherY - y)
+                    if otherDistance < bestDistance:
+                        best, bestDistance = other, otherDistance
+        return best
+
+    def nearestOf(self, sprite, others, name : str = None):
+        '''
+        The sprite among others, or among those named name, closest to sprite.
+        '''
+        x, y = sprite.coords
+        entries = self.entries
+        best, bestDistance = None, math.inf
+        for other in others:
+            if other is sprite or (name != None and other.name != name):
+                continue
+            otherX, otherY = entries[other][:2]
+            otherDistance = math.hypot(otherX - x, otherY - y)
+            if otherDistance < bestDistance:
+                best, bestDistance = other, otherDistance
+        return best
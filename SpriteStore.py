@@ -0,0 +1,266 @@
+from Block import *
+from Visuals import Sprite
+from Primitives import PRIMITIVES, scriptBlocks
+from Vectorized import BatchEvaluator, VECTOR_OPERATORS, VECTOR_MONADIC
+from typing import Any
+import numpy as np
+
+'''
+A struct-of-arrays store for clones. Particle-style projects make
+thousands of clones that all run the same motion script, so the state
+motion blocks change lives in NumPy arrays indexed by a slot per clone,
+and a frame of such a script runs as one vectorized update per block
+for every clone running it rather than once per clone.
+'''
+
+def normalizeHeadings(degrees):
+    return np.mod(np.mod(degrees, 360) + 360, 360)
+
+def forward(store, slots, steps):
+    radians = np.radians(store.heading[slots])
+    store.x[slots] += steps * np.sin(radians)
+    store.y[slots] += steps * np.cos(radians)
+
+def bounceOffEdge(store, slots):
+    '''
+    Primitives.bounceOffEdge over arrays: each sprite is a point that
+    is clamped to the stage and has its heading reflected off any
+    edge it has crossed.
+    '''
+    right, top = store.project.stageWidth / 2, store.project.stageHeight / 2
+    x, y, heading = store.x[slots], store.y[slots], store.heading[slots]
+    outside = (x > right) | (x < -right)
+    x = np.where(outside, np.clip(x, -right, right), x)
+    heading = np.where(outside, normalizeHeadings(-heading), heading)
+    outside = (y > top) | (y < -top)
+    y = np.where(outside, np.clip(y, -top, top), y)
+    heading = np.where(outside, normalizeHeadings(180 - heading), heading)
+    store.x[slots], store.y[slots], store.heading[slots] = x, y, heading
+
+def setColumn(name : str, change : bool = False):
+    def update(store, slots, value):
+        column = getattr(store, name)
+        column[slots] = column[slots] + value if change else value
+    return update
+
+# The motion blocks a swarm script may use, as updates of the store's arrays.
+VECTOR_MOTION = {
+    'forward' : forward,
+    'turn' : lambda store, slots, degrees: store.heading.__setitem__(slots, normalizeHeadings(store.heading[slots] + degrees)),
+    'turnLeft' : lambda store, slots, degrees: store.heading.__setitem__(slots, normalizeHeadings(store.heading[slots] - degrees)),
+    'setHeading' : lambda store, slots, degrees: store.heading.__setitem__(slots, normalizeHeadings(degrees)),
+    'gotoXY' : lambda store, slots, x, y: (store.x.__setitem__(slots, x), store.y.__setitem__(slots, y)),
+    'changeXPosition' : setColumn('x', True),
+    'setXPosition' : setColumn('x'),
+    'changeYPosition' : setColumn('y', True),
+    'setYPosition' : setColumn('y'),
+    'bounceOffEdge' : bounceOffEdge
+}
+
+class StoredSprite(Sprite):
+    '''
+    A sprite whose position, heading, scale and visibility live in a
+    SpriteStore slot. Its other attributes are ordinary ones. Reading
+    or writing a stored attribute first runs any motion the store has
+    pending, so the sprite always looks as if its blocks ran one by one.
+    '''
+
+    def __init__(self, store, sprite : Sprite):
+        state = dict(vars(sprite))
+        for name in ('coords', 'heading', 'scale', 'hidden', 'store', 'slot'):
+            state.pop(name, None)
+        self.__dict__.update(state)
+        self.store = store
+        self.slot = store.allocate()
+        self.coords = sprite.coords
+        self.heading = sprite.heading
+        self.scale = sprite.scale
+        self.hidden = sprite.hidden
+
+    @property
+    def coords(self) -> (float, float):
+        store = self.store
+        if store.rounds:
+            store.flush()
+        return store.x[self.slot].item(), store.y[self.slot].item()
+
+    @coords.setter
+    def coords(self, coords : (float, float)):
+        store = self.store
+        if store.rounds:
+            store.flush()
+        store.x[self.slot], store.y[self.slot] = coords
+
+def storedAttribute(name : str):
+    def get(self):
+        store = self.store
+        if store.rounds:
+            store.flush()
+        return getattr(store, name)[self.slot].item()
+
+    def set(self, value):
+        store = self.store
+        if store.rounds:
+            store.flush()
+        getattr(store, name)[self.slot] = value
+
+    return property(get, set)
+
+StoredSprite.heading = storedAttribute('heading')
+StoredSprite.scale = storedAttribute('scale')
+StoredSprite.hidden = storedAttribute('hidden')
+
+class SpriteStore:
+    '''
+    Clones of a project's sprites, as NumPy arrays with one slot per clone.
+        Columns: x, y, heading, scale and hidden. Slots of removed clones
+        are reused, and the arrays double in size when they run out, so
+        making and removing a clone costs O(1) amortized.
+
+    Swarm scripts are a hat block followed by a forever loop of motion
+    blocks whose inputs read no variables, like
+        when I start as a clone; forever: move 5 steps, bounce
+    In a Scheduler, the thread of a swarm script does not run its
+    blocks; each frame it adds its clone's slot to the frame's round
+    of that script. The rounds run at the end of the frame, or as soon
+    as anything reads or writes a stored attribute, each block of the
+    script as one update over every slot in the round. A clone with
+    two swarm scripts is in two rounds, which run in the order its
+    threads did, so each sprite still sees its blocks in the order
+    Snap would run them. Random inputs are drawn for every clone at
+    once from NumPy's generator.
+    '''
+
+    def __init__(self, project, capacity : int = 1024):
+        self.project = project
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.heading = np.zeros(capacity)
+        self.scale = np.ones(capacity)
+        self.hidden = np.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))
+        self.sprites = {}
+        # Each round maps a swarm body's id to the slots that ran it; a slot is in a round at most once.
+        self.rounds = []
+        self.occurrences = {}
+        # Swarm bodies by the id of their script's block list, which every clone of a sprite shares.
+        self.bodies = {}
+
+    def __len__(self) -> int:
+        return self.capacity - len(self.free)
+
+    def allocate(self) -> int:
+        if not self.free:
+            self.grow()
+        return self.free.pop()
+
+    def grow(self):
+        capacity = self.capacity * 2
+        for name in ('x', 'y', 'heading', 'scale', 'hidden'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.capacity] = column
+            setattr(self, name, grown)
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def clone(self, sprite : Sprite) -> StoredSprite:
+        clone = StoredSprite(self, sprite)
+        self.sprites[clone.slot] = clone
+        return clone
+
+    def remove(self, sprite : StoredSprite):
+        if self.rounds:
+            self.flush()
+        del self.sprites[sprite.slot]
+        self.free.append(sprite.slot)
+
+    def swarmBody(self, script : Script):
+        '''
+        The compiled blocks of a swarm script, as (update, inputs)
+        pairs, or None if the script is not one.
+        '''
+        blocks = script.blocks
+        key = id(blocks)
+        if key not in self.bodies:
+            self.bodies[key] = (blocks, self.compileSwarm(blocks))
+        return self.bodies[key][1]
+
+    def compileSwarm(self, blocks : [Block]):
+        if len(blocks) != 2 or type(blocks[1]) != Block or blocks[1].signature != 'doForever':
+            return None
+        primitives = self.project.executor.primitives
+        if type(blocks[0]) != Block or primitives.lookup(blocks[0].signature).kind != 'hat' or \
+           primitives.lookup('doForever') is not PRIMITIVES.lookup('doForever'):
+            return None
+        body = []
+        for block in scriptBlocks(blocks[1].inputs[0]):
+            if type(block) != Block or block.signature not in VECTOR_MOTION or \
+               primitives.lookup(block.signature) is not PRIMITIVES.lookup(block.signature):
+                return None
+            if not all(self.isConstant(inp) for inp in block.inputs):
+                return None
+            body.append((VECTOR_MOTION[block.signature], block.inputs))
+        return body if body else None
+
+    def isConstant(self, value : Any) -> bool:
+        '''
+        Whether an input is a number, or operators and random numbers
+        over numbers, which BatchEvaluator can give every clone at once.
+        '''
+        valueType = type(value)
+        if valueType in (int, float):
+            return True
+        elif valueType != Block:
+            return False
+        primitives = self.project.executor.primitives
+        if value.signature not in primitives or primitives.lookup(value.signature) is not PRIMITIVES.lookup(value.signature):
+            return False
+        if value.signature == 'reportMonadic':
+            option = value.inputs[0]
+            return type(option) == Option and option.text in VECTOR_MONADIC and \
+                primitives.monadic.get(option.text) is PRIMITIVES.monadic.get(option.text) and \
+                self.isConstant(value.inputs[1])
+        return (value.signature in VECTOR_OPERATORS or value.signature == 'reportRandom') and \
+            all(self.isConstant(inp) for inp in value.inputs)
+
+    def swarmSteps(self, body : [], sprite : StoredSprite):
+        '''
+        The thread of a swarm script: the forever loop, one round per frame.
+        '''
+        key, slot = id(body), sprite.slot
+        while True:
+            count = self.occurrences.get(slot, 0)
+            self.occurrences[slot] = count + 1
+            if count == len(self.rounds):
+                self.rounds.append({})
+            self.rounds[count].setdefault(key, (body, []))[1].append(slot)
+            yield
+
+    def flush(self):
+        '''
+        Runs the pending rounds of swarm scripts, then moves the
+        clones they moved in the project's SpatialIndex.
+        '''
+        rounds = self.rounds
+        self.rounds = []
+        self.occurrences.clear()
+        executor = self.project.executor
+        index = self.project.spatialIndex
+        for bodies in rounds:
+            for body, slots in bodies.values():
+                slots = np.array(slots)
+                evaluator = None
+                for update, inputs in body:
+                    values = []
+                    for inp in inputs:
+                        if type(inp) == Block:
+                            if evaluator == None:
+                                evaluator = BatchEvaluator(executor, {'#slot' : slots})
+                            inp = evaluator.evaluate(inp)
+                        values.append(inp)
+                    update(self, slots, *values)
+                if index != None:
+                    for slot, x, y in zip(slots.tolist(), self.x[slots].tolist(), self.y[slots].tolist()):
+                        index.update(self.sprites[slot], (x, y))
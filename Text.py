@@ -0,0 +1,156 @@
+from typing import Any
+import math
+
+'''
+Snap text built by "join". Scripts often grow a text a word at a time
+with "set text to join text item", which copies the whole text every
+time if texts are Python strings. Join reports a Text instead: a list
+of pieces that is only joined into one string when something reads the
+text as a whole, so growing it one word at a time costs O(1) a word.
+Short texts cost little to copy and less to use as strings, so join
+reports a plain string until the text reaches ROPE_LENGTH characters.
+'''
+
+# The length from which join reports a Text rather than a string.
+ROPE_LENGTH = 1024
+
+def textOf(value : Any) -> str:
+    '''
+    Converts a value into text the way Snap shows it: booleans as true
+    and false, whole floats without a fractional part and nothing as
+    empty text.
+    '''
+    valueType = type(value)
+    if valueType == str:
+        return value
+    elif valueType == bool:
+        return 'true' if value else 'false'
+    elif valueType == float:
+        if math.isnan(value):
+            return 'NaN'
+        elif math.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        elif value.is_integer() and abs(value) < 1e21:
+            return str(int(value))
+        return repr(value)
+    elif value == None:
+        return ''
+    return str(value)
+
+def joinWords(*words):
+    '''
+    Text.join, with a quicker path for words that are all strings.
+    '''
+    try:
+        joined = ''.join(words)
+    except TypeError:
+        return Text.join(*words)
+    return joined if len(joined) < ROPE_LENGTH else Text([joined])
+
+class Text:
+    '''
+    A text value made of pieces, which are strings and other Texts.
+        Count: the text is pieces[:count]. Joining a text with more
+        words appends them to its pieces and reports a Text with a
+        larger count, so the longer text shares the list and the
+        shorter one is unchanged. A list some other Text has already
+        grown is not appended to again; the new Text holds the old
+        one as its first piece instead.
+
+        Flat: the joined string, once anything has needed it. The
+        Text then starts a fresh list of pieces holding just that.
+
+    A Text equals, hashes and compares like its string, so it can be
+    used wherever a string can be looked up or compared.
+    '''
+
+    __slots__ = ('pieces', 'count', 'length', 'flat')
+
+    def __init__(self, pieces = ()):
+        self.pieces = [piece if type(piece) == Text else textOf(piece) for piece in pieces]
+        self.count = len(self.pieces)
+        self.length = sum(len(piece) for piece in self.pieces)
+        self.flat = None
+
+    @classmethod
+    def join(cls, *words) -> 'Text':
+        '''
+        The words joined into one text, as Snap's join block does:
+        a string if it is shorter than ROPE_LENGTH, otherwise a Text.
+        '''
+        first = words[0] if words else None
+        if type(first) != Text or first.count != len(first.pieces):
+            text = cls(words)
+            return str(text) if text.length < ROPE_LENGTH else text
+        added = [word if type(word) == Text else textOf(word) for word in words[1:]]
+        text = cls.__new__(cls)
+        text.pieces = first.pieces
+        text.pieces.extend(added)
+        text.count = len(text.pieces)
+        text.length = first.length + sum(len(word) for word in added)
+        text.flat = None
+        return text
+
+    def __str__(self) -> str:
+        if self.flat == None:
+            # Nested Texts are expanded from an explicit stack, so any depth works.
+            parts = []
+            stack = [self]
+            while stack:
+                piece = stack.pop()
+                if type(piece) == str:
+                    parts.append(piece)
+                elif piece.flat != None:
+                    parts.append(piece.flat)
+                else:
+                    stack.extend(reversed(piece.pieces[:piece.count]))
+            self.flat = ''.join(parts)
+            self.pieces = [self.flat]
+            self.count = 1
+        return self.flat
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bool__(self) -> bool:
+        return self.length > 0
+
+    def __eq__(self, other : Any) -> bool:
+        if type(other) == Text:
+            return self is other or (self.length == other.length and str(self) == str(other))
+        elif type(other) == str:
+            return self.length == len(other) and str(self) == other
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __lt__(self, other : Any) -> bool:
+        return str(self) < (str(other) if type(other) == Text else other)
+
+    def __le__(self, other : Any) -> bool:
+        return str(self) <= (str(other) if type(other) == Text else other)
+
+    def __gt__(self, other : Any) -> bool:
+        return str(self) > (str(other) if type(other) == Text else other)
+
+    def __ge__(self, other : Any) -> bool:
+        return str(self) >= (str(other) if type(other) == Text else other)
+
+    def __contains__(self, text : Any) -> bool:
+        return str(text) in str(self)
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __getitem__(self, index):
+        return str(self)[index]
+
+    def split(self, separator : str = None) -> [str]:
+        return str(self).split(separator)
+
+    def __repr__(self) -> str:
+        return f'Text({str(self)!r})'
+
+    def __reduce__(self):
+        return Text, ([str(self)],)
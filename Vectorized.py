@@ -0,0 +1,377 @@
+from Block import *
+from Primitives import PRIMITIVES
+from Lists import SnapList
+from typing import Any
+import numpy as np
+import random
+import math
+
+'''
+Vectorized implementations of the pure operator blocks. Each takes and
+returns NumPy arrays or scalars and matches the scalar handler in
+Primitives.py, including the int versus float type of its result, for
+as long as int64 does not overflow and NumPy meets no floating point
+error. BatchEvaluator checks both and hands anything else to the
+scalar handlers.
+'''
+
+# Integers stay below this, so int64 never overflows and converting them to floats is exact.
+INTEGER_LIMIT = 2 ** 53
+
+def truthy(x):
+    return np.asarray(x).astype(bool)
+
+def isInteger(x) -> bool:
+    return np.asarray(x).dtype.kind in 'iu'
+
+def power(x, y):
+    # Python gives a float for a negative integer exponent; NumPy refuses.
+    if isInteger(x) and isInteger(y) and np.any(np.asarray(y) < 0):
+        return np.float_power(x, y)
+    return np.power(x, y)
+
+def toInteger(function):
+    '''
+    Wraps a NumPy rounding function, which keeps floats as floats,
+    to give ints like round, math.ceil and math.floor do.
+    '''
+    def vectorized(x):
+        if isInteger(x):
+            return x
+        return function(x).astype(np.int64)
+    return vectorized
+
+VECTOR_OPERATORS = {
+    'reportSum' : np.add,
+    'reportDiff' : np.subtract,
+    'reportProduct' : np.multiply,
+    'reportQuotient' : np.true_divide,
+    'reportPower' : power,
+    'reportModulus' : np.mod,
+    'reportRound' : toInteger(np.rint),
+    'reportLessThan' : np.less,
+    'reportEquals' : np.equal,
+    'reportGreaterThan' : np.greater,
+    # Python's and/or report one of their operands, not a bool.
+    'reportAnd' : lambda x, y: np.where(truthy(x), y, x),
+    'reportOr' : lambda x, y: np.where(truthy(x), x, y),
+    'reportNot' : lambda x: np.logical_not(truthy(x)),
+    'reportBoolean' : truthy
+}
+
+VECTOR_MONADIC = {
+    'abs' : np.abs,
+    'neg' : lambda x: -1 * x,
+    'ceiling' : toInteger(np.ceil),
+    'floor' : toInteger(np.floor),
+    'sqrt' : np.sqrt,
+    'sin' : np.sin,
+    'cos' : np.cos,
+    'tan' : np.tan,
+    'asin' : np.arcsin,
+    'acos' : np.arccos,
+    'atan' : np.arctan,
+    'ln' : np.log,
+    'log' : np.log10,
+    'lg' : lambda x: np.log(x) / math.log(2),
+    'e^' : lambda x: np.power(math.e, x),
+    '10^' : lambda x: power(10, x),
+    '2^' : lambda x: power(2, x),
+    'id' : lambda x: x
+}
+
+def magnitude(x) -> int:
+    '''
+    The largest magnitude in an array of ints or booleans, or of one.
+    '''
+    x = np.asarray(x)
+    return max(-int(x.min()), int(x.max()))
+
+def powerMagnitude(base : int, exponent : int) -> int:
+    # Past an exponent of 63 any base above 1 overflows, so the power is not worth working out.
+    return base ** exponent if base <= 1 or exponent < 64 else INTEGER_LIMIT
+
+# The largest magnitude each arithmetic block can give, from the magnitudes of its integer inputs.
+INTEGER_MAGNITUDES = {
+    'reportSum' : lambda a, b: a + b,
+    'reportDiff' : lambda a, b: a + b,
+    'reportProduct' : lambda a, b: a * b,
+    'reportModulus' : lambda a, b: b,
+    'reportPower' : powerMagnitude,
+    'reportRound' : lambda a: a,
+    'abs' : lambda a: a,
+    'neg' : lambda a: a,
+    'ceiling' : lambda a: a,
+    'floor' : lambda a: a,
+    '10^' : lambda a: powerMagnitude(10, a),
+    '2^' : lambda a: powerMagnitude(2, a)
+}
+
+# The blocks that turn floats into ints, which int64 only holds below INTEGER_LIMIT.
+ROUNDING = {'reportRound', 'ceiling', 'floor'}
+
+# The blocks that report one of their operands, which NumPy would convert to a common type.
+SELECTING = {'reportAnd', 'reportOr'}
+
+def isExact(name : str, inputs : []) -> bool:
+    '''
+    Whether the vectorized block or monadic function name gives what
+    its scalar handler does for inputs, as far as types and int64 go:
+    the inputs are numbers or booleans, the ints among them and any int
+    it can give stay below INTEGER_LIMIT, arithmetic is not done on
+    booleans alone, which NumPy treats as logic, and and/or only choose
+    between operands of one kind.
+    '''
+    arrays = [np.asarray(x) for x in inputs]
+    kinds = {array.dtype.kind for array in arrays}
+    if not kinds <= set('biuf'):
+        return False
+    integers = [magnitude(array) for array in arrays if array.dtype.kind in 'biu']
+    if any(integer >= INTEGER_LIMIT for integer in integers):
+        return False
+    if name in SELECTING:
+        return len(kinds) == 1
+    elif name not in INTEGER_MAGNITUDES:
+        return True
+    elif kinds == {'b'}:
+        return False
+    elif 'f' in kinds:
+        # Arithmetic with a float gives floats, but rounding one gives an int.
+        return name not in ROUNDING or bool(np.all(np.abs(arrays[0]) < INTEGER_LIMIT))
+    return INTEGER_MAGNITUDES[name](*integers) < INTEGER_LIMIT
+
+class BatchEvaluator:
+    '''
+    Evaluates a reporter over many variable bindings at once.
+        Columns: a dict of equally long arrays, keyed by variable name.
+        Variables without a column are read from the scope as usual.
+
+    Subtrees built only from the operators above run as NumPy ufuncs.
+    Any other subtree is evaluated row by row with the compiled scalar
+    path, and its results are fed back into the vectorized parent. An
+    operator whose inputs isExact turns down, or that meets a floating
+    point error, runs its scalar handler on every row of its inputs
+    instead, so it gives or raises exactly what the scalar path does.
+    '''
+
+    def __init__(self, executor, columns : {str : Any}, scope : {} = None):
+        self.executor = executor
+        self.scope = scope if scope != None else executor.project.globalVariables
+        self.columns = {name : np.asarray(column) for name, column in columns.items()}
+        lengths = {len(column) for column in self.columns.values()}
+        if len(lengths) != 1 or 0 in lengths:
+            raise ValueError('Batch columns must all have the same, non-zero number of rows!')
+        self.length = lengths.pop()
+        # Random blocks draw from Python's generator so random.seed still applies.
+        self.generator = np.random.default_rng(random.getrandbits(64))
+
+    def evaluate(self, value : Any) -> np.ndarray:
+        result = self.evaluateNode(value)
+        if np.ndim(result) == 0:
+            result = np.full(self.length, result, dtype=np.asarray(result).dtype)
+        return result
+
+    def evaluateNode(self, value : Any):
+        valueType = type(value)
+        if valueType in (int, float, bool):
+            return value
+        elif valueType == Variable:
+            return self.evaluateVariable(value)
+        elif valueType == Block and self.isVectorizable(value):
+            inputs, primitives = value.inputs, self.executor.primitives
+            if value.signature == 'reportMonadic':
+                option = inputs[0].text
+                return self.apply(option, VECTOR_MONADIC[option], primitives.lookupMonadic(option),
+                                  [self.evaluateNode(inputs[1])])
+            elif value.signature == 'reportRandom':
+                return self.reportRandom(*[self.evaluateNode(inp) for inp in inputs])
+            return self.apply(value.signature, VECTOR_OPERATORS[value.signature],
+                              primitives.lookup(value.signature).handler, [self.evaluateNode(inp) for inp in inputs])
+        return self.evaluateRows(value)
+
+    def apply(self, name : str, vectorized, handler, inputs : []):
+        if isExact(name, inputs):
+            try:
+                with np.errstate(all='raise'):
+                    return vectorized(*inputs)
+            except FloatingPointError:
+                # Python raises, or gives inf or nan, where NumPy flagged an error; the handler knows which.
+                pass
+        rows = [np.asarray(x).tolist() for x in inputs]
+        if all(np.ndim(x) == 0 for x in inputs):
+            return handler(*rows)
+        rows = [row if type(row) == list else [row] * self.length for row in rows]
+        return self.toArray([handler(*row) for row in zip(*rows)])
+
+    def evaluateVariable(self, variable : Variable):
+        if variable.name in self.columns:
+            column = self.columns[variable.name]
+            # Anything but numbers and booleans keeps Python's semantics as objects.
+            return column if column.dtype.kind in 'biuf' else column.astype(object)
+        value = self.executor.evaluate(variable, self.scope)
+        return value if type(value) in (int, float, bool) else np.array(value, dtype=object)
+
+    def isVectorizable(self, block : Block) -> bool:
+        '''
+        Whether NumPy can run the block itself; its inputs decide for
+        themselves. An operator a project has overridden in its
+        registry is not vectorized.
+        '''
+        signature = block.signature
+        primitives = self.executor.primitives
+        if signature not in primitives or primitives.lookup(signature) is not PRIMITIVES.lookup(signature):
+            return False
+        if signature == 'reportMonadic':
+            option = block.inputs[0]
+            return type(option) == Option and option.text in VECTOR_MONADIC and \
+                primitives.monadic.get(option.text) is PRIMITIVES.monadic.get(option.text)
+        return signature == 'reportRandom' or signature in VECTOR_OPERATORS
+
+    def reportRandom(self, start, stop):
+        if isInteger(start) and isInteger(stop):
+            return self.generator.integers(start, np.asarray(stop) + 1, size=self.length)
+        return self.generator.uniform(start, stop, size=self.length)
+
+    def evaluateRows(self, value : Any) -> np.ndarray:
+        '''
+        The fallback for subtrees NumPy cannot run: the compiled
+        scalar path, called once per row.
+        '''
+        compiled = self.executor.compile(value)
+        rows = {name : column.tolist() for name, column in self.columns.items()}
+        scope = dict(self.scope)
+        results = []
+        for i in range(self.length):
+            for name, column in rows.items():
+                scope[name] = column[i]
+            results.append(compiled(scope))
+        return self.toArray(results)
+
+    def toArray(self, results : []) -> np.ndarray:
+        '''
+        The results of a scalar path as an array, which is an array of
+        objects unless they are all floats, all booleans or all ints
+        that int64 holds exactly. NumPy would convert a mix to one type.
+        '''
+        types = set(map(type, results))
+        if types == {float} or types == {bool} or \
+           types == {int} and all(-INTEGER_LIMIT < result < INTEGER_LIMIT for result in results):
+            return np.array(results)
+        array = np.empty(self.length, dtype=object)
+        for i, result in enumerate(results):
+            array[i] = result
+        return array
+
+'''
+Rings over arrays. map and keep run a ring body over every item of a
+list in one pass when the body is made of operators that give exactly
+what the scalar handlers give. Rounding and powers are left out, since
+their int64 results can overflow where Python's ints just grow.
+'''
+
+RING_OPERATORS = {
+    'reportSum', 'reportDiff', 'reportProduct', 'reportQuotient', 'reportModulus',
+    'reportLessThan', 'reportEquals', 'reportGreaterThan',
+    'reportAnd', 'reportOr', 'reportNot', 'reportBoolean'
+}
+
+RING_MONADIC = {'abs', 'neg', 'id', 'sqrt', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'ln', 'log', 'lg'}
+
+def ringType(executor, node : Any, parameter : str, bound : int, scope : {}):
+    '''
+    The type node gives over an array of parameters, as ('int', the
+    largest magnitude it can reach), ('float', 0) or ('bool', 1), when
+    the parameter is an array of ints no bigger than bound, or of
+    floats if bound is None. Returns None if NumPy might not give the
+    same values as the scalar handlers.
+    '''
+    nodeType = type(node)
+    if nodeType == bool:
+        return ('bool', 1)
+    elif nodeType == int:
+        return ('int', abs(node)) if abs(node) < INTEGER_LIMIT else None
+    elif nodeType == float:
+        return ('float', 0)
+    elif nodeType == Variable:
+        if node.name == parameter:
+            return ('int', bound) if bound != None else ('float', 0)
+        try:
+            value = executor.evaluate(node, scope)
+        except (ValueError, KeyError):
+            return None
+        return ringType(executor, value, None, None, scope) if type(value) in (int, float) else None
+    elif nodeType != Block:
+        return None
+
+    signature, primitives = node.signature, executor.primitives
+    if signature not in primitives or primitives.lookup(signature) is not PRIMITIVES.lookup(signature):
+        return None
+    if signature == 'reportMonadic':
+        option, operand = node.inputs
+        if type(option) != Option or option.text not in RING_MONADIC or \
+           primitives.monadic.get(option.text) is not PRIMITIVES.monadic.get(option.text):
+            return None
+        operand = ringType(executor, operand, parameter, bound, scope)
+        if operand == None or operand[0] == 'bool':
+            return None
+        return operand if option.text in ('abs', 'neg', 'id') else ('float', 0)
+    elif signature not in RING_OPERATORS:
+        return None
+
+    inputs = [ringType(executor, inp, parameter, bound, scope) for inp in node.inputs]
+    if None in inputs:
+        return None
+    kinds = {kind for kind, magnitude in inputs}
+    if signature in ('reportLessThan', 'reportEquals', 'reportGreaterThan', 'reportNot', 'reportBoolean'):
+        return ('bool', 1)
+    elif signature in ('reportAnd', 'reportOr'):
+        # Python reports one of the operands, so mixed types would come back as one.
+        return ('bool', 1) if kinds == {'bool'} else None
+    elif kinds == {'bool'}:
+        # NumPy adds booleans as a logical or.
+        return None
+    elif signature == 'reportQuotient' or 'float' in kinds:
+        return ('float', 0)
+    (x, a), (y, b) = inputs
+    magnitude = a * b if signature == 'reportProduct' else b if signature == 'reportModulus' else a + b
+    return ('int', magnitude) if magnitude < INTEGER_LIMIT else None
+
+def ringArray(items : Any):
+    '''
+    The items of a list as an int64 or float64 array, or None if they
+    are not all ints or all floats.
+    '''
+    if type(items) == np.ndarray:
+        return items if items.dtype.kind in 'if' else None
+    numbers = items.asRange() if type(items) == SnapList else None
+    if numbers != None:
+        # A lazy list of numbers never becomes a Python list.
+        if not numbers or max(abs(numbers[0]), abs(numbers[-1])) >= INTEGER_LIMIT:
+            return None
+        return np.arange(numbers.start, numbers.stop, numbers.step, dtype=np.int64)
+    items = list(items)
+    types = set(map(type, items))
+    if types == {int}:
+        if not items or max(items) >= INTEGER_LIMIT or min(items) <= -INTEGER_LIMIT:
+            return None
+        return np.array(items, dtype=np.int64)
+    elif types == {float}:
+        return np.array(items, dtype=np.float64)
+    return None
+
+def mapRing(executor, body : Any, parameter : str, items : np.ndarray, scope : {}):
+    '''
+    Evaluates a ring body with parameter bound to each item of an array,
+    in one vectorized pass. Returns None if the body cannot run over
+    arrays exactly as it runs item by item, or if NumPy meets a
+    floating point error, which the scalar path then reports as Python
+    would.
+    '''
+    bound = max(-int(items.min()), int(items.max())) if items.dtype.kind == 'i' else None
+    if ringType(executor, body, parameter, bound, scope) == None:
+        return None
+    try:
+        with np.errstate(all='raise'):
+            return BatchEvaluator(executor, {parameter : items}, scope).evaluate(body)
+    except (FloatingPointError, ZeroDivisionError, ValueError, OverflowError):
+        return None
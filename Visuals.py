@@ -14,9 +14,26 @@ class Stage:
         self.blocks = blocks
         self.scripts = scripts
         self.sprites = sprites
+        self.pentrails = None
+
+class Costume:
+    '''
+    A costume of a sprite or the stage. The image is a
+    MediaHandle, so it is only decoded when it is needed.
+    '''
+
+    def __init__(self, name : str, centerX : float, centerY : float, image = None):
+        self.name = name
+        self.center = centerX, centerY
+        self.image = image
 
 class Sprite:
 
+    # The SpriteStore holding a StoredSprite's position and heading.
+    store = None
+    # The SpatialIndex the sprite is in, which setPosition keeps up to date.
+    spatialIndex = None
+
     def __init__(
         self, name : str,
         index : str, xCoord : int,
@@ -41,3 +58,7 @@ class Sprite:
         self.color = color
         self.pen = pen
         self.id = id
+        self.variables = {}
+        self.scripts = []
+        # The sprite this one is a clone of, or None for an original.
+        self.exemplar = None
@@ -0,0 +1,224 @@
+'''
+A repeatable benchmark suite for tracking performance regressions.
+Run with `python benchmarkSuite.py`. Every case is timed, the results
+are written as JSON and compared against a stored baseline; a case
+that got slower than the baseline by more than the threshold is a
+regression, and the run exits with status 1.
+
+    python benchmarkSuite.py --output results.json
+    python benchmarkSuite.py --save-baseline
+    python benchmarkSuite.py --filter parse --threshold 0.1
+
+Baselines are only comparable on the machine that recorded them, so
+record one before making a change and compare after it.
+'''
+
+import xml.etree.ElementTree as ET
+import statistics
+import platform
+import argparse
+import datetime
+import timeit
+import json
+import sys
+import re
+from typing import Any
+from benchmarks import CORPUS, operatorExpressions, generatedScript, expressionChain
+from Block import Script, blockToXML, xmlToBlock
+from SnapBlocks import *
+from Project import Project
+
+BASELINE = 'benchmarkBaseline.json'
+
+class Case:
+    '''
+    A named benchmark: a function timed per call.
+        Setup: called once before timing; returns the function to time.
+    '''
+
+    def __init__(self, name : str, setup):
+        self.name = name
+        self.setup = setup
+
+def corpusStrings(path : str) -> [str]:
+    '''
+    The XML of every block in the scripts of a project file.
+    '''
+    return [ET.tostring(element, encoding='unicode')
+            for script in ET.parse(path).getroot().iter('script') for element in script]
+
+def parseCase(strings : [str]):
+    return lambda: lambda: [xmlToBlock(xml) for xml in strings]
+
+def serializeCase(strings : [str]):
+    def setup():
+        blocks = [xmlToBlock(xml) for xml in strings]
+        return lambda: [blockToXML(block) for block in blocks]
+    return setup
+
+def evaluateCase(expression : Block):
+    def setup():
+        project = Project()
+        project.addGlobalVariable('x')
+        project.setGlobalVariable('x', 1)
+        executor = project.executor
+        return lambda: executor.evaluate(expression)
+    return setup
+
+def balancedSum(depth : int):
+    if depth == 0:
+        return Variable('x')
+    return plus(balancedSum(depth - 1), balancedSum(depth - 1))
+
+def variableLoop(iterations : int = 1000):
+    return [scriptVariables([Option('n')]), setVariableTo('n', 0),
+            repeat(iterations, [changeVariableBy('n', 1),
+                                changeVariableBy('total', Variable('n')),
+                                setVariableTo('last', plus(Variable('last'), Variable('n')))])]
+
+def variablesCase(compiled : bool):
+    def setup():
+        project = Project()
+        project.addGlobalVariable('total')
+        project.setGlobalVariable('total', 0)
+        script = variableLoop()
+        if compiled:
+            run = project.executor.compileScript(script)
+            return lambda: run({'last' : 0})
+        return lambda: project.executor.runScript(Script(script, {'last' : 0}))
+    return setup
+
+def suiteCases() -> [Case]:
+    cases = []
+    generated = [blockToXML(Block('doWarp', [Script(generatedScript(2000), {})]))]
+    for path in CORPUS:
+        name, strings = path.split('/')[-1][:-len('.xml')], corpusStrings(path)
+        if strings:
+            cases.append(Case(f'parse/{name}', parseCase(strings)))
+            cases.append(Case(f'serialize/{name}', serializeCase(strings)))
+    cases.append(Case('parse/generated-2000', parseCase(generated)))
+    cases.append(Case('serialize/generated-2000', serializeCase(generated)))
+
+    for expression in operatorExpressions():
+        name = expression.signature
+        if name == 'reportMonadic':
+            name += '-' + expression.inputs[0].text
+        cases.append(Case(f'evaluate/{name}', evaluateCase(expression)))
+    for depth in (100, 1000):
+        cases.append(Case(f'evaluate/deep-{depth}', evaluateCase(expressionChain(depth))))
+    cases.append(Case('evaluate/balanced-10', evaluateCase(balancedSum(10))))
+    cases.append(Case('evaluate/wide-1000', evaluateCase(Block('reportNewList', [plus(Variable('x'), i) for i in range(1000)]))))
+
+    cases.append(Case('variables/interpreted-loop', variablesCase(False)))
+    cases.append(Case('variables/compiled-loop', variablesCase(True)))
+    return cases
+
+def timeCase(case : Case, repeat : int, minTime : float) -> {str : float}:
+    '''
+    Calls the case's function often enough for each of repeat samples
+    to take at least minTime, and reports seconds per call.
+    '''
+    timer = timeit.Timer(case.setup())
+    number = 1
+    while timer.timeit(number) < minTime:
+        number *= 2
+    samples = [total / number for total in timer.repeat(repeat, number)]
+    return {
+        'seconds' : min(samples),
+        'median' : statistics.median(samples),
+        'number' : number,
+        'repeat' : repeat
+    }
+
+def runSuite(pattern : str = None, repeat : int = 5, minTime : float = 0.05, log = None) -> {str : Any}:
+    '''
+    Runs every case whose name matches pattern and returns the
+    results, with the environment they were recorded in.
+    '''
+    results = {}
+    for case in suiteCases():
+        if pattern != None and not re.search(pattern, case.name):
+            continue
+        results[case.name] = timeCase(case, repeat, minTime)
+        if log != None:
+            log(f'{case.name:<36}{results[case.name]["seconds"] * 1e6:>14.2f}us')
+    return {
+        'version' : 1,
+        'recorded' : datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python' : platform.python_version(),
+        'implementation' : platform.python_implementation(),
+        'machine' : platform.machine(),
+        'platform' : platform.platform(),
+        'results' : results
+    }
+
+def compareResults(current : {str : Any}, baseline : {str : Any}, threshold : float) -> {str : [str]}:
+    '''
+    Compares the best time of every case against the baseline. A case
+    is a regression if it takes more than (1 + threshold) times its
+    baseline, and an improvement if it takes less than 1 / (1 + threshold).
+    '''
+    comparison = {'regressions' : [], 'improvements' : [], 'unchanged' : [], 'new' : [], 'missing' : []}
+    before, after = baseline['results'], current['results']
+    for name, result in after.items():
+        if name not in before:
+            comparison['new'].append(name)
+            continue
+        ratio = result['seconds'] / before[name]['seconds']
+        if ratio > 1 + threshold:
+            comparison['regressions'].append(name)
+        elif ratio < 1 / (1 + threshold):
+            comparison['improvements'].append(name)
+        else:
+            comparison['unchanged'].append(name)
+    comparison['missing'] = [name for name in before if name not in after]
+    return comparison
+
+def printComparison(current : {str : Any}, baseline : {str : Any}, comparison : {str : [str]}):
+    print(f'{"case":<36}{"baseline (us)":>14}{"current (us)":>14}{"ratio":>8}')
+    for kind in ('regressions', 'improvements'):
+        for name in comparison[kind]:
+            before, after = baseline['results'][name]['seconds'], current['results'][name]['seconds']
+            print(f'{name:<36}{before * 1e6:>14.2f}{after * 1e6:>14.2f}{after / before:>7.2f}x')
+    print(', '.join(f'{len(names)} {kind}' for kind, names in comparison.items()))
+
+def main(arguments : [str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Runs the benchmark suite and compares it against a baseline.')
+    parser.add_argument('--output', help='write the results as JSON to this file, or - for stdout')
+    parser.add_argument('--baseline', default=BASELINE, help=f'the baseline to compare against (default {BASELINE})')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='how much slower than its baseline a case may get, as a fraction (default 0.25)')
+    parser.add_argument('--filter', help='only run cases whose name matches this regular expression')
+    parser.add_argument('--repeat', type=int, default=5, help='samples per case; the fastest counts (default 5)')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per sample (default 0.05)')
+    options = parser.parse_args(arguments)
+
+    current = runSuite(options.filter, options.repeat, options.min_time, lambda line: print(line, file=sys.stderr))
+    if options.output == '-':
+        json.dump(current, sys.stdout, indent=2)
+        print()
+    elif options.output != None:
+        with open(options.output, 'w') as file:
+            json.dump(current, file, indent=2)
+
+    if options.save_baseline:
+        with open(options.baseline, 'w') as file:
+            json.dump(current, file, indent=2)
+        return 0
+    try:
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f'No baseline at {options.baseline}; run with --save-baseline to record one.', file=sys.stderr)
+        return 0
+
+    if options.filter != None:
+        baseline['results'] = {name : result for name, result in baseline['results'].items()
+                               if re.search(options.filter, name)}
+    comparison = compareResults(current, baseline, options.threshold)
+    printComparison(current, baseline, comparison)
+    return 1 if comparison['regressions'] else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,864 @@
+'''
+Benchmarks for Snappy.
+Run with `python benchmarks.py`; each benchmark prints its timings.
+'''
+
+import timeit
+import time
+import re
+import os
+import glob
+import base64
+import tempfile
+import resource
+import tracemalloc
+import concurrent.futures
+import multiprocessing
+import xml.etree.ElementTree as ET
+from SnapBlocks import *
+from Project import Project
+from Visuals import Sprite
+
+# TestXMLs/operatorblocks.xml is not well-formed, so it is left out.
+CORPUS = [path for path in sorted(glob.glob('TestXMLs/*.xml'))
+          if not path.endswith(('operatorblocks.xml', 'output.xml'))]
+
+def operatorExpressions():
+    '''
+    The operator expressions exercised by TestExecutor.test_operators.
+    '''
+    return [
+        plus(1, 2), subtract(0, 1), multiply(5, 5), divide(20, 2),
+        power(7, 2), modulo(7, 2), reportRound(2.51), absOf(-10),
+        negOf(10), ceilOf(2.1), floorOf(2.9), sqrtOf(9), sinOf(3.14),
+        cosOf(3.14), tanOf(3.14), asinOf(1), acosOf(1), atanOf(1),
+        lnOf(4), logOf(10), binLogOf(4), eTo(2), tenTo(4), twoTo(4),
+        identity(1), pickRandom(1, 10), lessThan(1, 2), equalTo(1, 1),
+        greaterThan(4, 3), andOp(True, True), orOp(False, True),
+        notOp(False), boolean(1), join(['this', 'is', 'a', 'test']),
+        textSplit('this is a test', ' ')
+    ]
+
+def nestedExpression(depth : int):
+    '''
+    A reporter tree mixing arithmetic, monadic and variable blocks.
+    '''
+    expression = Variable('x')
+    for i in range(depth):
+        expression = plus(multiply(expression, 2), sqrtOf(Variable('y')))
+    return expression
+
+def timePerCall(function, number : int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+def literalHeavyExpression(depth : int):
+    '''
+    A reporter tree whose literal subtrees are what the optimizer folds.
+    '''
+    expression = Variable('x')
+    for i in range(depth):
+        expression = plus(multiply(expression, divide(multiply(2, 3.14), sqrtOf(16))), plus(Variable('x'), 1))
+    return expression
+
+def benchmarkOptimize(number : int = 20000):
+    '''
+    Compares evaluating a tree before and after the optimizer pass.
+    '''
+    from Optimizer import optimize
+    project = Project()
+    executor = project.executor
+    project.addGlobalVariable('x')
+    project.setGlobalVariable('x', 1)
+
+    print(f'{"depth":>6}{"original (us)":>16}{"optimized (us)":>16}{"speedup":>10}')
+    for depth in [1, 4, 16]:
+        expression = literalHeavyExpression(depth)
+        optimized = optimize(expression)
+        originalTime = timePerCall(lambda: executor.evaluate(expression), number // depth)
+        optimizedTime = timePerCall(lambda: executor.evaluate(optimized), number // depth)
+        print(f'{depth:>6}{originalTime * 1e6:>16.3f}{optimizedTime * 1e6:>16.3f}{originalTime / optimizedTime:>9.1f}x')
+
+class DictBlock:
+    '''
+    The Block class as it was before it got __slots__,
+    kept to compare memory use against.
+    '''
+
+    def __init__(self, signature, inputs):
+        self.signature = signature
+        self.inputs = inputs
+
+class DictVariable(DictBlock):
+
+    def __init__(self, name):
+        self.name = name
+
+class DictOption:
+
+    def __init__(self, text):
+        self.text = text
+        self.tag = None
+
+def generatedScript(blocks : int, block = Block, variable = Variable, option = Option):
+    '''
+    A long script of small expressions over a few loop variables,
+    the shape generated projects have. Every string and number is
+    parsed afresh, as it would be when read from XML.
+    '''
+    script = []
+    for i in range(blocks // 5):
+        name = str('ijk'[i % 3])
+        value = block('reportMonadic', [option(str('abs')), variable(name)])
+        value = block('reportSum', [value, int(str(i % 10))])
+        value = block('reportProduct', [value, float(str(i % 4) + '.5')])
+        script.append(block('doSetVar', [option(name), value]))
+    return script
+
+def benchmarkBlockMemory(blocks : int = 500000):
+    '''
+    Compares the memory held by a large generated script with the old
+    __dict__ classes, the __slots__ classes, and the interned form.
+    '''
+    print(f'{"representation":<18}{"memory (MB)":>14}')
+    cases = [
+        ('__dict__', lambda: generatedScript(blocks, DictBlock, DictVariable, DictOption)),
+        ('__slots__', lambda: generatedScript(blocks)),
+        ('interned', lambda: NodeTable().intern(generatedScript(blocks)))
+    ]
+    for name, build in cases:
+        tracemalloc.start()
+        script = build()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del script
+        print(f'{name:<18}{held / 2 ** 20:>14.1f}')
+
+def benchmarkCompile(number : int = 20000):
+    '''
+    Compares the tree-walking evaluate against compiled closures.
+    '''
+    project = Project()
+    executor = project.executor
+    project.addGlobalVariable('x')
+    project.addGlobalVariable('y')
+    project.setGlobalVariable('x', 1)
+    project.setGlobalVariable('y', 4)
+
+    cases = [(expression.signature, expression) for expression in operatorExpressions()]
+    cases.append(('nested(8)', nestedExpression(8)))
+
+    print(f'{"expression":<20}{"evaluate (us)":>16}{"compiled (us)":>16}{"speedup":>10}')
+    totalEvaluate = totalCompiled = 0
+    for name, expression in cases:
+        compiled = executor.compile(expression)
+        evaluateTime = timePerCall(lambda: executor.evaluate(expression), number)
+        compiledTime = timePerCall(compiled, number)
+        totalEvaluate += evaluateTime
+        totalCompiled += compiledTime
+        print(f'{name:<20}{evaluateTime * 1e6:>16.3f}{compiledTime * 1e6:>16.3f}{evaluateTime / compiledTime:>9.1f}x')
+    print(f'{"total":<20}{totalEvaluate * 1e6:>16.3f}{totalCompiled * 1e6:>16.3f}{totalEvaluate / totalCompiled:>9.1f}x')
+
+def scaledProject(path : str, copies : int, imageSize : int = 200000):
+    '''
+    Writes a project file to path holding copies of every sprite in the
+    TestXMLs corpus, each with a costume embedding imageSize bytes of
+    base64 data, the way real projects embed their media.
+    Returns the number of sprites written.
+    '''
+    sprites = []
+    for corpusPath in CORPUS:
+        with open(corpusPath) as corpusFile:
+            sprites.extend(re.findall(r'<sprite .*?</sprite>', corpusFile.read(), re.S))
+
+    image = base64.b64encode(os.urandom(imageSize * 3 // 4)).decode('ascii')
+    costume = f'<costume name="photo" center-x="0" center-y="0" image="data:image/png;base64,{image}"/>'
+    with open(path, 'w') as projectFile:
+        projectFile.write('<project name="scaled" app="Snap! 6" version="1">')
+        projectFile.write(f'<thumbnail>data:image/png;base64,{image}</thumbnail>')
+        projectFile.write('<stage name="Stage" width="480" height="360"><sprites>')
+        for i in range(copies):
+            for j, sprite in enumerate(sprites):
+                sprite = re.sub(r'name="[^"]*"', f'name="Sprite {i}.{j}"', sprite, count=1)
+                sprite = sprite.replace('<costumes>', f'<costumes><list><item>{costume}</item></list>', 1)
+                projectFile.write(sprite)
+        projectFile.write('</sprites></stage><variables></variables></project>')
+    return copies * len(sprites)
+
+def measureLoad(mode : str, path : str):
+    '''
+    Loads path in a fresh process so its peak RSS belongs to this load alone.
+    '''
+    start = time.perf_counter()
+    if mode == 'stream':
+        Project.load(path)
+    else:
+        ET.parse(path)
+    return time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def benchmarkLoad(copies = (10, 50, 200)):
+    '''
+    Compares the streaming Project.load against parsing the whole
+    file into an ElementTree, on the TestXMLs corpus scaled up.
+    '''
+    context = multiprocessing.get_context('spawn')
+    print(f'{"sprites":>8}{"size (MB)":>12}{"mode":>8}{"MB/s":>10}{"peak RSS (MB)":>16}')
+    with tempfile.TemporaryDirectory() as directory:
+        for count in copies:
+            path = os.path.join(directory, f'scaled{count}.xml')
+            sprites = scaledProject(path, count)
+            size = os.path.getsize(path) / 2 ** 20
+            for mode in ['tree', 'stream']:
+                with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                    seconds, peak = pool.submit(measureLoad, mode, path).result()
+                print(f'{sprites:>8}{size:>12.1f}{mode:>8}{size / seconds:>10.1f}{peak / 1024:>16.1f}')
+
+def benchmarkMedia(projects : int = 20, copies : int = 5):
+    '''
+    Measures the memory held by many open projects when their costume
+    images stay as MediaHandles, against decoding them all.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'media.xml')
+        scaledProject(path, copies)
+        print(f'{"images":>10}{"held (MB)":>12}')
+        for decoded in [False, True]:
+            tracemalloc.start()
+            opened = [Project.load(path) for i in range(projects)]
+            images = [
+                costume.image.decode() if decoded else costume.image
+                for project in opened for sprite in project.sprites.values()
+                for costume in sprite.costumes
+            ]
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f'{"decoded" if decoded else "handles":>10}{held / 2 ** 20:>12.1f}')
+            del opened, images
+
+def benchmarkBatch(rows = (10 ** 5, 10 ** 6)):
+    '''
+    Evaluates one reporter over many bindings: a loop of evaluate calls,
+    a loop over the compiled closure, and evaluateBatch.
+    '''
+    import numpy as np
+    project = Project()
+    executor = project.executor
+    expression = plus(multiply(Variable('x'), 2), sqrtOf(Variable('y')))
+    compiled = executor.compile(expression)
+
+    print(f'{"rows":>10}{"evaluate (s)":>14}{"compiled (s)":>14}{"batch (s)":>12}{"speedup":>10}')
+    for count in rows:
+        columns = {'x' : np.arange(count), 'y' : np.random.random(count)}
+        xs, ys = columns['x'].tolist(), columns['y'].tolist()
+
+        start = time.perf_counter()
+        for x, y in zip(xs, ys):
+            executor.evaluate(expression, {'x' : x, 'y' : y})
+        evaluateTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for x, y in zip(xs, ys):
+            compiled({'x' : x, 'y' : y})
+        compiledTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        executor.evaluateBatch(expression, columns)
+        batchTime = time.perf_counter() - start
+        print(f'{count:>10}{evaluateTime:>14.3f}{compiledTime:>14.3f}{batchTime:>12.4f}{evaluateTime / batchTime:>9.0f}x')
+
+def benchmarkMemoization(frames : int = 2000):
+    '''
+    A game-loop style script: every frame changes a counter and reads
+    an expensive reporter that only depends on a rarely changed variable.
+    '''
+    print(f'{"depth":>6}{"plain (ms)":>14}{"memoized (ms)":>16}{"hit rate":>10}{"speedup":>10}')
+    for depth in [4, 16, 64]:
+        loop = [Block('doRepeat', [frames, [
+            changeVariableBy('frame', 1),
+            setVariableTo('result', plus(nestedExpression(depth), Variable('frame')))
+        ]])]
+        times = []
+        for memoize in [False, True]:
+            project = Project()
+            for name, value in [('x', 1), ('y', 4), ('frame', 0), ('result', 0)]:
+                project.addGlobalVariable(name)
+                project.setGlobalVariable(name, value)
+            memo = project.executor.enableMemoization() if memoize else None
+            start = time.perf_counter()
+            project.executor.executeScript(loop)
+            times.append(time.perf_counter() - start)
+        statistics = memo.statistics()
+        hitRate = statistics['hits'] / (statistics['hits'] + statistics['misses'])
+        print(f'{depth:>6}{times[0] * 1e3:>14.2f}{times[1] * 1e3:>16.2f}{hitRate:>10.1%}{times[0] / times[1]:>9.1f}x')
+
+def benchmarkSerialize(blocks = (10 ** 4, 10 ** 5, 5 * 10 ** 5)):
+    '''
+    Compares writing a long script to a file through ElementTree,
+    which builds every element first, with the streaming XMLWriter.
+    '''
+    from Block import Script, formatBlockInput, writeXML
+    print(f'{"blocks":>10}{"path":>12}{"time (s)":>12}{"MB/s":>10}{"peak (MB)":>12}')
+    for count in blocks:
+        script = Script(generatedScript(count), {})
+        cases = [
+            ('tostring', lambda stream: stream.write(ET.tostring(formatBlockInput(script)))),
+            ('streaming', lambda stream: writeXML(script, stream))
+        ]
+        for name, write in cases:
+            with tempfile.TemporaryFile() as stream:
+                start = time.perf_counter()
+                write(stream)
+                elapsed = time.perf_counter() - start
+                size = stream.tell()
+                stream.seek(0)
+                tracemalloc.start()
+                write(stream)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            print(f'{count:>10}{name:>12}{elapsed:>12.3f}{size / elapsed / 2 ** 20:>10.1f}{peak / 2 ** 20:>12.1f}')
+
+def benchmarkParse(number : int = 200):
+    '''
+    Compares xmlToBlock's expat parser with the ElementTree round trip
+    on every block of the corpus, and on one long generated script.
+    '''
+    from Block import Script, formatBlockInput, xmlToBlock, elementToBlock
+    corpus = []
+    for path in CORPUS:
+        for script in ET.parse(path).getroot().iter('script'):
+            corpus.extend(ET.tostring(element) for element in script)
+    generated = [ET.tostring(formatBlockInput(Block('doWarp', [Script(generatedScript(20000), {})])))]
+
+    print(f'{"input":<12}{"strings":>8}{"ElementTree (ms)":>18}{"expat (ms)":>12}{"speedup":>10}')
+    for name, strings, repeat in [('TestXMLs', corpus, number), ('generated', generated, 5)]:
+        treeTime = timePerCall(lambda: [elementToBlock(ET.fromstring(xml)) for xml in strings], repeat)
+        expatTime = timePerCall(lambda: [xmlToBlock(xml) for xml in strings], repeat)
+        print(f'{name:<12}{len(strings):>8}{treeTime * 1e3:>18.2f}{expatTime * 1e3:>12.2f}{treeTime / expatTime:>9.2f}x')
+
+def recursiveEvaluate(executor, value, scope):
+    '''
+    Executor.evaluate as it was before it used an explicit stack.
+    '''
+    if type(value) == Option:
+        return value.text
+    elif type(value) == Variable:
+        return scope[value.name] if value.name in scope else executor.project.getGlobalVariable(value.name)
+    elif type(value) == Block:
+        primitive = executor.primitives.lookup(value.signature)
+        if primitive.special:
+            return primitive.handler(executor, value, scope)
+        return primitive.handler(*[recursiveEvaluate(executor, inp, scope) for inp in value.inputs])
+    return value
+
+def recursiveToXML(value) -> str:
+    '''
+    Block serialization as it was before it used an explicit stack.
+    '''
+    if type(value) == Block:
+        return f'<block s="{value.signature}">' + ''.join(recursiveToXML(inp) for inp in value.inputs) + '</block>'
+    elif type(value) == Variable:
+        return f'<block var="{value.name}" />'
+    return f'<l>{value}</l>'
+
+def recursiveParse(element):
+    '''
+    formatXMLInputs as it was before it used an explicit stack,
+    for the blocks and literals of expressionChain.
+    '''
+    if element.tag == 'block':
+        if 'var' in element.attrib:
+            return Variable(element.attrib['var'])
+        return Block(element.attrib['s'], [recursiveParse(child) for child in element])
+    return formatLiteral(element.text)
+
+def expressionChain(depth : int):
+    expression = Variable('x')
+    for i in range(depth):
+        expression = plus(expression, 1)
+    return expression
+
+def timeOrFailure(function) -> str:
+    try:
+        start = time.perf_counter()
+        function()
+        return f'{(time.perf_counter() - start) * 1e3:.2f}'
+    except RecursionError:
+        return 'RecursionError'
+
+def benchmarkDepth(depths = (10, 100, 1000, 10000, 100000)):
+    '''
+    Times evaluating, serializing and parsing ever deeper expression
+    chains with the recursive code they used to run on and with the
+    explicit-stack code they run on now. Times are in ms.
+    '''
+    project = Project()
+    project.addGlobalVariable('x')
+    project.setGlobalVariable('x', 0)
+    executor = project.executor
+    scope = project.globalVariables
+    print(f'{"depth":>8}{"path":>12}{"evaluate":>16}{"serialize":>16}{"parse":>16}')
+    for depth in depths:
+        expression = expressionChain(depth)
+        xml = blockToXML(expression)
+        # Repeat shallow chains so their times are measurable.
+        repeat = max(1, 10000 // depth)
+        cases = [
+            ('recursive', lambda: recursiveEvaluate(executor, expression, scope),
+             lambda: recursiveToXML(expression), lambda: recursiveParse(ET.fromstring(xml))),
+            ('stack', lambda: executor.evaluate(expression),
+             lambda: blockToXML(expression), lambda: xmlToBlock(xml))
+        ]
+        for name, *functions in cases:
+            times = [timeOrFailure(lambda: [function() for i in range(repeat)]) for function in functions]
+            times = [t if t == 'RecursionError' else f'{float(t) / repeat:.4f}' for t in times]
+            print(f'{depth:>8}{name:>12}' + ''.join(f'{t:>16}' for t in times))
+
+def benchmarkScheduler(threadCounts = (100, 1000, 10000), frames : int = 50):
+    '''
+    Frames per second of the Scheduler as the number of threads grows.
+    Every thread is a forever loop that changes its own variable, so
+    each frame costs one yield and one block per thread.
+    '''
+    print(f'{"threads":>10}{"frames/s":>12}{"us/thread/frame":>18}')
+    for count in threadCounts:
+        project = Project()
+        for i in range(count):
+            project.scripts.append(Script([greenFlag(), forever([changeVariableBy('n', 1)])], {'n' : 0}))
+        project.scheduler.greenFlag()
+        start = time.perf_counter()
+        project.scheduler.run(frames)
+        elapsed = time.perf_counter() - start
+        print(f'{count:>10}{frames / elapsed:>12.1f}{elapsed / frames / count * 1e6:>18.2f}')
+
+def benchmarkBatchRunner(jobs : int = 64, iterations : int = 2000):
+    '''
+    Throughput of the BatchRunner as workers are added, up to one per
+    core, against running every job in this process. Each job is a
+    CPU-bound loop, so ideal scaling is linear in the workers.
+    '''
+    from Batch import BatchRunner
+    script = [scriptVariables([Option('n')]), setVariableTo('n', 0),
+              repeat(iterations, [changeVariableBy('n', multiply(2, 3))])]
+    counts = [0] + [count for count in (1, 2, 4, 8, 16, 32, 64) if count < os.cpu_count()] + [os.cpu_count()]
+    print(f'{"workers":>10}{"jobs/s":>12}{"speedup":>10}')
+    baseline = None
+    for count in sorted(set(counts)):
+        with BatchRunner(count) as runner:
+            # The pool is warmed up first so start-up is not timed.
+            list(runner.run([script] * count))
+            start = time.perf_counter()
+            list(runner.run([script] * jobs))
+            elapsed = time.perf_counter() - start
+        baseline = baseline or jobs / elapsed
+        print(f'{count:>10}{jobs / elapsed:>12.1f}{jobs / elapsed / baseline:>9.2f}x')
+
+def benchmarkScopes(iterations : int = 20000, number : int = 5):
+    '''
+    Loop-heavy variable updates run by the interpreter and as a
+    slot-resolved script from compileScript. The loop reads and writes
+    a script variable, a global and a variable of the script's scope.
+    '''
+    project = Project()
+    project.addGlobalVariable('total')
+    script = [scriptVariables([Option('n')]), setVariableTo('n', 0),
+              repeat(iterations, [changeVariableBy('n', 1),
+                                  changeVariableBy('total', Variable('n')),
+                                  setVariableTo('last', plus(Variable('last'), Variable('n')))])]
+
+    def interpret():
+        project.setGlobalVariable('total', 0)
+        project.executor.runScript(Script(script, {'last' : 0}))
+
+    compiled = project.executor.compileScript(script)
+
+    def runCompiled():
+        project.setGlobalVariable('total', 0)
+        compiled({'last' : 0})
+
+    interpreted = timePerCall(interpret, number) / iterations
+    slotted = timePerCall(runCompiled, number) / iterations
+    print(f'{"interpreted":>14}{"compiled":>12}{"speedup":>10}')
+    print(f'{interpreted * 1e6:>12.2f}us{slotted * 1e6:>10.2f}us{interpreted / slotted:>9.2f}x')
+
+def benchmarkProfiling(number : int = 20000, depth : int = 8):
+    '''
+    The cost of the profiling hooks on evaluate. A never-profiled
+    Executor is compared with one that has had profiling enabled and
+    disabled again, which should be the same within noise, and with
+    one that is profiling.
+    '''
+    expression = nestedExpression(depth)
+    cases = []
+    for name in ('never profiled', 'disabled', 'enabled'):
+        project = Project()
+        project.addGlobalVariable('x')
+        project.addGlobalVariable('y')
+        project.setGlobalVariable('x', 1)
+        project.setGlobalVariable('y', 4)
+        if name != 'never profiled':
+            project.executor.enableProfiling()
+        if name == 'disabled':
+            project.executor.disableProfiling()
+        cases.append((name, project.executor))
+
+    # Interleave the samples, in a rotating order, so drift in the machine's speed hits every case alike.
+    samples = {name : [] for name, executor in cases}
+    for i in range(9):
+        for name, executor in cases[i % 3:] + cases[:i % 3]:
+            samples[name].append(timePerCall(lambda: executor.evaluate(expression), number // 10))
+    baseline = min(samples['never profiled'])
+    print(f'{"evaluate":<16}{"time (us)":>12}{"overhead":>10}')
+    for name, times in samples.items():
+        print(f'{name:<16}{min(times) * 1e6:>12.3f}{(min(times) / baseline - 1) * 100:>9.1f}%')
+
+def benchmarkBinaryCache(copies = (10, 50), number : int = 5):
+    '''
+    Compares xmlToBlock with decoding the binary format, on trees whose
+    blocks are all different and on the repetitive generated script,
+    and Project.load with a warm ProjectCache on scaled projects.
+    '''
+    from BinaryCache import encodeValue, decodeValue, ProjectCache
+    unique = Block('doWarp', [Script([setVariableTo('ijk'[i % 3], multiply(plus(absOf(Variable('ijk'[i % 3])), i), i + 0.5))
+                                      for i in range(4000)], {})])
+    repetitive = Block('doWarp', [Script(generatedScript(20000), {})])
+    print(f'{"tree":<12}{"XML (KB)":>10}{"binary (KB)":>13}{"xmlToBlock (ms)":>17}{"decode (ms)":>13}{"speedup":>10}')
+    for name, tree in [('unique', unique), ('repetitive', repetitive)]:
+        xml, data = blockToXML(tree), encodeValue(tree)
+        parseTime = timePerCall(lambda: xmlToBlock(xml), number)
+        decodeTime = timePerCall(lambda: decodeValue(data), number)
+        print(f'{name:<12}{len(xml) / 1024:>10.0f}{len(data) / 1024:>13.0f}{parseTime * 1e3:>17.2f}'
+              f'{decodeTime * 1e3:>13.2f}{parseTime / decodeTime:>9.1f}x')
+
+    print(f'{"sprites":>8}{"load (ms)":>12}{"cached (ms)":>13}{"speedup":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ProjectCache(os.path.join(directory, 'cache'))
+        for count in copies:
+            path = os.path.join(directory, f'scaled{count}.xml')
+            sprites = scaledProject(path, count)
+            cache.load(path)
+            loadTime = timePerCall(lambda: Project.load(path), number)
+            cachedTime = timePerCall(lambda: cache.load(path), number)
+            print(f'{sprites:>8}{loadTime * 1e3:>12.1f}{cachedTime * 1e3:>13.1f}{loadTime / cachedTime:>9.1f}x')
+
+def benchmarkLists(sizes = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), slicedLimit : int = 10 ** 4):
+    '''
+    Snap-style traversal of lists by their first item and "all but
+    first of", through the list handlers and as a compiled script, on
+    SnapLists and, up to slicedLimit items, on Python lists whose CDR
+    copies every item after the first. Also times reading every item
+    of a list built by "in front of", which becomes an array on the
+    first index.
+    '''
+    from Primitives import PRIMITIVES
+    from Lists import SnapList
+    item, cdr, empty = [PRIMITIVES.lookup(signature).handler
+                        for signature in ('reportListItem', 'reportCDR', 'reportListIsEmpty')]
+
+    def traverse(lst):
+        total = 0
+        while not empty(lst):
+            total += item(1, lst)
+            lst = cdr(lst)
+        return total
+
+    def traverseSliced(lst):
+        total = 0
+        while lst:
+            total += lst[0]
+            lst = lst[1:]
+        return total
+
+    def indexLinked(size):
+        lst = SnapList()
+        for i in range(size):
+            lst = SnapList.cons(i, lst)
+        return sum(item(i, lst) for i in range(1, size + 1))
+
+    project = Project()
+    project.addGlobalVariable('L')
+    project.addGlobalVariable('total')
+    script = project.executor.compileScript([
+        setVariableTo('total', 0),
+        repeat(lengthOf(Variable('L')), [changeVariableBy('total', itemOf(1, Variable('L'))),
+                                         setVariableTo('L', allButFirstOf(Variable('L')))])])
+
+    def runScript(size):
+        project.setGlobalVariable('L', SnapList(range(size)))
+        script()
+
+    print(f'{"items":>9}{"sliced (ms)":>13}{"handlers (ms)":>15}{"script (ms)":>13}{"index linked (ms)":>19}')
+    for size in sizes:
+        numbers = list(range(size))
+        sliced = f'{timePerCall(lambda: traverseSliced(numbers), 1) * 1e3:>13.1f}' if size <= slicedLimit else f'{"-":>13}'
+        handlers = timePerCall(lambda: traverse(SnapList(numbers)), 1)
+        scripted = timePerCall(lambda: runScript(size), 1)
+        indexed = timePerCall(lambda: indexLinked(size), 1)
+        print(f'{size:>9}{sliced}{handlers * 1e3:>15.1f}{scripted * 1e3:>13.1f}{indexed * 1e3:>19.1f}')
+
+def benchmarkHigherOrder(size : int = 10 ** 5, number : int = 3):
+    '''
+    A keep feeding a map over a list of ints: calling the rings through
+    callRing for every item, as an interpreter would, against the
+    blocks themselves, with a ring body NumPy cannot run and with one
+    it can, and with the keep's list built in a variable first.
+    '''
+    from Lists import SnapList
+    project = Project()
+    executor = project.executor
+    project.addGlobalVariable('L')
+    project.addGlobalVariable('kept')
+    project.setGlobalVariable('L', SnapList(range(size)))
+    predicate = Block('reifyPredicate', [equalTo(modulo(None, 3), 0)])
+    scalar = Block('reifyReporter', [reportRound(plus(None, 0.5))])
+    vector = Block('reifyReporter', [plus(multiply(None, 2), 1)])
+
+    def perItem():
+        isKept, transform = executor.evaluate(predicate), executor.evaluate(vector)
+        return [executor.callRing(transform, [x]) for x in project.getGlobalVariable('L') if executor.callRing(isKept, [x])]
+
+    def unfused():
+        executor.execute(setVariableTo('kept', keep(predicate, Variable('L'))))
+        return executor.evaluate(mapOver(vector, Variable('kept')))
+
+    cases = [('callRing per item', perItem),
+             ('compiled', lambda: executor.evaluate(mapOver(scalar, keep(predicate, Variable('L'))))),
+             ('vectorized, unfused', unfused),
+             ('vectorized, fused', lambda: executor.evaluate(mapOver(vector, keep(predicate, Variable('L')))))]
+    baseline = None
+    print(f'{"map over keep":<22}{"time (ms)":>12}{"speedup":>10}')
+    for name, function in cases:
+        seconds = timePerCall(function, number)
+        baseline = baseline or seconds
+        print(f'{name:<22}{seconds * 1e3:>12.2f}{baseline / seconds:>9.1f}x')
+
+def benchmarkRanges(size : int = 10 ** 6):
+    '''
+    Memory and time of "numbers from 1 to size" as a lazy range and as
+    the list it used to be built into, on its own and fed to for each,
+    item, contains and a map.
+    '''
+    from Lists import SnapList
+    project = Project()
+    executor = project.executor
+    project.addGlobalVariable('L')
+    project.addGlobalVariable('total')
+    lazy = lambda: executor.evaluate(numbersFrom(1, size))
+    listed = lambda: SnapList(range(1, size + 1))
+    double = Block('reifyReporter', [multiply(None, 2)])
+    uses = [
+        ('numbers from', lambda numbers: numbers),
+        ('for each', lambda numbers: executor.execute(forEach(Option('n'), numbers, [changeVariableBy('total', Variable('n'))]))),
+        ('item and contains', lambda numbers: (executor.evaluate(itemOf(size // 2, numbers)), executor.evaluate(contains(numbers, size)))),
+        ('map', lambda numbers: executor.evaluate(mapOver(double, numbers)))
+    ]
+
+    print(f'{"":<20}{"list (ms)":>11}{"range (ms)":>12}{"list peak (MB)":>16}{"range peak (MB)":>17}')
+    for name, use in uses:
+        times, peaks = [], []
+        for make in (listed, lazy):
+            times.append(timePerCall(lambda: use(make()), 1))
+            # Traced separately, since tracing slows allocation down.
+            tracemalloc.start()
+            use(make())
+            peaks.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.stop()
+        print(f'{name:<20}{times[0] * 1e3:>11.1f}{times[1] * 1e3:>12.1f}{peaks[0]:>16.1f}{peaks[1]:>17.1f}')
+
+def benchmarkSpriteStore(cloneCounts = (1000, 10000), frames : int = 20):
+    '''
+    Clones running a motion script that moves, turns and bounces, as
+    plain sprites stepped block by block and in a SpriteStore, where
+    each block runs once per frame over every clone. Creation times
+    making every clone in one warped loop.
+    '''
+    print(f'{"clones":>10}{"store":>8}{"create ms":>12}{"ms/frame":>12}')
+    for count in cloneCounts:
+        for store in (False, True):
+            project = Project()
+            if store:
+                project.enableSpriteStore()
+            sprite = Sprite('Sprite', '1', 0, 0, 90, 1, 100, 0, 1, True, False, '', (80, 80, 80), 'tip', 1)
+            project.sprites['Sprite'] = sprite
+            # Listed on the sprite too, as ProjectLoader does.
+            sprite.scripts = [
+                Script([Block('receiveOnClone', []), forever([moveSteps(3), turnClockwise(5), bounceOffEdge()])], {}, sprite),
+                Script([greenFlag(), warp([repeat(count, [createCloneOf('Sprite')])])], {}, sprite)
+            ]
+            project.scripts.extend(sprite.scripts)
+            project.scheduler.greenFlag()
+            start = time.perf_counter()
+            project.scheduler.step()
+            created = time.perf_counter() - start
+            start = time.perf_counter()
+            project.scheduler.run(frames)
+            elapsed = time.perf_counter() - start
+            print(f'{count:>10}{str(store):>8}{created * 1e3:>12.1f}{elapsed / frames * 1e3:>12.2f}')
+
+def benchmarkSpatialIndex(cloneCounts = (100, 1000, 10000, 50000), queries : int = 100):
+    '''
+    Per-frame cost of the sensing queries as clones are added: moving
+    every clone in the index, then touching a single target, the
+    nearest target and the nearest other clone, each against comparing
+    the querying sprite with every clone. Clones are spread over a square
+    world with room for each, as a scrolling game would have them.
+    '''
+    from SpatialIndex import SpatialIndex, distance
+    import random
+    print(f'{"clones":>10}{"move ms":>10}{"touch us":>10}{"scan us":>10}{"target us":>11}{"scan us":>10}'
+          f'{"clone us":>10}{"scan us":>10}')
+    for count in cloneCounts:
+        random.seed(count)
+        side = 40 * count ** 0.5
+        position = lambda: (random.uniform(-side / 2, side / 2), random.uniform(-side / 2, side / 2))
+        sprites = [Sprite('Clone', '1', *position(), 90, 1, 100, 0, 1, True, False, '', (80, 80, 80), 'tip', 1)
+                   for i in range(count)]
+        target = Sprite('Target', '1', 0, 0, 90, 1, 100, 0, 1, True, False, '', (80, 80, 80), 'tip', 1)
+        index = SpatialIndex()
+        for sprite in sprites + [target]:
+            index.add(sprite)
+        probes = sprites[:queries]
+
+        def move():
+            for sprite in sprites:
+                x, y = sprite.coords
+                sprite.coords = x + 1, y
+                index.update(sprite, sprite.coords)
+
+        def scanTouching(sprite):
+            x, y = sprite.coords
+            return any(other.name == 'Target' and abs(other.coords[0] - x) <= 20 and abs(other.coords[1] - y) <= 20
+                       for other in sprites + [target])
+
+        def scanNearest(sprite, name):
+            return min((other for other in sprites + [target] if other is not sprite and other.name == name),
+                       key=lambda other: distance(sprite, other))
+
+        times = [timePerCall(move, 1) * 1e3]
+        cases = [(index.touching, 'Target'), (scanTouching, None),
+                 (index.nearest, 'Target'), (scanNearest, 'Target'),
+                 (index.nearest, 'Clone'), (scanNearest, 'Clone')]
+        for function, name in cases:
+            call = lambda: [function(probe, name) if name != None else function(probe) for probe in probes]
+            times.append(timePerCall(call, 1) / queries * 1e6)
+        print(f'{count:>10}' + ''.join(f'{t:>10.1f}' for t in times[:4]) + f'{times[4]:>11.1f}' +
+              ''.join(f'{t:>10.1f}' for t in times[5:]))
+
+def benchmarkBroadcast(spriteCounts = (100, 1000, 5000), broadcasts : int = 100):
+    '''
+    The cost of a broadcast as sprites are added. Every sprite has a
+    green flag script and a script receiving its own message, so each
+    broadcast starts one thread. The indexed dispatch of the Scheduler
+    is timed against scanning every script for matching hats, which
+    is how broadcasts were dispatched before the HatIndex.
+    '''
+    print(f'{"sprites":>10}{"scripts":>10}{"indexed us":>12}{"scan us":>12}')
+    for count in spriteCounts:
+        project = Project()
+        for i in range(count):
+            sprite = Sprite(f'Sprite{i}', '1', 0, 0, 90, 1, 100, 0, 1, True, False, '', (80, 80, 80), 'tip', i)
+            project.sprites[sprite.name] = sprite
+            project.scripts.append(Script([greenFlag(), forever([broadcast(f'message{(i + 1) % count}')])], {}, sprite))
+            project.scripts.append(Script([whenReceived(f'message{i}'), changeXBy(1)], {}, sprite))
+        scheduler = project.scheduler
+        evaluate = project.executor.evaluate
+
+        def scan(message):
+            return [scheduler.start(script) for script in list(project.scripts)
+                    if script.blocks and type(script.blocks[0]) == Block and
+                    script.blocks[0].signature == 'receiveMessage' and
+                    evaluate(script.blocks[0].inputs[0]) in (message, 'any message')]
+
+        times = []
+        for dispatch in (scheduler.broadcast, scan):
+            def frame():
+                for i in range(broadcasts):
+                    dispatch(f'message{i % count}')
+                scheduler.stopAll()
+            times.append(timePerCall(frame, 1) / broadcasts * 1e6)
+        print(f'{count:>10}{len(project.scripts):>10}{times[0]:>12.1f}{times[1]:>12.1f}')
+
+def benchmarkFragments(scripts : int = 200, blocks : int = 500):
+    '''
+    Saving the scripts of a project of scripts * blocks blocks, each
+    a loop over a generated body, after editing one block: written
+    in full by blockToXML, against a FragmentCache that has already
+    saved the project once. The output is checked to be the same.
+    '''
+    from Block import Script, FragmentCache, blockToXML
+    project = [Script([greenFlag(), forever(generatedScript(blocks))], {}) for i in range(scripts)]
+    cache = FragmentCache()
+    start = time.perf_counter()
+    [cache.toXML(script) for script in project]
+    cold = time.perf_counter() - start
+    edits = [0]
+
+    def edit():
+        edits[0] += 1
+        body = project[edits[0] % scripts].blocks[1].inputs[0]
+        body[edits[0] % len(body)] = setVariableTo('i', edits[0])
+
+    def full():
+        edit()
+        return ''.join(blockToXML(script) for script in project)
+
+    def cached():
+        edit()
+        return ''.join(cache.toXML(script) for script in project)
+
+    assert full() == ''.join(cache.toXML(script) for script in project)
+    print(f'{"blocks":>10}{"full ms":>10}{"cold ms":>10}{"edited ms":>11}{"entries":>10}')
+    print(f'{scripts * blocks:>10}{timePerCall(full, 3) * 1e3:>10.1f}{cold * 1e3:>10.1f}'
+          f'{timePerCall(cached, 3) * 1e3:>11.2f}{len(cache):>10}')
+
+def benchmarkText(sizes = (10 ** 5, 10 ** 6, 10 ** 7), stringLimit : int = 10 ** 6):
+    '''
+    Building a text of each size one five-letter word at a time with
+    "set text to join text word" in a repeat loop, then splitting it.
+    Texts are against join reporting Python strings, which copies the
+    text on every word; that is only run up to stringLimit.
+    '''
+    from Primitives import PRIMITIVES
+    from Text import textOf
+    strings = PRIMITIVES.copy()
+    strings.register('reportJoinWords', lambda *words: ''.join(map(textOf, words)), pure=True)
+    print(f'{"MB":>8}{"path":>10}{"build s":>10}{"split s":>10}')
+    for size in sizes:
+        for name, registry in (('text', None), ('string', strings)):
+            if registry != None and size > stringLimit:
+                print(f'{size / 2 ** 20:>8.1f}{name:>10}{"-":>10}{"-":>10}')
+                continue
+            project = Project(registry)
+            scope = {'text' : None}
+            script = Script([setVariableTo('text', ''),
+                             repeat(size // 5, [setVariableTo('text', join([Variable('text'), 'word ']))])], scope)
+            start = time.perf_counter()
+            project.executor.runScript(script)
+            built = time.perf_counter() - start
+            start = time.perf_counter()
+            assert project.executor.evaluate(lengthOf(textSplit(Variable('text'), ' ')), scope) == size // 5 + 1
+            split = time.perf_counter() - start
+            print(f'{size / 2 ** 20:>8.1f}{name:>10}{built:>10.2f}{split:>10.2f}')
+
+if __name__ == '__main__':
+    benchmarkCompile()
+    benchmarkOptimize()
+    benchmarkLoad()
+    benchmarkMedia()
+    benchmarkBatch()
+    benchmarkMemoization()
+    benchmarkSerialize()
+    benchmarkFragments()
+    benchmarkParse()
+    benchmarkDepth()
+    benchmarkScheduler()
+    benchmarkScopes()
+    benchmarkProfiling()
+    benchmarkBinaryCache()
+    benchmarkLists()
+    benchmarkHigherOrder()
+    benchmarkRanges()
+    benchmarkSpriteStore()
+    benchmarkSpatialIndex()
+    benchmarkBroadcast()
+    benchmarkText()
+    benchmarkBatchRunner()
+    benchmarkBlockMemory()
@@ -2,7 +2,24 @@ import unittest
 from Block import *
 from SnapBlocks import *
 from Project import *
+from Optimizer import optimize
+from Visuals import Sprite
+from Batch import BatchRunner, BatchJob, runJob
+from BinaryCache import encodeValue, decodeValue, ProjectCache, BinaryEncoder, LIST, SMALL_INT, SMALL_INT_LIMIT, DICT
+from Lists import SnapList
+from Text import Text
+from SpatialIndex import SpatialIndex, distance
 from math import pi
+import io
+import pickle
+import random
+import sys
+import os
+import tempfile
+import tracemalloc
+
+def makeSprite(name = 'Sprite', x = 0, y = 0, heading = 90):
+	return Sprite(name, '1', x, y, heading, 1, 100, 0, 1, True, False, '', (80, 80, 80), 'tip', 8)
 
 class TestBlock(unittest.TestCase):
 
@@ -37,6 +54,18 @@ class TestBlock(unittest.TestCase):
 		testBlock = xmlToBlock(testXMLString)
 		self.assertEqual(testBlock.inputs, [1, [2.2, [3, 4]]])
 
+	def test_parser_matches_elementtree(self):
+		for path in ['TestXMLs/variableblocks.xml', 'TestXMLs/controlblocks.xml', 'TestXMLs/motionblocks.xml', 'TestXMLs/snappy.xml']:
+			for script in ET.parse(path).getroot().iter('script'):
+				for element in script:
+					xml = ET.tostring(element)
+					self.assertEqual(blockToXML(xmlToBlock(xml)), blockToXML(elementToBlock(ET.fromstring(xml))))
+
+	def test_literals(self):
+		testBlock = xmlToBlock('<block s="reportJoinWords"><list><l>12</l><l>-1.5</l><l>.5e2</l><l>1.2.3</l><l>12a</l><l><option>abs</option></l><l><bool>false</bool></l></list></block>')
+		self.assertEqual(testBlock.inputs, [12, -1.5, 50.0, '1.2.3', '12a', Option('abs'), False])
+		self.assertEqual([type(inp) for inp in testBlock.inputs[:3]], [int, float, float])
+
 	def test_blocktoxml(self):
 		testBlock = Block('reportSum', [1, 2])
 		testXMLString = blockToXML(testBlock)
@@ -63,6 +92,74 @@ class TestBlock(unittest.TestCase):
 		'''.replace('\t', '').replace('\n', '')
 		self.assertEqual(testXMLString, expectedOutput)
 
+	def test_emptyinputtoxml(self):
+		testBlock = Block('reportSum', [1, None])
+		self.assertEqual(blockToXML(testBlock), '<block s="reportSum"><l>1</l><l /></block>')
+		self.assertEqual(xmlToBlock(blockToXML(testBlock)), testBlock)
+		self.assertEqual(ET.tostring(blockToElement(testBlock)).decode('utf-8'), blockToXML(testBlock))
+
+	def test_streamingxml(self):
+		script = Script([setVariableTo('a&b', join(['<é>', True, Option('x'), None])), bounceOffEdge()] * 2000, {})
+		expected = ET.tostring(formatBlockInput(script))
+		stream = io.BytesIO()
+		writeXML(script, stream)
+		self.assertEqual(stream.getvalue(), expected)
+		chunks = list(iterXML(script))
+		self.assertGreater(len(chunks), 1)
+		self.assertEqual(b''.join(chunks), expected)
+
+	def test_deepnesting(self):
+		depth = 5 * sys.getrecursionlimit()
+		expression = Variable('x')
+		nested = []
+		for i in range(depth):
+			expression = plus(expression, 1)
+			nested = [nested]
+		testBlock = Block('doSetVar', [Option('y'), expression, nested])
+		xml = blockToXML(testBlock)
+		self.assertEqual(xmlToBlock(xml), testBlock)
+		self.assertEqual(elementToBlock(ET.fromstring(xml)), testBlock)
+		self.assertEqual(hash(xmlToBlock(xml).inputs[1]), hash(expression))
+		self.assertEqual(formatBlockInput(testBlock).attrib, {'s' : 'doSetVar'})
+		stream = io.BytesIO()
+		writeXML(testBlock, stream)
+		self.assertEqual(stream.getvalue().decode('ascii'), xml)
+
+	def test_fragment_cache(self):
+		cache = FragmentCache()
+		loop = [moveSteps(3), If(lessThan(Variable('x'), 2), [turnClockwise('é')]), setVariableTo('l', [1, True, [2.5, None]])]
+		script = Script([greenFlag(), forever(loop), Block('doRun', [Script([], {})])], {})
+		self.assertEqual(cache.toXML(script), blockToXML(script))
+		hat = cache.entries[id(script.blocks[0])]
+		self.assertTrue(hat[2])
+
+		edits = [
+			lambda: loop.append(changeXBy(1)),
+			lambda: loop[1].inputs[1].insert(0, bounceOffEdge()),
+			lambda: loop.__setitem__(0, moveSteps(4)),
+			lambda: loop[2].inputs[1][2].append('<&>'),
+			lambda: loop[2].inputs[1].__setitem__(1, 1),
+			lambda: script.blocks[2].inputs[0].blocks.append(gotoXY(1, 2)),
+			lambda: script.blocks.pop()
+		]
+		for edit in edits:
+			edit()
+			self.assertEqual(cache.toXML(script), blockToXML(script))
+		# Blocks nobody changed are never written again.
+		self.assertIs(cache.entries[id(script.blocks[0])], hat)
+
+		# Deeper than recursion could go; every level keeps its own text, so not much deeper.
+		nested = []
+		for i in range(sys.getrecursionlimit() + 100):
+			nested = [nested, plus(i, 1)]
+		self.assertEqual(cache.toXML(nested), blockToXML(nested))
+
+		before = len(cache)
+		cache.prune([script])
+		self.assertLess(len(cache), before)
+		self.assertNotIn(id(nested), cache.entries)
+		self.assertEqual(cache.toXML(script), blockToXML(script))
+
 class TestExecutor(unittest.TestCase):
 
 	def test_evaluateValue(self):
@@ -212,6 +309,1435 @@ class TestExecutor(unittest.TestCase):
 		self.assertEqual(p.executor.evaluate(Variable('testVariable')), 5)
 		self.assertEqual(p.executor.evaluate(Variable('testVariable'), localScope), 12.12)
 		
+	def test_deepnesting(self):
+		p = Project()
+		p.addGlobalVariable('x')
+		p.setGlobalVariable('x', 1)
+		depth = 5 * sys.getrecursionlimit()
+		expression = Variable('x')
+		for i in range(depth):
+			expression = plus(absOf(expression), 1) if i % 2 else subtract(expression, -1)
+		self.assertEqual(p.executor.evaluate(expression), depth + 1)
+		p.executor.enableMemoization()
+		self.assertEqual(p.executor.evaluate(expression), depth + 1)
+		self.assertEqual(p.executor.evaluate(expression), depth + 1)
+		self.assertEqual(p.executor.memo.hits, 1)
+
+	def test_deep_paths(self):
+		p = Project()
+		p.addGlobalVariable('x')
+		p.setGlobalVariable('x', 1)
+		depth = 5 * sys.getrecursionlimit()
+		expression = Variable('x')
+		conditional = Variable('x')
+		for i in range(depth):
+			expression = plus(absOf(expression), 1) if i % 2 else subtract(expression, -1)
+			conditional = ifThenElse(greaterThan(Variable('x'), 0), plus(conditional, 1), 0)
+		for value in (expression, conditional):
+			self.assertEqual(p.executor.evaluate(value), depth + 1)
+			self.assertEqual(p.executor.compile(value)(), depth + 1)
+			self.assertEqual(p.executor.compileScript([setVariableTo('y', value)])({'y' : 0}), None)
+			self.assertEqual(optimize(value), value)
+			self.assertEqual(NodeTable().intern(value), value)
+		self.assertEqual(p.executor.compileScript([Block('doReport', [conditional])])(), depth + 1)
+		p.executor.enableMemoization()
+		self.assertEqual(p.executor.evaluate(conditional), depth + 1)
+		self.assertEqual(optimize(Script([setVariableTo('y', plus(expression, multiply(2, 3)))], {})).blocks[0].inputs[1].inputs[1], 6)
+
+		# Command blocks run their C-slots with a few Python frames per level.
+		script = [changeVariableBy('x', 1)]
+		for i in range(100):
+			script = [ifElse(greaterThan(Variable('x'), 0), script, [])]
+		p.executor.executeScript(script)
+		p.executor.compileScript(script)()
+		self.assertEqual(p.getGlobalVariable('x'), 3)
+
+class TestCompiler(unittest.TestCase):
+
+	def test_compile_matches_evaluate(self):
+		p = Project()
+		e = p.executor
+		expressions = [
+			plus(multiply(2, 3), subtract(10, 4)),
+			divide(power(2, 10), modulo(7, 4)),
+			reportRound(divide(7, 2)),
+			sqrtOf(plus(7, 9)),
+			negOf(absOf(-3)),
+			lessThan(plus(1, 1), 3),
+			andOp(equalTo(2, 2), notOp(greaterThan(1, 2))),
+			join(['this', 'is', 'a', 'test']),
+			textSplit('a b c', ' ')
+		]
+		for expression in expressions:
+			self.assertEqual(e.compile(expression)(), e.evaluate(expression))
+
+	def test_compile_variables(self):
+		p = Project()
+		p.addGlobalVariable('x')
+		p.setGlobalVariable('x', 4)
+		compiled = p.executor.compile(multiply(Variable('x'), Variable('x')))
+
+		self.assertEqual(compiled(), 16)
+		self.assertEqual(compiled({'x' : 3}), 9)
+
+		# Compiled closures read variables when called, not when compiled.
+		p.setGlobalVariable('x', 5)
+		self.assertEqual(compiled(), 25)
+
+	def test_compile_errors(self):
+		p = Project()
+		with self.assertRaises(ValueError):
+			p.executor.compile(Block('notABlock', []))
+		with self.assertRaises(ValueError):
+			p.executor.compile(of('notAFunction', 1))
+
+	def test_compile_script_matches_interpreter(self):
+		script = [scriptVariables([Option('n')]), setVariableTo('n', 0),
+			forLoop(Option('i'), 1, 10, [
+				changeVariableBy('n', Variable('i')),
+				ifElse(equalTo(modulo(Variable('i'), 2), 0), [changeVariableBy('total', 1)], [setVariableTo('word', join([Variable('word'), 'a']))])
+			]),
+			forEach(Option('item'), Variable('items'), [changeVariableBy('total', Variable('item'))]),
+			report(plus(Variable('n'), Variable('total')))]
+		results = []
+		for compiled in (False, True):
+			p = Project()
+			for name, value in (('total', 0), ('word', ''), ('items', [1, 2, 3])):
+				p.addGlobalVariable(name)
+				p.setGlobalVariable(name, value)
+			scope = {}
+			if compiled:
+				reported = p.executor.compileScript(Script(script, scope))()
+			else:
+				reported = p.executor.runScript(Script(script, scope))
+			results.append((reported, scope, dict(p.globalVariables)))
+		self.assertEqual(results[0], results[1])
+		self.assertEqual(results[1][0], 66)
+
+	def test_compile_script_shadowing(self):
+		p = Project()
+		p.addGlobalVariable('x')
+		p.setGlobalVariable('x', 1)
+		p.addGlobalVariable('seen')
+		scope = {}
+		p.executor.compileScript([
+			setVariableTo('seen', Variable('x')),
+			scriptVariables([Option('x')]),
+			setVariableTo('x', 5),
+			changeVariableBy('x', 1)
+		])(scope)
+		self.assertEqual(scope, {'x' : 6})
+		self.assertEqual((p.getGlobalVariable('x'), p.getGlobalVariable('seen')), (1, 1))
+		# Changing a variable that is not a number does nothing.
+		p.setGlobalVariable('x', 'text')
+		p.executor.compileScript([changeVariableBy('x', 1)])()
+		self.assertEqual(p.getGlobalVariable('x'), 'text')
+
+	def test_compile_script_rebinds(self):
+		p = Project()
+		p.addGlobalVariable('x')
+		p.setGlobalVariable('x', 1)
+		p.addGlobalVariable('y')
+		# A ring writes the global behind the compiled script's back.
+		compiled = p.executor.compileScript([run(commandRing([setVariableTo('x', 2)])), setVariableTo('y', Variable('x'))])
+		compiled({})
+		self.assertEqual(p.getGlobalVariable('y'), 2)
+		with self.assertRaises(ValueError):
+			p.executor.compileScript([setVariableTo('z', 1)])()
+		with self.assertRaises(ValueError):
+			p.executor.compileScript([setVariableTo('y', Variable('z'))])()
+
+class TestPrimitives(unittest.TestCase):
+
+	def test_register_custom_primitive(self):
+		registry = PRIMITIVES.copy()
+		registry.register('reportDouble', lambda x: 2 * x)
+		registry.registerMonadic('cube', lambda x: x ** 3)
+		p = Project(registry)
+
+		self.assertEqual(p.executor.evaluate(Block('reportDouble', [plus(1, 2)])), 6)
+		self.assertEqual(p.executor.evaluate(of('cube', 2)), 8)
+		self.assertEqual(p.executor.compile(Block('reportDouble', [4]))(), 8)
+		# The shared registry is left untouched.
+		self.assertNotIn('reportDouble', PRIMITIVES)
+		with self.assertRaises(ValueError):
+			Project().executor.evaluate(Block('reportDouble', [1]))
+
+	def test_special_primitive(self):
+		registry = PRIMITIVES.copy()
+
+		@registry.register('reportFirstTruthy', special=True)
+		def reportFirstTruthy(executor, block, scope):
+			for inp in block.inputs:
+				value = executor.evaluate(inp, scope)
+				if value:
+					return value
+
+		p = Project(registry)
+		# The second input is never evaluated, so dividing by zero is harmless.
+		self.assertEqual(p.executor.evaluate(Block('reportFirstTruthy', [3, divide(1, 0)])), 3)
+
+	def test_list_blocks(self):
+		p = Project()
+		e = p.executor
+		p.addGlobalVariable('items')
+
+		e.execute(setVariableTo('items', newList([1, 2, 3])))
+		e.execute(addTo(4, Variable('items')))
+		e.execute(insertAt(0, 1, Variable('items')))
+		e.execute(replaceItem(2, Variable('items'), 10))
+		e.execute(deleteIndex('last', Variable('items')))
+		self.assertEqual(e.evaluate(Variable('items')), [0, 10, 2, 3])
+
+		# Indices outside the list report nothing and change nothing.
+		for index in [0, -1, 5, 6]:
+			self.assertEqual(e.evaluate(itemOf(index, Variable('items'))), '')
+			e.execute(deleteIndex(index, Variable('items')))
+			e.execute(replaceItem(index, Variable('items'), 7))
+		e.execute(insertAt(9, 0, Variable('items')))
+		e.execute(insertAt(9, 6, Variable('items')))
+		self.assertEqual(e.evaluate(Variable('items')), [0, 10, 2, 3])
+		e.execute(insertAt(9, 5, Variable('items')))
+		self.assertEqual(e.evaluate(Variable('items')), [0, 10, 2, 3, 9])
+		self.assertEqual(e.evaluate(itemOf('random', [])), '')
+
+		self.assertEqual(e.evaluate(numbersFrom(3, 1)), [3, 2, 1])
+		self.assertEqual(e.evaluate(inFrontOf(1, [2, 3])), [1, 2, 3])
+		self.assertEqual(e.evaluate(itemOf(2, [4, 5, 6])), 5)
+		self.assertEqual(e.evaluate(allButFirstOf([4, 5, 6])), [5, 6])
+		self.assertEqual(e.evaluate(lengthOf([4, 5, 6])), 3)
+		self.assertEqual(e.evaluate(indexOf(6, [4, 5, 6])), 3)
+		self.assertTrue(e.evaluate(contains([4, 5, 6], 5)))
+		self.assertTrue(e.evaluate(isEmpty([])))
+		self.assertEqual(e.evaluate(append([[1], [2, 3]])), [1, 2, 3])
+
+	def test_control_blocks(self):
+		p = Project()
+		e = p.executor
+		scope = {}
+		e.execute(scriptVariables(['total', 'i']), scope)
+		e.execute(setVariableTo('total', 0), scope)
+
+		e.execute(repeat(3, [changeVariableBy('total', 1)]), scope)
+		self.assertEqual(scope['total'], 3)
+
+		e.execute(forLoop('i', 1, 4, [changeVariableBy('total', Variable('i'))]), scope)
+		self.assertEqual(scope['total'], 13)
+
+		e.execute(ifElse(greaterThan(Variable('total'), 10),
+			[setVariableTo('total', 'big')], [setVariableTo('total', 'small')]), scope)
+		self.assertEqual(scope['total'], 'big')
+		self.assertEqual(e.evaluate(ifThenElse(False, divide(1, 0), 'no'), scope), 'no')
+
+		ring = reporterRing(plus(Variable('total'), '!'))
+		self.assertEqual(e.evaluate(call(ring), scope), 'big!')
+
+	def test_report_ends_script(self):
+		p = Project()
+		script = Script([report(5), Block('notABlock', [])], {})
+		self.assertEqual(p.executor.runScript(script), 5)
+
+	def test_motion_blocks(self):
+		p = Project()
+		sprite = makeSprite()
+		script = Script([
+			gotoXY(10, 20),
+			moveSteps(5),
+			turnClockwise(90),
+			changeYBy(-3),
+			setXto(300),
+			bounceOffEdge()
+		], {}, sprite)
+		p.executor.runScript(script)
+
+		self.assertEqual(sprite.coords, (240, 17))
+		self.assertEqual(sprite.heading, 180)
+
+	def test_broadcast(self):
+		p = Project()
+		p.addGlobalVariable('heard')
+		p.setGlobalVariable('heard', 0)
+		sprite = makeSprite()
+		p.sprites['Sprite'] = sprite
+		p.scripts.append(Script([whenReceived('go'), changeVariableBy('heard', 1)], {}, sprite))
+		p.scripts.append(Script([whenReceived('stop'), changeVariableBy('heard', 100)], {}, sprite))
+
+		p.executor.execute(broadcast('go'))
+		p.executor.execute(sendMessageTo('go', 'Sprite'))
+		self.assertEqual(p.getGlobalVariable('heard'), 2)
+		self.assertEqual(p.executor.evaluate(message()), 'go')
+
+	def test_clones(self):
+		p = Project()
+		sprite = makeSprite()
+		p.sprites['Sprite'] = sprite
+		p.scripts.append(Script([Block('receiveOnClone', []), changeXBy(5)], {}, sprite))
+
+		clone = p.executor.evaluate(newCloneOf('Sprite'))
+		self.assertIs(clone.exemplar, sprite)
+		self.assertEqual(clone.coords, (5, 0))
+		self.assertEqual(sprite.coords, (0, 0))
+
+		p.executor.runScript(Script([removeClone()], {}, clone))
+		self.assertEqual(len(p.scripts), 1)
+
+class TestLists(unittest.TestCase):
+
+	def test_views_are_copied_on_write(self):
+		lst = SnapList([1, 2, 3, 4])
+		rest = lst.cdr()
+		self.assertIs(rest.contents, lst.contents)
+		lst[1] = 20
+		del lst[0]
+		self.assertEqual(lst, [20, 3, 4])
+		self.assertEqual(rest, [2, 3, 4])
+
+		# Both lists end where the contents do, so the first to append keeps them.
+		lst.append(5)
+		rest.append(6)
+		self.assertEqual(lst, [20, 3, 4, 5])
+		self.assertEqual(rest, [2, 3, 4, 6])
+		self.assertEqual(rest.cdr().cdr().cdr(), [6])
+		self.assertEqual(SnapList([1]).cdr(), [])
+
+	def test_queue(self):
+		queue = SnapList()
+		for i in range(100000):
+			queue.append(i)
+			del queue[0]
+			self.assertLessEqual(len(queue.contents), 2)
+		for i in range(10):
+			queue.append(i)
+		for i in range(6):
+			del queue[0]
+		self.assertEqual(queue, [6, 7, 8, 9])
+		self.assertLessEqual(len(queue.contents), 8)
+		queue.append(10)
+		self.assertEqual((queue[0], queue[-1], len(queue)), (6, 10, 5))
+
+	def test_linked_lists(self):
+		tail = SnapList([3])
+		lst = SnapList.cons(1, SnapList.cons(2, tail))
+		self.assertTrue(lst.isLinked)
+		self.assertEqual((lst[0], len(lst), 3 in lst), (1, 3, True))
+		self.assertIs(lst.cdr().cdr(), tail)
+		self.assertTrue(lst.isLinked)
+
+		# As in Snap, a pair sees changes to the list it was put in front of.
+		tail.append(4)
+		self.assertEqual(lst, [1, 2, 3, 4])
+		pair = lst.cdr()
+		self.assertEqual(lst[2], 3)
+		self.assertFalse(lst.isLinked)
+		self.assertTrue(pair.isLinked)
+		self.assertEqual(pickle.loads(pickle.dumps(lst)), [1, 2, 3, 4])
+
+	def test_list_blocks(self):
+		p = Project()
+		e = p.executor
+		p.addGlobalVariable('L')
+		p.addGlobalVariable('total')
+		p.setGlobalVariable('total', 0)
+		e.execute(setVariableTo('L', numbersFrom(1, 10000)))
+		e.runScript(Script([repeat(lengthOf(Variable('L')), [
+			changeVariableBy('total', itemOf(1, Variable('L'))),
+			setVariableTo('L', allButFirstOf(Variable('L')))
+		])], p.globalVariables))
+		self.assertEqual(p.getGlobalVariable('total'), 50005000)
+		self.assertTrue(e.evaluate(isEmpty(Variable('L'))))
+
+		e.execute(setVariableTo('L', inFrontOf(0, newList([1, 2]))))
+		e.execute(addTo(3, Variable('L')))
+		self.assertEqual(e.evaluate(Variable('L')), [0, 1, 2, 3])
+		self.assertEqual(e.evaluate(allButFirstOf(inFrontOf(0, [1]))), [1])
+		self.assertEqual(e.evaluate(textSplit('a b', ' ')), SnapList(['a', 'b']))
+
+	def test_lazy_numbers(self):
+		p = Project()
+		e = p.executor
+		p.addGlobalVariable('L')
+		tracemalloc.start()
+		e.execute(setVariableTo('L', numbersFrom(1, 1000000)))
+		self.assertEqual(e.evaluate(lengthOf(Variable('L'))), 1000000)
+		self.assertEqual(e.evaluate(itemOf('last', Variable('L'))), 1000000)
+		self.assertEqual(e.evaluate(indexOf(500000, allButFirstOf(Variable('L')))), 499999)
+		self.assertTrue(e.evaluate(contains(Variable('L'), 999999)))
+		p.addGlobalVariable('total')
+		p.setGlobalVariable('total', 0)
+		e.execute(forEach(Option('n'), numbersFrom(1, 20000), [changeVariableBy('total', Variable('n'))]))
+		size, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		self.assertLess(peak, 100000)
+		self.assertEqual(p.getGlobalVariable('total'), 200010000)
+		self.assertEqual(p.getGlobalVariable('L').asRange(), range(1, 1000001))
+		self.assertEqual(e.evaluate(combine(mapOver(Block('reifyReporter', [multiply(None, 2)]), Variable('L')),
+										   Block('reifyReporter', [plus(None, None)]))), 1000001000000)
+
+		# Changing the list turns it into a real one.
+		e.execute(setVariableTo('L', numbersFrom(3, 1)))
+		lst = p.getGlobalVariable('L')
+		rest = lst.cdr()
+		e.execute(addTo(0, Variable('L')))
+		self.assertEqual((lst, rest), ([3, 2, 1, 0], [2, 1]))
+		self.assertEqual(lst.asRange(), None)
+		self.assertEqual(pickle.loads(pickle.dumps(rest)).asRange(), range(2, 0, -1))
+
+	def test_literals_are_copied(self):
+		p = Project()
+		e = p.executor
+		p.addGlobalVariable('x')
+		script = [setVariableTo('x', [1, [2]]), addTo(3, Variable('x')), addTo(4, itemOf(2, Variable('x')))]
+		runs = [lambda: e.executeScript(script), e.compileScript(script), lambda: e.runScript(Script(script, p.globalVariables))]
+		for run in runs + runs:
+			run()
+			self.assertEqual(p.getGlobalVariable('x'), [1, [2, 4], 3])
+		self.assertEqual(script[0].inputs[1], [1, [2]])
+		self.assertIsNot(e.evaluate(Block('reportCDR', [[1, 2]])).contents, e.evaluate(Block('reportCDR', [[1, 2]])).contents)
+
+	def test_higher_order_blocks(self):
+		e = Project().executor
+		double = Block('reifyReporter', [multiply(None, 2)])
+		odd = Block('reifyPredicate', [equalTo(modulo(Variable('n'), 2), 1), Option('n')])
+		self.assertEqual(e.evaluate(mapOver(double, [1, 2, 3])), [2, 4, 6])
+		self.assertEqual(e.evaluate(keep(odd, [1, 2, 3])), [1, 3])
+		self.assertEqual(e.evaluate(findFirst(odd, [2, 4, 5, 7])), 5)
+		self.assertEqual(e.evaluate(findFirst(odd, [2])), '')
+		self.assertEqual(e.evaluate(combine([1, 2, 3], Block('reifyReporter', [plus(None, None)]))), 6)
+		self.assertEqual(e.evaluate(combine([], Block('reifyReporter', [plus(None, None)]))), '')
+		self.assertEqual(e.evaluate(mapOver(double, keep(odd, numbersFrom(1, 5)))), [2, 6, 10])
+		# Rings asking for more parameters get the index and the list as well.
+		indexed = Block('reifyReporter', [plus(Variable('item'), Variable('index')), Option('item'), Option('index')])
+		self.assertEqual(e.evaluate(mapOver(indexed, keep(odd, [1, 2, 3]))), [2, 5])
+		self.assertEqual(e.evaluate(mapOver(Block('reifyReporter', [None]), ['a'])), ['a'])
+		self.assertEqual(e.evaluate(Block('evaluate', [double, [5]])), 10)
+
+	def test_vectorized_rings(self):
+		p = Project()
+		e = p.executor
+		p.addGlobalVariable('k')
+		p.setGlobalVariable('k', 3)
+		items = list(range(-100, 100))
+		ring = Block('reifyReporter', [plus(multiply(None, Variable('k')), absOf(None))])
+		predicate = Block('reifyPredicate', [andOp(greaterThan(None, 0), lessThan(None, 50))])
+		result = e.evaluate(mapOver(ring, keep(predicate, items)))
+		self.assertEqual(result, [x * 3 + abs(x) for x in items if 0 < x < 50])
+		self.assertTrue(all(type(x) == int for x in result))
+		self.assertEqual(e.evaluate(mapOver(Block('reifyReporter', [divide(None, 4)]), items))[:2], [-25.0, -24.75])
+		# NumPy errors fall back to the scalar path, which raises what Python raises.
+		with self.assertRaises(ValueError):
+			e.evaluate(mapOver(Block('reifyReporter', [sqrtOf(None)]), items))
+		with self.assertRaises(ZeroDivisionError):
+			e.evaluate(mapOver(Block('reifyReporter', [divide(1, None)]), items))
+
+class TestText(unittest.TestCase):
+
+	def test_join_coerces_like_snap(self):
+		e = Project().executor
+		self.assertEqual(e.evaluate(join([1, 2.5, True, None, 3.0, 'x', False])), '12.5true3xfalse')
+		self.assertEqual(e.evaluate(lengthOfText(join([10, 'ab']))), 4)
+		self.assertEqual(e.evaluate(lengthOfText(12.0)), 2)
+		self.assertEqual(e.evaluate(textSplit(join(['a b', ' ', 1]), ' ')), ['a', 'b', '1'])
+		self.assertTrue(e.evaluate(equalTo(join(['a', 'b']), 'ab')))
+		self.assertTrue(e.evaluate(equalTo(join(['a', 'b']), join(['ab']))))
+		self.assertTrue(e.evaluate(lessThan(join(['a']), 'b')))
+
+	def test_short_joins_are_strings(self):
+		e = Project().executor
+		self.assertIs(type(e.evaluate(join(['a', 1, True]))), str)
+		self.assertIs(type(e.evaluate(join(['a' * 600, 'b' * 600]))), Text)
+		self.assertIs(type(Text.join(Text(['a']), 'b')), Text)
+		self.assertIs(type(Text.join(1, 'b')), str)
+
+	def test_texts_share_their_pieces(self):
+		short = Text.join(Text(['a']), 'b')
+		longer = Text.join(short, 'c')
+		other = Text.join(short, 'd')
+		self.assertIs(longer.pieces, short.pieces)
+		self.assertEqual((short, longer, other), ('ab', 'abc', 'abd'))
+		self.assertEqual(str(Text.join(other, longer, 7)), 'abdabc7')
+		self.assertEqual({'abc' : 1}[longer], 1)
+		self.assertEqual(pickle.loads(pickle.dumps(longer)), 'abc')
+		self.assertEqual(decodeValue(encodeValue([longer])), ['abc'])
+		self.assertEqual(blockToXML(Block('doSayFor', [longer, Text()])), '<block s="doSayFor"><l>abc</l><l /></block>')
+
+		text = ''
+		for i in range(5 * sys.getrecursionlimit()):
+			text = Text.join(i % 10, text)
+		self.assertEqual(len(text), 5 * sys.getrecursionlimit())
+		self.assertTrue(str(text).startswith('9876543210'))
+
+	def test_text_built_in_a_loop(self):
+		p = Project()
+		script = Script([
+			setVariableTo('text', ''),
+			forLoop(Option('i'), 1, 2000, [setVariableTo('text', join([Variable('text'), Variable('i'), ' ']))]),
+			report(Variable('text'))
+		], {'text' : None})
+		text = p.executor.runScript(script)
+		# A string until it is ROPE_LENGTH long, then a Text growing a word at a time.
+		self.assertIs(type(text), Text)
+		self.assertGreater(len(text.pieces), 2 * 1500)
+		self.assertEqual(text, ' '.join(str(i) for i in range(1, 2001)) + ' ')
+		self.assertEqual(len(p.executor.evaluate(textSplit(text, ' '))), 2001)
+
+class TestScheduler(unittest.TestCase):
+
+	def setUp(self):
+		self.project = Project()
+		self.project.addGlobalVariable('log')
+		self.project.setGlobalVariable('log', [])
+		self.scheduler = self.project.scheduler
+
+	def addScript(self, *blocks):
+		script = Script(list(blocks), {})
+		self.project.scripts.append(script)
+		return script
+
+	def log(self):
+		return self.project.getGlobalVariable('log')
+
+	def test_threads_interleave(self):
+		self.addScript(greenFlag(), repeat(3, [addTo('a', Variable('log'))]))
+		self.addScript(greenFlag(), forLoop(Option('i'), 1, 3, [addTo(Variable('i'), Variable('log'))]))
+		self.assertEqual(len(self.scheduler.greenFlag()), 2)
+		# The last frame finishes the loops after their final yield.
+		self.assertEqual(self.scheduler.run(), 4)
+		self.assertEqual(self.log(), ['a', 1, 'a', 2, 'a', 3])
+
+	def test_warp_does_not_yield(self):
+		self.addScript(greenFlag(), warp([repeat(3, [addTo('a', Variable('log'))])]), addTo('done', Variable('log')))
+		self.scheduler.greenFlag()
+		self.assertEqual(self.scheduler.step(), 0)
+		self.assertEqual(self.log(), ['a', 'a', 'a', 'done'])
+
+	def test_stop_all(self):
+		self.addScript(greenFlag(), forever([addTo('a', Variable('log'))]))
+		self.addScript(greenFlag(), forever([If(equalTo(lengthOf(Variable('log')), 3), [stop('all')])]))
+		self.scheduler.greenFlag()
+		self.assertEqual(self.scheduler.run(10), 3)
+		self.assertEqual(self.scheduler.threads, [])
+
+	def test_waits(self):
+		now = [0]
+		self.scheduler.clock = lambda: now[0]
+		self.project.addGlobalVariable('ready')
+		self.addScript(greenFlag(), doWait(2), setVariableTo('ready', True))
+		self.addScript(greenFlag(), waitUntil(Variable('ready')), addTo('go', Variable('log')))
+		self.scheduler.greenFlag()
+		self.assertEqual(self.scheduler.run(5), 5)
+		self.assertEqual(self.log(), [])
+		now[0] = 2
+		self.scheduler.run()
+		self.assertEqual(self.log(), ['go'])
+
+	def test_fork_and_broadcast(self):
+		self.addScript(whenReceived(Option('ping')), repeat(2, [addTo('pong', Variable('log'))]))
+		self.addScript(greenFlag(), broadcastAndWait('ping'), addTo('after', Variable('log')))
+		self.addScript(greenFlag(), launch(commandRing([addTo('forked', Variable('log'))])))
+		self.scheduler.greenFlag()
+		self.scheduler.run()
+		self.assertEqual(self.log(), ['pong', 'forked', 'pong', 'after'])
+		self.assertEqual(self.project.lastMessage, 'ping')
+
+	def test_restart(self):
+		script = self.addScript(whenKeyPressed('space'), forever([addTo(1, Variable('log'))]))
+		first = self.scheduler.keyPressed('space')[0]
+		self.scheduler.step()
+		second = self.scheduler.keyPressed('space')[0]
+		self.assertTrue(first.done)
+		self.scheduler.step()
+		self.assertEqual(self.scheduler.threads, [second])
+		self.assertEqual(self.scheduler.keyPressed('a'), [])
+
+	def test_custom_threaded_primitive(self):
+		registry = PRIMITIVES.copy()
+		registry.register('doYield', lambda: None, 'command')
+
+		@registry.registerThreaded('doYield')
+		def doYield(executor, block, scope):
+			yield
+
+		self.project = Project(registry)
+		self.project.scripts.append(Script([greenFlag(), Block('doYield', []), Block('doYield', [])], {}))
+		self.project.scheduler.greenFlag()
+		self.assertEqual(self.project.scheduler.run(), 3)
+		self.assertNotIn('doYield', PRIMITIVES)
+		# Overriding a block drops its threaded version.
+		registry.register('doIf', lambda condition, script: None, 'command')
+		self.assertIsNone(registry.lookup('doIf').threaded)
+		self.assertIsNotNone(PRIMITIVES.lookup('doIf').threaded)
+
+class TestSpriteStore(unittest.TestCase):
+
+	def runSwarm(self, store, frames, *scripts):
+		p = Project()
+		p.addGlobalVariable('log')
+		p.setGlobalVariable('log', [])
+		if store:
+			p.enableSpriteStore(4)
+		sprite = makeSprite(x = -100, y = 50, heading = 30)
+		p.sprites['Sprite'] = sprite
+		for blocks in scripts:
+			p.scripts.append(Script([Block('receiveOnClone', [])] + blocks, {}, sprite))
+		p.scripts.append(Script([greenFlag(), repeat(12, [turnClockwise(37), moveSteps(23), createCloneOf('myself')])], {}, sprite))
+		p.scheduler.greenFlag()
+		p.scheduler.run(frames)
+		clones = []
+		for script in p.scripts:
+			if script.sprite is not sprite and script.sprite not in clones:
+				clones.append(script.sprite)
+		return p, clones
+
+	def test_swarm_matches_scalar(self):
+		scripts = [
+			[forever([moveSteps(9), turnCounterClockwise(plus(4, 3)), bounceOffEdge()])],
+			[forever([changeYBy(multiply(2, 3)), turnClockwise(11), bounceOffEdge()])],
+			[forever([addTo(xPosition(), Variable('log'))])]
+		]
+		p, clones = self.runSwarm(True, 60, *scripts)
+		reference, plainClones = self.runSwarm(False, 60, *scripts)
+		store = p.spriteStore
+		self.assertEqual(len(store), 12)
+		self.assertGreaterEqual(store.capacity, 12)
+		self.assertTrue(all(clone.store is store for clone in clones))
+		# The logging script is not made of motion blocks, so it runs block by block.
+		self.assertEqual([body != None for blocks, body in store.bodies.values()], [True, True, False])
+		self.assertEqual(len(clones), len(plainClones))
+		for clone, plain in zip(clones, plainClones):
+			for actual, expected in zip(clone.coords + (clone.heading,), plain.coords + (plain.heading,)):
+				self.assertAlmostEqual(actual, expected)
+		# The reading script sees every move that ran before it in the frame.
+		log, expected = p.getGlobalVariable('log'), reference.getGlobalVariable('log')
+		self.assertEqual(len(log), len(expected))
+		for actual, value in zip(log, expected):
+			self.assertAlmostEqual(actual, value)
+
+	def test_random_inputs(self):
+		p, clones = self.runSwarm(True, 20, [forever([gotoXY(pickRandom(-10, 10), pickRandom(0.5, 1.5))])])
+		self.assertTrue(all(-10 <= clone.coords[0] <= 10 and 0.5 <= clone.coords[1] <= 1.5 for clone in clones))
+		self.assertTrue(all(type(clone.coords[0]) == float for clone in clones))
+
+	def test_remove_clones(self):
+		p, clones = self.runSwarm(True, 15, [forever([changeXBy(1)])])
+		store = p.spriteStore
+		removed = clones[0]
+		thread = p.scheduler.scriptThreads[removed.scripts[0]]
+		p.executor.runScript(Script([removeClone()], {}, removed))
+		self.assertTrue(thread.done)
+		self.assertEqual(len(store), len(clones) - 1)
+		self.assertNotIn(removed.scripts[0], p.scripts)
+
+		sprite = p.getSprite('Sprite')
+		p.scheduler.start(Script([createCloneOf('Sprite')], {}, sprite))
+		p.scheduler.step()
+		clone = p.scripts[-1].sprite
+		self.assertEqual(clone.slot, removed.slot)
+		self.assertEqual(clone.coords, sprite.coords)
+		p.scheduler.run(3)
+		self.assertAlmostEqual(clone.coords[0], sprite.coords[0] + 3)
+		# Changing a stored clone by hand works as on any sprite.
+		clone.heading = 450
+		self.assertEqual(clone.heading, 450)
+		p.executor.runScript(Script([turnClockwise(10)], {}, clone))
+		self.assertEqual(clone.heading, 100)
+
+class TestSpatialIndex(unittest.TestCase):
+
+	def test_sensing_blocks(self):
+		p = Project()
+		first, second = makeSprite('First'), makeSprite('Second', x = 15)
+		p.sprites.update(First = first, Second = second)
+		self.assertTrue(p.executor.runScript(Script([report(touching('Second'))], {}, first)))
+		self.assertIs(first.spatialIndex, p.spatialIndex)
+
+		p.executor.runScript(Script([gotoXY(100, 0)], {}, second))
+		self.assertFalse(p.executor.runScript(Script([report(touching('Second'))], {}, first)))
+		self.assertEqual(p.executor.runScript(Script([report(distanceTo('Second'))], {}, first)), 100)
+		self.assertFalse(p.executor.runScript(Script([report(touching('edge'))], {}, second)))
+		p.executor.runScript(Script([changeXBy(135)], {}, second))
+		self.assertTrue(p.executor.runScript(Script([report(touching('edge'))], {}, second)))
+
+		# Clones are touched as their sprite, and hidden sprites touch nothing.
+		clone = p.createClone(second)
+		p.executor.runScript(Script([gotoXY(5, 5)], {}, clone))
+		self.assertTrue(p.executor.runScript(Script([report(touching('Second'))], {}, first)))
+		clone.hidden = True
+		self.assertFalse(p.executor.runScript(Script([report(touching('Second'))], {}, first)))
+		p.removeClone(clone)
+		self.assertNotIn(clone, p.spatialIndex)
+
+	def test_matches_brute_force(self):
+		random.seed(7)
+		p = Project()
+		index = p.enableSpatialIndex(32)
+		sprites = [makeSprite('Even' if i % 2 == 0 else 'Odd', random.uniform(-300, 300), random.uniform(-200, 200)) for i in range(200)]
+		for sprite in sprites:
+			index.add(sprite)
+		for frame in range(3):
+			for sprite in sprites:
+				self.assertEqual(index.touching(sprite, 'Odd'), any(
+					other is not sprite and other.name == 'Odd' and
+					abs(other.coords[0] - sprite.coords[0]) <= 20 and abs(other.coords[1] - sprite.coords[1]) <= 20
+					for other in sprites))
+				nearest = index.nearest(sprite, 'Even')
+				self.assertEqual(distance(sprite, nearest),
+								 min(distance(sprite, other) for other in sprites if other is not sprite and other.name == 'Even'))
+			for sprite in sprites[::3]:
+				p.executor.runScript(Script([moveSteps(random.uniform(0, 80)), turnClockwise(random.uniform(0, 360))], {}, sprite))
+		# A name too rare to search the grid for is found by comparing with each sprite of that name.
+		rare = makeSprite('Rare', 290, -190)
+		index.add(rare)
+		self.assertIs(index.nearest(sprites[0], 'Rare'), rare)
+		self.assertIsNone(index.nearest(rare, 'Rare'))
+		self.assertIsNone(SpatialIndex().nearest(sprites[0]))
+
+	def test_search_shrinks_back(self):
+		index = SpatialIndex(10)
+		sprites = [makeSprite('Sprite', 0, 0), makeSprite('Sprite', 30, 0)]
+		for sprite in sprites:
+			index.add(sprite)
+		sprites[1].coords = (10 ** 6, 0)
+		index.update(sprites[1])
+		self.assertIs(index.nearest(sprites[0]), sprites[1])
+		self.assertEqual(index.occupiedBounds(), (-1, -1, 10 ** 5 + 1, 1))
+		# Once the far sprite is back, the search only covers the cells around the two.
+		sprites[1].coords = (30, 0)
+		index.update(sprites[1])
+		self.assertEqual(index.occupiedBounds(), (-1, -1, 4, 1))
+		self.assertIs(index.nearest(sprites[0]), sprites[1])
+		index.remove(sprites[1])
+		self.assertEqual(index.occupiedBounds(), (-1, -1, 1, 1))
+		self.assertIsNone(index.nearest(sprites[0]))
+
+	def test_swarm_moves_are_indexed(self):
+		p = Project()
+		p.enableSpriteStore()
+		sprite = makeSprite()
+		p.sprites['Sprite'] = sprite
+		index = p.enableSpatialIndex()
+		p.scripts.append(Script([Block('receiveOnClone', []), forever([moveSteps(40), bounceOffEdge()])], {}, sprite))
+		p.scripts.append(Script([greenFlag(), repeat(10, [turnClockwise(36), createCloneOf('myself')])], {}, sprite))
+		p.scheduler.greenFlag()
+		p.scheduler.run(30)
+		self.assertEqual(len(index), 11)
+		for other in index.entries:
+			self.assertEqual(index.entries[other][:2], other.coords)
+
+class TestHatIndex(unittest.TestCase):
+
+	def setUp(self):
+		self.project = Project()
+		self.project.addGlobalVariable('log')
+		self.project.setGlobalVariable('log', [])
+		self.project.addGlobalVariable('name')
+		self.project.setGlobalVariable('name', 'ping')
+
+	def addScript(self, hat, entry, sprite = None):
+		script = Script([hat, addTo(entry, Variable('log'))], {}, sprite)
+		self.project.scripts.append(script)
+		return script
+
+	def log(self):
+		return self.project.getGlobalVariable('log')
+
+	def test_receivers_keep_project_order(self):
+		p = self.project
+		self.addScript(whenReceived('ping'), 'a')
+		self.addScript(whenReceived('any message'), 'b')
+		self.addScript(whenReceived(Variable('name')), 'c')
+		self.addScript(whenReceived('pong'), 'd')
+		self.addScript(whenReceived('ping'), 'e')
+		self.addScript(greenFlag(), 'f')
+		p.broadcast('ping')
+		self.assertEqual(self.log(), ['a', 'b', 'c', 'e'])
+		p.setGlobalVariable('name', 'pong')
+		p.broadcast('pong')
+		self.assertEqual(self.log()[4:], ['b', 'c', 'd'])
+		# Lists cannot be keys, so only the catch-all and dynamic hats can answer them.
+		p.setGlobalVariable('name', ['x'])
+		p.broadcast(['x'])
+		self.assertEqual(self.log()[7:], ['b', 'c'])
+		self.assertEqual(len(p.hats.scripts('receiveMessage')), 5)
+
+	def test_send_and_keys(self):
+		p = self.project
+		first, second = makeSprite('First'), makeSprite('Second')
+		p.sprites.update(First = first, Second = second)
+		self.addScript(whenReceived('go'), 'first', first)
+		self.addScript(whenReceived('go'), 'second', second)
+		self.addScript(whenKeyPressed('space'), 'space', second)
+		self.addScript(whenKeyPressed('any key'), 'key', first)
+		p.executor.execute(sendMessageTo('go', 'Second'))
+		self.assertEqual(self.log(), ['second'])
+		self.assertEqual(len(p.scheduler.keyPressed('space')), 2)
+		p.scheduler.run()
+		self.assertEqual(len(p.scheduler.keyPressed('a')), 1)
+		p.scheduler.run()
+		self.assertEqual(self.log(), ['second', 'space', 'key', 'key'])
+
+	def test_index_follows_scripts(self):
+		p = self.project
+		sprite = makeSprite()
+		p.sprites['Sprite'] = sprite
+		script = self.addScript(whenReceived('go'), 'sprite', sprite)
+		clone = p.createClone(sprite)
+		self.assertEqual(len(p.hats.receivers('receiveMessage', 'go')), 2)
+		p.removeClone(clone)
+		self.assertEqual(p.hats.receivers('receiveMessage', 'go'), [script])
+
+		# Anything else that changes the list rebuilds the index in the list's order.
+		first = self.addScript(whenReceived('go'), 'first')
+		p.scripts.insert(0, p.scripts.pop())
+		self.assertEqual(p.hats.receivers('receiveMessage', 'go'), [first, script])
+		p.scripts = [script]
+		self.assertEqual(p.hats.receivers('receiveMessage', 'go'), [script])
+		del p.scripts[0]
+		self.assertEqual(len(p.hats), 0)
+
+	def test_removal_is_lazy(self):
+		p = self.project
+		scripts = [Script([whenReceived(str(i))], {}) for i in range(5)]
+		p.scripts = scripts + [scripts[1]]
+		p.scripts.remove(scripts[1])
+		p.scripts.remove(scripts[3])
+		self.assertNotIn(scripts[3], p.scripts)
+		self.assertIn(scripts[1], p.scripts)
+		with self.assertRaises(ValueError):
+			p.scripts.remove(scripts[3])
+		# Removed scripts are only taken out when the list is read.
+		self.assertEqual(list.__len__(p.scripts), 6)
+		self.assertEqual(len(p.scripts), 4)
+		self.assertEqual(p.scripts, [scripts[0], scripts[2], scripts[4], scripts[1]])
+		# The copy of scripts[1] left is still indexed, in its own place.
+		self.assertEqual(p.hats.receivers('receiveMessage', '1'), [scripts[1]])
+		self.assertEqual(p.hats.scripts('receiveMessage'), list(p.scripts))
+		# Appending a removed script takes nothing out yet.
+		p.scripts.remove(scripts[0])
+		p.scripts.append(scripts[0])
+		self.assertEqual(list.__len__(p.scripts), 5)
+		self.assertEqual(p.scripts.index(scripts[0]), 3)
+		self.assertEqual(p.hats.scripts('receiveMessage'), list(p.scripts))
+		self.assertEqual(p.scripts.pop(0), scripts[2])
+		self.assertEqual(p.hats.receivers('receiveMessage', '0'), [scripts[0]])
+		self.assertEqual(p.hats.receivers('receiveMessage', '2'), [])
+		p.scripts.remove(scripts[1])
+		self.assertEqual(p.hats.receivers('receiveMessage', '1'), [])
+
+class TestProjectLoader(unittest.TestCase):
+
+	def test_load_global_variables(self):
+		p = Project.load('TestXMLs/singleVariable.xml')
+		self.assertEqual(p.name, 'singleVariable')
+		self.assertEqual(p.globalVariables, {'variable' : 0})
+		self.assertEqual(len(p.scripts), 1)
+		self.assertEqual(p.executor.runScript(p.scripts[0]), None)
+		self.assertEqual(p.executor.evaluate(p.scripts[0].blocks[0]), 0)
+
+	def test_load_sprites(self):
+		with open('TestXMLs/hiddenTest.xml', 'rb') as projectFile:
+			p = Project.load(projectFile)
+
+		self.assertEqual(p.notes[:19], 'this is a test note')
+		self.assertEqual(list(p.sprites), ['Sprite', 'Sprite(2)'])
+		sprite = p.getSprite('Sprite')
+		self.assertEqual(sprite.coords, (-122, -1))
+		self.assertEqual(sprite.heading, 150)
+		self.assertEqual(sprite.color, (80, 80, 80))
+		self.assertEqual([costume.name for costume in sprite.costumes], ['alonzo (vector)'])
+		self.assertEqual(p.stage.sprites, [sprite, p.getSprite('Sprite(2)')])
+
+	def test_load_scripts(self):
+		p = Project.load('TestXMLs/variableblocks.xml')
+		sprite = p.getSprite('Sprite')
+		self.assertEqual(len(sprite.scripts), 17)
+		self.assertIs(sprite.scripts[0].sprite, sprite)
+
+		firstScript = sprite.scripts[0]
+		self.assertEqual([block.signature for block in firstScript.blocks], [
+			'doSetVar', 'doChangeVar', 'doShowVar',
+			'doHideVar', 'doDeclareVariables', 'doDeleteAttr'
+		])
+		self.assertEqual(firstScript.blocks[4].inputs, ['TEST LOCAL'])
+		self.assertEqual(p.executor.evaluate(sprite.scripts[2].blocks[0]), list(range(1, 11)))
+
+	def test_load_nested_blocks(self):
+		p = Project.load('TestXMLs/controlblocks.xml')
+		monadic = Project.load('TestXMLs/snappy.xml').scripts[7].blocks[0]
+		self.assertEqual(monadic.inputs[0].text, 'sqrt')
+		self.assertEqual(monadic.inputs[1], 10)
+
+		ring = p.scripts[21].blocks[0].inputs[0]
+		self.assertEqual(ring.signature, 'reifyScript')
+		self.assertEqual(type(ring.inputs[0]), Script)
+
+class TestMedia(unittest.TestCase):
+
+	def test_costume_handles(self):
+		p = Project.load('TestXMLs/hiddenTest.xml')
+		image = p.getSprite('Sprite').costumes[0].image
+
+		with open('TestXMLs/hiddenTest.xml', 'rb') as projectFile:
+			source = projectFile.read()
+		self.assertEqual(bytes(image.span()), source[image.start:image.end])
+		self.assertTrue(bytes(image.span()).startswith(b'data:image/svg+xml;base64,'))
+		self.assertEqual(image.mimeType(), 'image/svg+xml')
+		self.assertIn(b'<svg', image.decode())
+
+	def test_thumbnail_handle(self):
+		p = Project.load('TestXMLs/snappy.xml')
+		self.assertEqual(p.thumbnail.mimeType(), 'image/png')
+		self.assertEqual(p.thumbnail.decode()[:8], b'\x89PNG\r\n\x1a\n')
+		self.assertEqual(p.stage.pentrails.header(), 'data:image/png;base64')
+
+	def test_write_copies_span(self):
+		p = Project.load('TestXMLs/snappy.xml')
+		stream = io.BytesIO()
+		p.thumbnail.writeTo(stream)
+		self.assertEqual(stream.getvalue(), bytes(p.thumbnail.span()))
+
+	def test_unmappable_source(self):
+		with open('TestXMLs/hiddenTest.xml', 'rb') as projectFile:
+			source = projectFile.read()
+		mapped = Project.load('TestXMLs/hiddenTest.xml').getSprite('Sprite').costumes[0].image
+		copied = Project.load(io.BytesIO(source)).getSprite('Sprite').costumes[0].image
+		self.assertEqual(copied.decode(), mapped.decode())
+
+class TestBatchEvaluation(unittest.TestCase):
+
+	def assertMatchesScalar(self, executor, expression, columns):
+		batch = executor.evaluateBatch(expression, columns)
+		names = list(columns)
+		rows = zip(*[columns[name].tolist() for name in names])
+		scalar = [executor.evaluate(expression, dict(zip(names, row))) for row in rows]
+		self.assertEqual(len(batch), len(scalar))
+		for batchValue, scalarValue in zip(batch.tolist(), scalar):
+			self.assertEqual(type(batchValue), type(scalarValue))
+			self.assertAlmostEqual(batchValue, scalarValue)
+
+	def test_matches_scalar_path(self):
+		import numpy as np
+		p = Project()
+		columns = {'x' : np.arange(-5, 5), 'y' : np.linspace(0.5, 9, 10)}
+		x, y = Variable('x'), Variable('y')
+		expressions = [
+			plus(multiply(x, 2), sqrtOf(y)),
+			divide(x, 3),
+			power(x, 2),
+			power(2, absOf(x)),
+			modulo(x, 3),
+			reportRound(y),
+			floorOf(y),
+			ceilOf(y),
+			negOf(absOf(x)),
+			binLogOf(y),
+			eTo(y),
+			lessThan(x, y),
+			notOp(equalTo(x, 2)),
+			orOp(x, 7)
+		]
+		for expression in expressions:
+			self.assertMatchesScalar(p.executor, expression, columns)
+
+	def test_fallback(self):
+		import numpy as np
+		p = Project()
+		columns = {'x' : np.arange(3), 'w' : np.array(['a', 'b c', 'd e f'])}
+		# textSplit and lengthOf are not vectorized, but the sum around them is.
+		expression = plus(lengthOf(textSplit(Variable('w'), ' ')), Variable('x'))
+		self.assertEqual(p.executor.evaluateBatch(expression, columns).tolist(), [1, 3, 5])
+		self.assertEqual(p.executor.evaluateBatch(join([Variable('w'), '!']), columns).tolist(),
+			['a!', 'b c!', 'd e f!'])
+
+	def test_random_types(self):
+		import numpy as np
+		p = Project()
+		columns = {'x' : np.zeros(1000)}
+		integers = p.executor.evaluateBatch(pickRandom(1, 6), columns)
+		self.assertEqual(integers.dtype.kind, 'i')
+		self.assertEqual(set(integers.tolist()), {1, 2, 3, 4, 5, 6})
+		floats = p.executor.evaluateBatch(pickRandom(1, 6.0), columns)
+		self.assertEqual(floats.dtype.kind, 'f')
+		self.assertTrue(((floats >= 1) & (floats <= 6)).all())
+
+	def test_errors(self):
+		import numpy as np
+		p = Project()
+		columns = {'x' : np.arange(-1, 2)}
+		with self.assertRaises(ZeroDivisionError):
+			p.executor.evaluateBatch(divide(1, Variable('x')), columns)
+		with self.assertRaises(ValueError):
+			p.executor.evaluateBatch(sqrtOf(Variable('x')), columns)
+		with self.assertRaises(ValueError):
+			p.executor.evaluateBatch(Variable('x'), {'x' : np.arange(2), 'y' : np.arange(3)})
+
+	def test_edge_values(self):
+		import numpy as np
+		p = Project()
+		x = Variable('x')
+		# int64 would overflow, so these run through the scalar handlers.
+		cases = [
+			(multiply(x, x), [2 ** 40, 3]),
+			(plus(multiply(x, x), 1), [2 ** 40, -3]),
+			(power(x, 30), [-5, 2]),
+			(twoTo(x), [70, 3]),
+			(modulo(x, 7), [2 ** 60, -9]),
+			(reportRound(x), [1e300, 2.5]),
+			(floorOf(x), [-1e20, 2.5]),
+			(equalTo(x, 2 ** 53 + 1), [2.0 ** 53, 1.0]),
+			(plus(x, x), [True, False]),
+			(multiply(x, 1e300), [1e200, 3.0]),
+			# and/or report an operand, which NumPy would turn into a float or int.
+			(andOp(x, 2.5), [0, 1, 2]),
+			(orOp(x, 2.5), [0, 1, 2]),
+			(orOp(x, True), [0, 1, 2])
+		]
+		for expression, values in cases:
+			self.assertMatchesScalar(p.executor, expression, {'x' : np.array(values)})
+		# Floating point errors raise what the scalar path raises.
+		for expression, values, error in [(sinOf(x), [float('inf'), 1.0], ValueError),
+										  (eTo(x), [1000.0, 1.0], OverflowError),
+										  (power(x, 2), [1e200, 3.0], OverflowError),
+										  (reportRound(x), [float('nan'), 1.0], ValueError),
+										  (modulo(x, 0), [1, 2], ZeroDivisionError)]:
+			with self.assertRaises(error):
+				p.executor.evaluate(expression, {'x' : values[0]})
+			with self.assertRaises(error):
+				p.executor.evaluateBatch(expression, {'x' : np.array(values)})
+		with self.assertRaises(ValueError):
+			p.executor.evaluateBatch(plus(x, 1), {'x' : np.array([])})
+
+class TestOptimizer(unittest.TestCase):
+
+	def test_constant_folding(self):
+		optimized = optimize(plus(multiply(2, 3.14), Variable('x')))
+		self.assertEqual(optimized.signature, 'reportSum')
+		self.assertEqual(optimized.inputs[0], 6.28)
+		self.assertEqual(optimized.inputs[1].name, 'x')
+
+		optimized = optimize(andOp(lessThan(1, 2), sqrtOf(16)))
+		self.assertEqual(optimized.inputs, [True, 4.0])
+
+		optimized = optimize(join(['a', join(['b', 'c'])]))
+		self.assertEqual(optimized.inputs, ['a', 'bc'])
+
+	def test_impure_blocks_are_kept(self):
+		optimized = optimize(plus(pickRandom(1, 2), divide(1, 0)))
+		self.assertEqual(optimized.inputs[0].signature, 'reportRandom')
+		# Errors are left for the executor to raise.
+		self.assertEqual(optimized.inputs[1].signature, 'reportQuotient')
+
+		# Lists are mutable, so a split is never folded into a literal.
+		optimized = optimize(lengthOf(textSplit('a b', ' ')))
+		self.assertEqual(optimized.inputs[0].signature, 'reportTextSplit')
+
+	def test_interned_subtrees(self):
+		optimized = optimize(multiply(divide(1, 0), divide(1, 0)))
+		self.assertIs(optimized.inputs[0], optimized.inputs[1])
+
+		# Variable reads are impure, so nothing holding one is interned.
+		optimized = optimize(multiply(plus(Variable('x'), 1), plus(Variable('x'), 1)))
+		self.assertIsNot(optimized.inputs[0], optimized.inputs[1])
+		self.assertIsNot(optimized.inputs[0].inputs[0], optimized.inputs[1].inputs[0])
+
+		optimized = optimize(plus(pickRandom(1, 6), pickRandom(1, 6)))
+		self.assertIsNot(optimized.inputs[0], optimized.inputs[1])
+
+	def test_registry(self):
+		p = Project(PRIMITIVES.copy())
+		p.executor.primitives.registerMonadic('sqrt', lambda x: -x)
+		self.assertEqual(optimize(plus(sqrtOf(16), Variable('x')), p.executor).inputs[0], -16)
+		self.assertEqual(optimize(plus(sqrtOf(16), Variable('x'))).inputs[0], 4.0)
+
+	def test_scripts(self):
+		p = Project()
+		scope = {}
+		script = [scriptVariables(['a']), If(lessThan(1, 2), [setVariableTo('a', plus(1, 2))])]
+		optimized = [optimize(block) for block in script]
+		self.assertEqual(optimized[1].inputs[0], True)
+		self.assertEqual(optimized[1].inputs[1][0].inputs[1], 3)
+		p.executor.executeScript(optimized, scope)
+		self.assertEqual(scope['a'], 3)
+
+	def test_round_trip(self):
+		p = Project()
+		p.addGlobalVariable('x')
+		p.setGlobalVariable('x', 2)
+		p.addGlobalVariable('y')
+		p.setGlobalVariable('y', 'd')
+		expressions = [
+			plus(multiply(2, 3.14), Variable('x')),
+			andOp(lessThan(1, 2), greaterThan(sqrtOf(16), Variable('x'))),
+			join(['a', join(['b', 'c']), Variable('y')]),
+			plus(divide(1, 3), multiply(Variable('x'), Variable('x')))
+		]
+		for expression in expressions:
+			optimized = optimize(expression)
+			xml = blockToXML(optimized)
+			self.assertEqual(blockToXML(xmlToBlock(xml)), xml)
+			self.assertEqual(p.executor.evaluate(xmlToBlock(xml)), p.executor.evaluate(expression))
+
+class TestBlockValues(unittest.TestCase):
+
+	def test_structural_equality(self):
+		self.assertEqual(plus(Variable('x'), 1), plus(Variable('x'), 1))
+		self.assertEqual(hash(absOf(2)), hash(absOf(2)))
+		self.assertNotEqual(plus(1, 2), plus(1, 3))
+		self.assertNotEqual(plus(1, 2), subtract(1, 2))
+		# Literals of different types are different blocks in XML.
+		self.assertNotEqual(plus(1, 2), plus(1.0, 2))
+		self.assertNotEqual(boolean(1), boolean(True))
+		self.assertNotEqual(Variable('x'), Option('x'))
+		self.assertEqual(newList([1, [2]]), newList([1, [2]]))
+		items = [1, [2]]
+		self.assertEqual(len({newList(items), newList(items), Option('abs'), Option('abs')}), 2)
+
+	def test_immutable(self):
+		block = plus(1, 2)
+		with self.assertRaises(AttributeError):
+			block.signature = 'reportDiff'
+		with self.assertRaises(TypeError):
+			block.inputs[0] = 5
+		with self.assertRaises(TypeError):
+			block.inputs.append(3)
+		with self.assertRaises(AttributeError):
+			Option('abs').text = 'neg'
+		# The list passed in is copied, so changing it later does nothing.
+		inputs = [1, 2]
+		block = Block('reportSum', inputs)
+		inputs.append(3)
+		self.assertEqual(block.inputs, [1, 2])
+
+	def test_pickle(self):
+		block = ifElse(lessThan(Variable('x'), 1), [setVariableTo('x', absOf(2))], [])
+		copied = pickle.loads(pickle.dumps(block))
+		self.assertEqual(copied, block)
+		self.assertEqual(blockToXML(copied), blockToXML(block))
+
+	def test_intern(self):
+		table = NodeTable()
+		first = table.intern(plus(absOf(Variable('i')), 1.5))
+		second = table.intern(multiply(absOf(Variable('i')), 1.5))
+		self.assertIs(first.inputs[0], second.inputs[0])
+		self.assertIs(first.inputs[0].inputs[0], Option('abs') and second.inputs[0].inputs[0])
+		self.assertIs(table.intern(plus(absOf(Variable('i')), 1.5)), first)
+		# 1.5 and 1 are kept apart even though a dict would merge 1 and 1.0.
+		self.assertEqual(type(table.intern(plus(1, 1.0)).inputs[1]), float)
+		# Blocks holding lists are not shared, since the list can be changed.
+		holding = table.intern(plus(Block('reportListLength', [[1]]), absOf(Variable('i'))))
+		self.assertIsNot(table.intern(plus(Block('reportListLength', [[1]]), absOf(Variable('i')))), holding)
+		self.assertIs(holding.inputs[1], first.inputs[0])
+
+	def test_hash_with_lists(self):
+		items = [1, [2]]
+		block = plus(Block('reportListLength', [items]), absOf(1))
+		blockHash = hash(block)
+		table = {block : 'x'}
+		# Lists are hashed by identity, so changing one leaves the kept hash right.
+		items[1].append(3)
+		self.assertEqual(hash(block), blockHash)
+		self.assertEqual(table[plus(Block('reportListLength', [items]), absOf(1))], 'x')
+		self.assertEqual(block, plus(Block('reportListLength', [[1, [2, 3]]]), absOf(1)))
+		self.assertEqual(block.inputs[1]._hash, hash(absOf(1)))
+		# Every Block in a deep tree keeps its hash, lists or not.
+		expression = Block('reportListLength', [[1, 2]])
+		for i in range(4000):
+			expression = Block('reportSum', [expression, 1])
+		hash(expression)
+		self.assertTrue(hasattr(expression.inputs[0], '_hash'))
+
+	def test_load_with_table(self):
+		table = NodeTable()
+		first = Project.load('TestXMLs/variableblocks.xml', table)
+		second = Project.load('TestXMLs/variableblocks.xml', table)
+		self.assertIs(first.scripts[0].blocks[0], second.scripts[0].blocks[0])
+		self.assertEqual(first.scripts[2].blocks, second.scripts[2].blocks)
+
+
+class TestMemoization(unittest.TestCase):
+
+	def setUp(self):
+		self.project = Project()
+		self.project.addGlobalVariable('x')
+		self.project.setGlobalVariable('x', 3)
+		self.executor = self.project.executor
+		self.memo = self.executor.enableMemoization()
+
+	def test_hits_and_misses(self):
+		expression = plus(multiply(Variable('x'), Variable('x')), 1)
+		self.assertEqual(self.executor.evaluate(expression), 10)
+		self.assertEqual(self.executor.evaluate(plus(multiply(Variable('x'), Variable('x')), 1)), 10)
+		statistics = self.memo.statistics()
+		self.assertEqual((statistics['hits'], statistics['misses']), (1, 2))
+		self.assertEqual(statistics['size'], 2)
+		# An unchanged input is reused when another input has changed.
+		self.project.addGlobalVariable('y')
+		self.project.setGlobalVariable('y', 2)
+		self.assertEqual(self.executor.evaluate(plus(multiply(Variable('x'), Variable('x')), Variable('y'))), 11)
+		self.assertEqual(self.memo.statistics()['hits'], 2)
+
+	def test_writes_invalidate(self):
+		expression = plus(Variable('x'), 1)
+		self.assertEqual(self.executor.evaluate(expression), 4)
+		self.executor.execute(setVariableTo('x', 10))
+		self.assertEqual(self.executor.evaluate(expression), 11)
+		self.executor.execute(changeVariableBy('x', 5))
+		self.assertEqual(self.executor.evaluate(expression), 16)
+		self.project.setGlobalVariable('x', 0)
+		self.assertEqual(self.executor.evaluate(expression), 1)
+		scope = {'y' : 1}
+		self.executor.executeScript([scriptVariables([Option('x')]), setVariableTo('x', 2)], scope)
+		self.assertEqual(self.executor.evaluate(expression, scope), 3)
+		self.assertEqual(self.memo.statistics()['hits'], 0)
+
+	def test_loops_invalidate(self):
+		self.project.addGlobalVariable('total')
+		self.project.setGlobalVariable('total', 0)
+		script = [Block('doFor', [Option('i'), 1, 4, [changeVariableBy('total', multiply(Variable('i'), 2))]])]
+		self.executor.executeScript(script, {'i' : 0})
+		self.assertEqual(self.project.getGlobalVariable('total'), 20)
+
+	def test_impure_never_cached(self):
+		random.seed(7)
+		expression = plus(pickRandom(1, 1000000), multiply(Variable('x'), 2))
+		results = {self.executor.evaluate(expression) for i in range(20)}
+		self.assertGreater(len(results), 1)
+		# The pure input is still cached on its own.
+		self.assertEqual(self.memo.statistics()['hits'], 19)
+
+	def test_lists_not_cached(self):
+		self.project.addGlobalVariable('L')
+		self.project.setGlobalVariable('L', [1, 2])
+		expression = equalTo(Variable('L'), Variable('L'))
+		self.executor.evaluate(expression)
+		self.executor.evaluate(textSplit('a b', ' '))
+		self.assertEqual(self.memo.statistics()['size'], 0)
+
+	def test_eviction(self):
+		memo = self.executor.enableMemoization(maxSize=2)
+		for i in range(3):
+			self.executor.evaluate(plus(Variable('x'), i))
+		self.assertEqual(memo.statistics()['evictions'], 1)
+		self.executor.evaluate(plus(Variable('x'), 0))
+		self.assertEqual(memo.statistics()['hits'], 0)
+		self.executor.evaluate(plus(Variable('x'), 2))
+		self.assertEqual(memo.statistics()['hits'], 1)
+
+	def test_reads_are_bounded(self):
+		memo = self.executor.enableMemoization(maxSize=4)
+		for i in range(50):
+			self.assertEqual(self.executor.evaluate(plus(multiply(Variable('x'), i), 1)), 3 * i + 1)
+			self.assertLessEqual(len(memo.reads), 4)
+		# A reporter whose reads were pushed out is worked out again.
+		self.assertEqual(self.executor.evaluate(plus(multiply(Variable('x'), 0), 1)), 1)
+		self.assertEqual(self.executor.evaluate(plus(multiply(Variable('x'), 0), 1)), 1)
+		self.assertEqual(memo.statistics()['hits'], 1)
+
+	def test_deep_chain_with_list(self):
+		# Each lookup must be constant time, or a chain this deep takes minutes.
+		depth = 20000
+		expression = Block('reportListLength', [[1, 2]])
+		for i in range(depth):
+			expression = plus(expression, 1)
+		for i in range(2):
+			self.assertEqual(self.executor.evaluate(expression), depth + 2)
+		statistics = self.memo.statistics()
+		self.assertEqual((statistics['hits'], statistics['size']), (0, 0))
+
+	def test_rings_rebind_parameters(self):
+		ring = Block('reifyReporter', [ifThenElse(greaterThan(Variable('n'), 0), multiply(Variable('n'), 2), 0), Option('n')])
+		self.assertEqual(self.executor.evaluate(mapOver(ring, [1, 2, 3, 4])), [2, 4, 6, 8])
+		self.assertEqual(self.executor.evaluate(mapOver(ring, [-1, 5])), [0, 10])
+
+
+class TestBatchRunner(unittest.TestCase):
+
+	def setUp(self):
+		self.count = [scriptVariables([Option('n')]), setVariableTo('n', 0), repeat(5, [changeVariableBy('n', 1)])]
+
+	def test_budgets(self):
+		spin = [scriptVariables([Option('n')]), setVariableTo('n', 0), warp([forever([changeVariableBy('n', 1)])])]
+		with BatchRunner(0, frames=3, seconds=0.2) as runner:
+			results = list(runner.run([self.count, BatchJob(spin, 'spin'), [divide(1, 0)]]))
+		self.assertEqual([result.status for result in results], ['frames', 'timeout', 'error'])
+		self.assertEqual(results[0].variables, {'n' : 3})
+		self.assertEqual(results[1].name, 'spin')
+		self.assertGreater(results[1].variables['n'], 0)
+		self.assertEqual(results[2].error, 'ZeroDivisionError: division by zero')
+
+	def test_early_timeouts(self):
+		import signal
+		handler = signal.getsignal(signal.SIGALRM)
+		spin = [warp([forever([])])]
+		# However soon the timer fires, the job times out and the handler is put back.
+		for seconds in [1e-6, 1e-5, 1e-4]:
+			for i in range(20):
+				self.assertEqual(runJob(i, BatchJob(spin), seconds=seconds).status, 'timeout')
+				self.assertIs(signal.getsignal(signal.SIGALRM), handler)
+
+	def test_workers_keep_order(self):
+		jobs = ['TestXMLs/singleVariable.xml'] + [self.count[:2] + [repeat(n, [changeVariableBy('n', 1)])] for n in range(1, 6)]
+		with BatchRunner(2) as runner:
+			results = list(runner.run(iter(jobs)))
+		self.assertEqual([result.index for result in results], list(range(6)))
+		self.assertEqual(results[0].name, 'TestXMLs/singleVariable.xml')
+		self.assertEqual(results[0].variables, {'variable' : 0})
+		self.assertEqual([result.variables['n'] for result in results[1:]], [1, 2, 3, 4, 5])
+		self.assertTrue(all(result.status == 'done' for result in results))
+
+class TestProfiling(unittest.TestCase):
+
+	def setUp(self):
+		self.project = Project()
+		self.project.addGlobalVariable('x')
+		self.project.setGlobalVariable('x', 4)
+		self.executor = self.project.executor
+		self.sprite = makeSprite('Cat')
+		self.script = Script([greenFlag(), repeat(3, [setVariableTo('x', plus(sqrtOf(Variable('x')), plus(1, 1)))])], {}, self.sprite)
+		self.project.scripts.append(self.script)
+
+	def test_counts_and_attribution(self):
+		profiler = self.executor.enableProfiling()
+		self.executor.runScript(self.script)
+		totals = profiler.totals()
+		self.assertEqual({key[0] : record[0] for key, record in totals.items()}, {
+			'receiveGo' : 1, 'doRepeat' : 1, 'doSetVar' : 3, 'reportSum' : 6, 'reportMonadic:sqrt' : 3
+		})
+		doRepeat = totals[('doRepeat',)]
+		self.assertGreaterEqual(doRepeat[1], doRepeat[2])
+		self.assertEqual(list(profiler.totals('script')), [('Cat', 'receiveGo#0')])
+		# The nested reportSum is only counted once in cumulative time.
+		reportSum = totals[('reportSum',)]
+		self.assertLessEqual(reportSum[1], totals[('doSetVar',)][1])
+		self.assertEqual(profiler.top(1, sort='calls')[0][0], ('reportSum',))
+		self.assertIn('reportMonadic:sqrt', profiler.table())
+
+	def test_folded_stacks(self):
+		profiler = self.executor.enableProfiling()
+		profiler.clock = iter(range(0, 10 ** 9, 1000)).__next__
+		self.executor.runScript(self.script)
+		stacks = profiler.foldedStacks()
+		self.assertIn('Cat;receiveGo#0;doRepeat;doSetVar;reportSum;reportMonadic:sqrt 3', stacks)
+		for line in stacks:
+			frames, count = line.rsplit(' ', 1)
+			self.assertTrue(frames.startswith('Cat;receiveGo#0;'))
+			self.assertGreater(int(count), 0)
+
+	def test_disable(self):
+		self.executor.enableProfiling()
+		self.executor.disableProfiling()
+		self.assertNotIn('evaluate', vars(self.executor))
+		self.assertEqual(self.executor.evaluate(plus(1, 2)), 3)
+		self.assertEqual(self.executor.profiler, None)
+
+class TestBinaryCache(unittest.TestCase):
+
+	def test_roundtrip(self):
+		values = [
+			plus(1, 2.5),
+			Block('doSayFor', [None, True, False, 'caf\u00e9 \u2603', 10 ** 30, -2 ** 40, 2 ** 26, -2 ** 26, 1e300, 1.0, '1']),
+			Block('reportNewList', [[1, [2, 'a']], Option('o'), Variable('v')]),
+			Script([forLoop(Option('i'), 1, 3, [setVariableTo('x', 1)]), warp([])], {})
+		]
+		for value in values:
+			decoded = decodeValue(encodeValue(value))
+			self.assertEqual(blockToXML(decoded), blockToXML(value))
+		self.assertTrue(valuesEqual(decodeValue(encodeValue(values[1])), values[1]))
+
+	def test_deep_and_shared(self):
+		deep = Variable('x')
+		for i in range(sys.getrecursionlimit() * 5):
+			deep = plus(deep, i)
+		self.assertEqual(decodeValue(encodeValue(deep)), deep)
+
+		# Equal blocks decode to one object, but blocks holding lists are never shared.
+		decoded = decodeValue(encodeValue(Block('doSayFor', [plus(1, 2), plus(1, 2), Block('reportListLength', [[1]]), Block('reportListLength', [[1]])])))
+		self.assertIs(decoded.inputs[0], decoded.inputs[1])
+		self.assertIsNot(decoded.inputs[2], decoded.inputs[3])
+		self.assertIsNot(decoded.inputs[2].inputs[0], decoded.inputs[3].inputs[0])
+
+	def test_deep_chain_with_list(self):
+		# Each Block is looked up once, or a chain this deep takes minutes.
+		deep = Block('reportListLength', [[1, 2]])
+		for i in range(50000):
+			deep = plus(deep, 1)
+		decoded = decodeValue(encodeValue(deep))
+		self.assertEqual(decoded, deep)
+		self.assertEqual(decoded.inputs[0], deep.inputs[0])
+
+	def test_project_cache(self):
+		with tempfile.TemporaryDirectory() as directory:
+			cache = ProjectCache(directory)
+			for path in ['TestXMLs/variableblocks.xml', 'TestXMLs/hiddenTest.xml']:
+				loaded = Project.load(path)
+				cache.load(path)
+				cached = cache.load(path)
+				self.assertEqual([blockToXML(script) for script in cached.scripts], [blockToXML(script) for script in loaded.scripts])
+				self.assertEqual(cached.globalVariables, loaded.globalVariables)
+				self.assertEqual((cached.name, cached.notes), (loaded.name, loaded.notes))
+				self.assertEqual(list(cached.sprites), list(loaded.sprites))
+				for name, sprite in cached.sprites.items():
+					self.assertEqual((sprite.coords, sprite.color, sprite.variables), (loaded.sprites[name].coords, loaded.sprites[name].color, loaded.sprites[name].variables))
+					self.assertEqual([bytes(costume.image.span()) for costume in sprite.costumes],
+						[bytes(costume.image.span()) for costume in loaded.sprites[name].costumes])
+					self.assertTrue(all(script.sprite is sprite and script.scope is sprite.variables for script in sprite.scripts))
+			self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+			# A damaged entry is a miss, and is written again.
+			entry = os.path.join(directory, os.listdir(directory)[0])
+			with open(entry, 'wb') as entryFile:
+				entryFile.write(b'SNPB')
+			for path in ['TestXMLs/variableblocks.xml', 'TestXMLs/hiddenTest.xml']:
+				cache.load(path)
+			self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+			# So is one whose code words build something impossible, a dict keyed by a list.
+			encoder = BinaryEncoder()
+			encoder.codes.extend([LIST, 0, SMALL_INT | SMALL_INT_LIMIT << 4, DICT, 2])
+			with open(entry, 'wb') as entryFile:
+				entryFile.write(encoder.getvalue())
+			for path in ['TestXMLs/variableblocks.xml', 'TestXMLs/hiddenTest.xml']:
+				cache.load(path)
+			self.assertEqual((cache.hits, cache.misses), (4, 4))
+
+	def test_project_cache_interning(self):
+		with open('TestXMLs/hiddenTest.xml') as xmlFile:
+			parts = xmlFile.read().split('<scripts></scripts>')
+		go = '<script x="10" y="10"><block s="receiveGo"/><block s="forward"><l>10</l></block></script>'
+		parts[2] = f'<scripts>{go}<script x="10" y="90"><block s="turn"><l>15</l></block></script></scripts>' + parts[2]
+		parts[3] = f'<scripts>{go}</scripts>' + parts[3]
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'twoSprites.xml')
+			with open(path, 'w') as xmlFile:
+				xmlFile.write('<scripts></scripts>'.join(parts[:2]) + ''.join(parts[2:]))
+			loaded = Project.load(path)
+			cache = ProjectCache(directory)
+			for i in range(2):
+				table = NodeTable()
+				project = cache.load(path, table)
+				self.assertEqual([blockToXML(script) for script in project.scripts], [blockToXML(script) for script in loaded.scripts])
+				self.assertEqual([script.sprite.name for script in project.scripts], ['Sprite', 'Sprite', 'Sprite(2)'])
+				self.assertTrue(all(script is owned for script, owned in zip(project.scripts, project.sprites['Sprite'].scripts + project.sprites['Sprite(2)'].scripts)))
+				# The same script on both sprites is one interned block list.
+				self.assertIs(project.scripts[0].blocks[1], project.scripts[2].blocks[1])
+			self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+	def test_compare_results(self):
+		from benchmarkSuite import compareResults
+		def results(**seconds):
+			return {'results' : {name : {'seconds' : value} for name, value in seconds.items()}}
+		baseline = results(parse=1.0, serialize=1.0, evaluate=1.0, gone=1.0)
+		current = results(parse=1.3, serialize=0.7, evaluate=1.1, added=1.0)
+		self.assertEqual(compareResults(current, baseline, 0.25), {
+			'regressions' : ['parse'],
+			'improvements' : ['serialize'],
+			'unchanged' : ['evaluate'],
+			'new' : ['added'],
+			'missing' : ['gone']
+		})
+		self.assertEqual(compareResults(current, baseline, 0.5)['regressions'], [])
+
 
 if __name__ == '__main__':
 	unittest.main()